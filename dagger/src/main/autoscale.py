@@ -0,0 +1,129 @@
+"""Idle auto-stop and VM size recommendations from telemetry reports (see `telemetry.report`)
+
+Decisions are made only on telemetry that covers the whole period in question: a stopped collector or a broken RCON
+connection (no player counts) must not look like an empty server.
+"""
+
+import typing as tp
+
+import pydantic
+
+GB = 1024**3
+# Telemetry older than this is stale: the collector or the host is down
+_MAX_SAMPLE_AGE = 5 * 60
+# Share of lagging samples that asks for a bigger VM, and memory use that asks for more memory
+_LAG_FRACTION = 0.05
+_MEMORY_HIGH = 0.85
+# A smaller VM is recommended only with a large margin: Factorio CPU use grows with the map
+_DOWNSIZE_MARGIN = 0.5
+
+
+class VmSize(pydantic.BaseModel):
+    cores: int
+    memory_gb: int
+    preemptible: bool = False
+
+    @classmethod
+    def from_instance(cls, instance: dict[str, tp.Any]) -> 'VmSize':
+        """From `yc compute instance get --format=json` output"""
+        return cls(
+            cores=int(instance['resources']['cores']),
+            memory_gb=round(int(instance['resources']['memory']) / GB),
+            preemptible=bool(instance.get('scheduling_policy', {}).get('preemptible', False)),
+        )
+
+    def tf_vars(self) -> dict[str, str]:
+        """Variables of opentofu/variables.tf"""
+        return {
+            'TF_VAR_cores': str(self.cores),
+            'TF_VAR_memory': str(self.memory_gb),
+            'TF_VAR_preemptible': str(self.preemptible).lower(),
+        }
+
+
+class AutoscaleDecision(pydantic.BaseModel):
+    instance_status: str
+    current_size: tp.Optional[VmSize]
+    stop: bool = False
+    recommended_size: tp.Optional[VmSize] = None
+    reasons: list[str] = []
+    actions: list[str] = []
+
+
+def _metric(report: dict[str, tp.Any], name: str, stat: str) -> tp.Optional[float]:
+    summary = report['metrics'].get(name)
+    return summary[stat] if summary else None
+
+
+def _covers(report: dict[str, tp.Any], minutes: float, now: float) -> bool:
+    if not report['samples']:
+        return False
+    # One sampling interval of slack at the start of the window
+    return report['first_sample'] <= now - minutes * 60 + 60 and report['last_sample'] >= now - _MAX_SAMPLE_AGE
+
+
+def _measured(report: dict[str, tp.Any], name: str, minutes: float, now: float) -> bool:
+    """`name` was measured over the whole window, without gaps longer than stale telemetry"""
+    span = report.get('coverage', {}).get(name)
+    if not span:
+        return False
+    covered = span['first'] <= now - minutes * 60 + 60 and span['last'] >= now - _MAX_SAMPLE_AGE
+    return covered and span['max_gap'] <= _MAX_SAMPLE_AGE
+
+
+def decide_stop(decision: AutoscaleDecision, idle_report: dict[str, tp.Any], idle_minutes: float, now: float):
+    if not _covers(idle_report, idle_minutes, now):
+        decision.reasons.append(f'Telemetry does not cover the last {idle_minutes:g} minutes: not stopping')
+        return
+    if not _measured(idle_report, 'players', idle_minutes, now):
+        decision.reasons.append(f'Players were not counted over the last {idle_minutes:g} minutes: not stopping')
+        return
+    if _metric(idle_report, 'players', 'max') == 0:
+        decision.stop = True
+        decision.reasons.append(f'No players for {idle_minutes:g} minutes')
+
+
+def decide_size(
+    decision: AutoscaleDecision,
+    load_report: dict[str, tp.Any],
+    sizes: tp.Sequence[tuple[int, int]],
+    target_ups: float,
+    now: float,
+):
+    current = decision.current_size
+    if current is None or not _covers(load_report, load_report['window_minutes'], now):
+        return
+    players = _metric(load_report, 'players', 'max')
+    if players is None or players == 0:
+        return  # Nothing to learn about the load from an empty server or without player counts
+    lag = load_report['lag']['fraction']
+    ups = _metric(load_report, 'ups', 'p10')
+    memory = _metric(load_report, 'memory_bytes', 'p99')
+    cpu = _metric(load_report, 'cpu_percent', 'p99')
+    need_cores = lag is not None and lag > _LAG_FRACTION
+    need_memory = memory is not None and memory > _MEMORY_HIGH * current.memory_gb * GB
+    if need_cores or need_memory:
+        bigger = [
+            (cores, memory_gb)
+            for cores, memory_gb in sizes
+            if cores >= current.cores
+            and memory_gb >= current.memory_gb
+            and (cores > current.cores or not need_cores)
+            and (memory_gb > current.memory_gb or not need_memory)
+        ]
+        if need_cores:
+            decision.reasons.append(f'UPS below {target_ups:g} in {lag:.0%} of samples (p10 UPS {ups})')
+        if need_memory:
+            decision.reasons.append(f'Memory p99 {memory / GB:.1f} GB of {current.memory_gb} GB')
+        if not bigger:
+            decision.reasons.append('Already at the biggest size of HOST_SIZES')
+            return
+        cores, memory_gb = min(bigger)
+        decision.recommended_size = VmSize(cores=cores, memory_gb=memory_gb, preemptible=current.preemptible)
+        return
+    smaller = [(c, m) for c, m in sizes if (c, m) < (current.cores, current.memory_gb)]
+    if lag == 0 and smaller and cpu is not None and memory is not None:
+        cores, memory_gb = max(smaller)
+        if cpu < _DOWNSIZE_MARGIN * cores * 100 and memory < _DOWNSIZE_MARGIN * memory_gb * GB:
+            decision.recommended_size = VmSize(cores=cores, memory_gb=memory_gb, preemptible=current.preemptible)
+            decision.reasons.append(f'No lag, CPU p99 {cpu:.0f}% and memory p99 {memory / GB:.1f} GB fit a smaller VM')
@@ -0,0 +1,219 @@
+"""Deduplicated save backups in S3-compatible object storage
+
+Bucket layout:
+    chunks/<sha256>             content-defined chunks of save files (see `main.chunking`)
+    manifests/<sha256>.json     list of chunks of the save with this sha256
+    index.json                  all backed up saves, most recently seen last
+
+Saves are chunked as they are stored: zips whose members are compressed one by one. Unchanged members (scripts,
+preview, untouched `level.dat<N>` parts of the map) deduplicate, a changed member differs from the first change to
+its end. On a map that is being played most level parts change between autosaves, so expect savings of tens of
+percent rather than of an order of magnitude. A save recompressed before upload (see `main.recompress`) shares
+nothing with the original one. Restores must reproduce the exact file, so members are not decompressed for chunking.
+
+Only the `keep` saves seen most recently are kept: a backup that finds a known save moves it to the end of the index,
+so a current save that hasn't changed for a while stays. Older index entries, their manifests and chunks no other save
+uses are deleted after each backup.
+"""
+
+import asyncio
+import hashlib
+import typing as tp
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pydantic
+
+from main.chunking import iter_chunks
+from main.s3 import S3Bucket, S3Error
+
+INDEX_KEY = 'index.json'
+UPLOAD_CONCURRENCY = 8
+
+
+class SaveManifest(pydantic.BaseModel):
+    name: str
+    sha256: str
+    size: int
+    created_at: datetime
+    chunks: list[str]
+
+
+class BackupEntry(pydantic.BaseModel):
+    name: str
+    sha256: str
+    size: int
+    created_at: datetime
+    # Last backup that found the save unchanged; unset until one does
+    seen_at: tp.Optional[datetime] = None
+
+
+class BackupIndex(pydantic.BaseModel):
+    saves: list[BackupEntry] = []
+
+    def find(self, name: str = '', sha256: str = '') -> BackupEntry:
+        """Most recently seen backup matching `name` and/or `sha256` (of all if both are empty)"""
+        for entry in reversed(self.saves):
+            if (not name or entry.name == name) and (not sha256 or entry.sha256 == sha256):
+                return entry
+        raise LookupError(f'No backup found (name={name!r}, sha256={sha256!r})')
+
+
+class BackupReport(pydantic.BaseModel):
+    saves: int = 0
+    skipped_saves: int = 0
+    chunks: int = 0
+    uploaded_chunks: int = 0
+    bytes_total: int = 0
+    bytes_uploaded: int = 0
+    pruned_saves: int = 0
+    deleted_chunks: int = 0
+
+
+def _chunk_key(sha256: str) -> str:
+    return f'chunks/{sha256}'
+
+
+def _manifest_key(sha256: str) -> str:
+    return f'manifests/{sha256}.json'
+
+
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open('rb') as f:
+        while block := f.read(1 << 20):
+            h.update(block)
+    return h.hexdigest()
+
+
+async def load_index(bucket: S3Bucket) -> BackupIndex:
+    try:
+        return BackupIndex.model_validate_json(await asyncio.to_thread(bucket.get, INDEX_KEY))
+    except S3Error as e:
+        if e.status == 404:
+            return BackupIndex()
+        raise
+
+
+async def backup_files(bucket: S3Bucket, paths: tp.Iterable[Path], keep: int) -> BackupReport:
+    """Upload chunks which are not in the bucket yet, then manifests, then the index of the `keep` saves seen most
+    recently. Then delete what older saves used
+    """
+    if keep < 1:
+        raise ValueError(f'At least one backup must be kept, got keep={keep}')
+    report = BackupReport()
+    index = await load_index(bucket)
+    known_saves = {e.sha256: e for e in index.saves}
+    known_chunks = {k.removeprefix('chunks/') for k in await asyncio.to_thread(list, bucket.list_keys('chunks/'))}
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+    async def upload_chunk(sha256: str, data: bytes):
+        async with semaphore:
+            await asyncio.to_thread(bucket.put, _chunk_key(sha256), data, sha256)
+
+    for path in sorted(paths, key=lambda p: p.stat().st_mtime):
+        report.saves += 1
+        size = path.stat().st_size
+        report.bytes_total += size
+        sha256 = await asyncio.to_thread(_file_sha256, path)
+        if sha256 in known_saves:
+            report.skipped_saves += 1
+            entry = known_saves[sha256]
+            entry.seen_at = datetime.now(timezone.utc)
+            index.saves.remove(entry)
+            index.saves.append(entry)
+            continue
+
+        chunks: list[str] = []
+        uploads: list[asyncio.Task] = []
+        with path.open('rb') as f:
+            for data in iter_chunks(f):
+                chunk_sha256 = hashlib.sha256(data).hexdigest()
+                chunks.append(chunk_sha256)
+                report.chunks += 1
+                if chunk_sha256 in known_chunks:
+                    continue
+                known_chunks.add(chunk_sha256)
+                report.uploaded_chunks += 1
+                report.bytes_uploaded += len(data)
+                uploads.append(asyncio.ensure_future(upload_chunk(chunk_sha256, data)))
+                # Bound memory: don't read ahead more than one batch of in-flight chunks
+                if len(uploads) >= UPLOAD_CONCURRENCY:
+                    await asyncio.gather(*uploads)
+                    uploads.clear()
+        await asyncio.gather(*uploads)
+
+        entry = BackupEntry(name=path.name, sha256=sha256, size=size, created_at=datetime.now(timezone.utc))
+        manifest = SaveManifest(chunks=chunks, **entry.model_dump(exclude={'seen_at'}))
+        await asyncio.to_thread(bucket.put, _manifest_key(sha256), manifest.model_dump_json().encode())
+        index.saves.append(entry)
+        known_saves[sha256] = entry
+
+    report.pruned_saves = max(0, len(index.saves) - keep)
+    index.saves = index.saves[-keep:]
+    await asyncio.to_thread(bucket.put, INDEX_KEY, index.model_dump_json().encode())
+    await delete_unreferenced(bucket, index, report)
+    return report
+
+
+async def delete_unreferenced(bucket: S3Bucket, index: BackupIndex, report: BackupReport):
+    """Delete manifests and chunks no save of `index` uses. The index is written before: an interrupted backup leaves
+    only unreferenced objects, which the next one deletes
+    """
+    kept = {e.sha256 for e in index.saves}
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+    async def delete(key: str):
+        async with semaphore:
+            await asyncio.to_thread(bucket.delete, key)
+
+    async def load_manifest(sha256: str) -> SaveManifest:
+        async with semaphore:
+            return SaveManifest.model_validate_json(await asyncio.to_thread(bucket.get, _manifest_key(sha256)))
+
+    manifests = await asyncio.to_thread(list, bucket.list_keys('manifests/'))
+    await asyncio.gather(*(delete(k) for k in manifests if k not in {_manifest_key(sha256) for sha256 in kept}))
+    used: set[str] = set()
+    for manifest in await asyncio.gather(*(load_manifest(sha256) for sha256 in kept)):
+        used.update(manifest.chunks)
+    chunks = [
+        k for k in await asyncio.to_thread(list, bucket.list_keys('chunks/')) if k.removeprefix('chunks/') not in used
+    ]
+    await asyncio.gather(*(delete(k) for k in chunks))
+    report.deleted_chunks = len(chunks)
+
+
+async def restore_file(bucket: S3Bucket, entry: BackupEntry, out_path: Path):
+    """Stream chunks of the save into `out_path` verifying every chunk and the whole file.
+    A bounded window of chunks is prefetched concurrently, written strictly in order.
+    """
+    manifest = SaveManifest.model_validate_json(await asyncio.to_thread(bucket.get, _manifest_key(entry.sha256)))
+    pending = iter(manifest.chunks)
+    window: list[tuple[str, asyncio.Future]] = []
+
+    def prefetch():
+        for chunk_sha256 in pending:
+            future = asyncio.ensure_future(asyncio.to_thread(bucket.get, _chunk_key(chunk_sha256)))
+            window.append((chunk_sha256, future))
+            if len(window) >= UPLOAD_CONCURRENCY:
+                return
+
+    h = hashlib.sha256()
+    partial = out_path.with_name(out_path.name + '.part')
+    try:
+        with partial.open('wb') as out:
+            prefetch()
+            while window:
+                chunk_sha256, future = window.pop(0)
+                data = await future
+                if hashlib.sha256(data).hexdigest() != chunk_sha256:
+                    raise ValueError(f'Corrupted chunk {chunk_sha256} of save {entry.name}')
+                h.update(data)
+                out.write(data)
+                prefetch()
+    finally:
+        for _, future in window:
+            future.cancel()
+    if h.hexdigest() != manifest.sha256:
+        raise ValueError(f'Restored save {entry.name} does not match its checksum')
+    partial.rename(out_path)
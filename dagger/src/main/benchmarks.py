@@ -0,0 +1,143 @@
+"""Summaries of recorded spans for `benchmark-pipeline` and of Factorio `--benchmark` runs for `benchmark-save`"""
+
+import math
+import re
+import typing as tp
+
+import pydantic
+
+from main.tracing import Span
+
+
+class KindStats(pydantic.BaseModel):
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+
+
+class RunStats(pydantic.BaseModel):
+    name: str
+    wall_ms: float
+    spans: int
+    kinds: dict[str, KindStats]
+    cache: dict[str, int]
+    slowest: list[tuple[str, float]]
+
+
+class BenchmarkReport(pydantic.BaseModel):
+    runs: list[RunStats]
+
+
+def summarize_run(name: str, wall_ms: float, spans: tp.Sequence[Span], top: int = 5) -> RunStats:
+    kinds: dict[str, KindStats] = {}
+    cache: dict[str, int] = {}
+    for s in spans:
+        stats = kinds.setdefault(s.kind, KindStats())
+        stats.count += 1
+        stats.total_ms += s.duration_ms
+        stats.max_ms = max(stats.max_ms, s.duration_ms)
+        if s.kind == 'lookup':
+            status = s.attributes.get('cache', 'miss')
+            cache[status] = cache.get(status, 0) + 1
+    # Functions, steps and lookups contain other spans: only execs say where the time actually goes
+    leaves = [s for s in spans if s.kind == 'exec']
+    slowest = sorted(((s.name, round(s.duration_ms, 1)) for s in leaves), key=lambda x: -x[1])[:top]
+    return RunStats(name=name, wall_ms=round(wall_ms, 1), spans=len(spans), kinds=kinds, cache=cache, slowest=slowest)
+
+
+# Factorio simulates 60 ticks per second at most: a faster tick only leaves headroom
+GAME_UPS = 60
+
+
+class TickStats(pydantic.BaseModel):
+    ticks: int
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    ups: float  # estimated, capped by GAME_UPS
+    max_ups: float  # uncapped: how much headroom (or deficit) the hardware has
+
+
+class SaveBenchmark(pydantic.BaseModel):
+    save: str
+    image_tag: str
+    runs: list[TickStats]
+    total: TickStats
+    components_ms: dict[str, float]  # mean time per tick of each update phase, slowest first
+    # max_ups relative to the first benchmark of the report, unset when that one is too slow to measure
+    relative_ups: tp.Optional[float] = None
+
+
+class SaveBenchmarkReport(pydantic.BaseModel):
+    benchmarks: list[SaveBenchmark]
+
+
+def _percentile(values: list[float], p: float) -> float:
+    return values[min(len(values) - 1, max(0, math.ceil(p / 100 * len(values)) - 1))]
+
+
+def tick_stats(tick_ms: tp.Sequence[float]) -> TickStats:
+    values = sorted(tick_ms)
+    mean = sum(values) / len(values)
+    return TickStats(
+        ticks=len(values),
+        mean_ms=round(mean, 3),
+        p50_ms=round(_percentile(values, 50), 3),
+        p95_ms=round(_percentile(values, 95), 3),
+        p99_ms=round(_percentile(values, 99), 3),
+        max_ms=round(values[-1], 3),
+        ups=round(min(GAME_UPS, 1000 / mean), 1),
+        max_ups=round(1000 / mean, 1),
+    )
+
+
+def parse_factorio_benchmark(output: str) -> tuple[list[list[float]], dict[str, float]]:
+    """Per-tick `wholeUpdate` ms of each run and mean ms of every phase from `--benchmark-verbose all` output.
+
+    Each run prints a `tick,timestamp,wholeUpdate,...` header followed by `t<N>,<ns>,<ns>,...` lines
+    """
+    runs: list[list[float]] = []
+    totals: dict[str, float] = {}
+    columns: list[str] = []
+    ticks = 0
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith('tick,'):
+            columns = line.rstrip(',').split(',')
+            runs.append([])
+        elif columns and re.match(r't\d+,', line):
+            # Fields stay at the position of their column: an empty one has no value, not the next column's
+            fields = line.split(',')
+            row = {name: int(v) / 1e6 for name, v in zip(columns[1:], fields[1:]) if name and v}
+            if 'wholeUpdate' not in row:
+                raise ValueError(f'No wholeUpdate timing: {line}')
+            runs[-1].append(row['wholeUpdate'])
+            for name, ms in row.items():
+                if name not in ('timestamp', 'wholeUpdate'):
+                    totals[name] = totals.get(name, 0.0) + ms
+            ticks += 1
+    if not any(runs):
+        raise ValueError('No per-tick timings in Factorio output')
+    components = {name: round(total / ticks, 3) for name, total in totals.items()}
+    return runs, dict(sorted(components.items(), key=lambda item: -item[1]))
+
+
+def summarize_save_benchmark(save: str, image_tag: str, output: str) -> SaveBenchmark:
+    runs, components = parse_factorio_benchmark(output)
+    return SaveBenchmark(
+        save=save,
+        image_tag=image_tag,
+        runs=[tick_stats(run) for run in runs if run],
+        total=tick_stats([ms for run in runs for ms in run]),
+        components_ms=components,
+    )
+
+
+def compare_ups(report: SaveBenchmarkReport):
+    """Set `relative_ups` of every benchmark of the report against the first one"""
+    baseline = report.benchmarks[0].total.max_ups if report.benchmarks else 0.0
+    for benchmark in report.benchmarks:
+        # max_ups rounds to zero for ticks of more than 20 s
+        benchmark.relative_ups = round(benchmark.total.max_ups / baseline, 3) if baseline else None
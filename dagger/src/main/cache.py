@@ -0,0 +1,54 @@
+"""Per-invocation memoization of cloud lookups
+
+Every Dagger function call runs in a fresh module runtime process, so a module-level cache lives exactly as long as
+one call graph. Values are keyed by the config values they were resolved from, expire after a TTL and can be
+invalidated explicitly (e.g. after deleting the resource they describe).
+"""
+
+import asyncio
+import time
+import typing as tp
+
+from main.tracing import tracer
+
+T = tp.TypeVar('T')
+
+DEFAULT_TTL_SECONDS = 600.0
+
+
+class LookupCache:
+    def __init__(self, ttl: float = DEFAULT_TTL_SECONDS):
+        self.ttl = ttl
+        self._entries: dict[tuple, tuple[float, asyncio.Future]] = {}
+
+    async def get_or_resolve(
+        self, key: tuple, resolve: tp.Callable[[], tp.Awaitable[T]], ttl: tp.Optional[float] = None
+    ) -> T:
+        """Return cached value for `key` or resolve it once.
+
+        Concurrent callers with the same key share one in-flight resolution. Failed resolutions are not cached.
+        """
+        entry = self._entries.get(key)
+        fresh = entry is not None and entry[0] > time.monotonic()
+        status = ('hit' if entry[1].done() else 'in-flight') if entry is not None and fresh else 'miss'
+        with tracer.span(f'lookup {key[0]}', 'lookup', key=repr(key), cache=status):
+            if entry is None or not fresh:
+                # Created inside the span, so spans of the resolution are nested into it
+                entry = (time.monotonic() + (self.ttl if ttl is None else ttl), asyncio.ensure_future(resolve()))
+                self._entries[key] = entry
+            future = entry[1]
+            try:
+                # Shield: cancellation of one waiter must not cancel resolution shared with others
+                return await asyncio.shield(future)
+            except BaseException:
+                if future.done() and self._entries.get(key) is entry:
+                    del self._entries[key]
+                raise
+
+    def invalidate(self, *prefix: tp.Any):
+        """Drop all entries whose key starts with `prefix` (everything if `prefix` is empty)"""
+        for key in [k for k in self._entries if k[: len(prefix)] == prefix]:
+            del self._entries[key]
+
+
+lookup_cache = LookupCache()
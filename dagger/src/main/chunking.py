@@ -0,0 +1,68 @@
+"""Content-defined chunking
+
+Chunk boundaries depend only on nearby content, so a change in the middle of a file shifts boundaries only
+around the change and the rest of the chunks deduplicate against older versions.
+
+Pure Python rolling hash over every byte is too slow for saves of hundreds of MB, so candidates are found with
+C-speed `bytes.find` of a 2-byte anchor (~every 64 KiB in compressed data) and thinned out by a hash of the
+window preceding each candidate.
+"""
+
+import typing as tp
+import zlib
+
+MIN_CHUNK_SIZE = 256 * 1024
+AVG_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+
+_READ_SIZE = 8 * 1024 * 1024
+
+# Must never change: they define chunk boundaries of already stored backups
+_ANCHOR = b'\x9e\x37'
+_ANCHOR_BITS = 8 * len(_ANCHOR)
+_WINDOW = 48
+
+
+def _boundary_mask(avg_size: int) -> int:
+    return (1 << max(0, avg_size.bit_length() - 1 - _ANCHOR_BITS)) - 1
+
+
+def _cut_point(data: bytearray, min_size: int, max_size: int, mask: int) -> int:
+    size = len(data)
+    if size <= min_size:
+        return size
+    end = min(size, max_size)
+    with memoryview(data) as view:
+        i = data.find(_ANCHOR, min_size, end)
+        while i != -1:
+            cut = i + len(_ANCHOR)
+            if not zlib.crc32(view[max(0, cut - _WINDOW) : cut]) & mask:
+                return cut
+            i = data.find(_ANCHOR, i + 1, end)
+    return end
+
+
+def iter_chunks(
+    stream: tp.BinaryIO,
+    min_size: int = MIN_CHUNK_SIZE,
+    avg_size: int = AVG_CHUNK_SIZE,
+    max_size: int = MAX_CHUNK_SIZE,
+) -> tp.Iterator[bytes]:
+    """Split stream into chunks. Memory usage is bounded by max_size + read block size"""
+    if not (0 < min_size <= avg_size <= max_size):
+        raise ValueError(f'Invalid chunk sizes: {min_size}, {avg_size}, {max_size}')
+    mask = _boundary_mask(avg_size)
+    buffer = bytearray()
+    eof = False
+    while True:
+        while not eof and len(buffer) < max_size:
+            block = stream.read(_READ_SIZE)
+            if block:
+                buffer += block
+            else:
+                eof = True
+        if not buffer:
+            return
+        n = _cut_point(buffer, min_size, max_size, mask)
+        yield bytes(buffer[:n])
+        del buffer[:n]
@@ -1,9 +1,87 @@
 YC_FOLDER_NAME = 'factorio-server'
 YC_TOFU_BUCKET_NAME = 'tofu-state-47953'
 YC_ZONE = 'ru-central1-a'
+# Zones fleet servers may run in: the ones with a subnet number in opentofu/network.tf
+YC_ZONES = ['ru-central1-a', 'ru-central1-b', 'ru-central1-c', 'ru-central1-d']
 YC_SERVICE_ACCOUNT = 'factorio-sre'
 
 HOST_USERNAME = 'factorio-sre'
 HOST_INSTANCE_NAME = 'factorio-server'
+# VM sizes (cores, memory GB) `autoscale-server` steps through; the first one is the default of opentofu/variables.tf
+HOST_SIZES = [(2, 8), (4, 8), (4, 16), (8, 16), (8, 32)]
+HOST_IDLE_STOP_MINUTES = 30
+HOST_TARGET_UPS = 59
+# Servers of the fleet (see `FactorioServer.servers`) handled at once by fleet-* functions
+FLEET_CONCURRENCY = 4
 
 FACTORIO_IMAGE_TAG = 'stable-2.0.13'
+
+# Base image for all tool containers. A mutable tag: pin it by digest (ubuntu:noble@sha256:...) for reproducible
+# builds that resolve without network
+UBUNTU_IMAGE = 'ubuntu:noble'
+TOOLCHAIN_PACKAGES = ['ca-certificates', 'curl', 'unzip', 'openssh-client', 'rsync', 'python3']
+
+# Toolchain versions. Checksums of OpenTofu and cosign are taken from their (cached) published checksum files
+YC_CLI_VERSION = '0.138.0'
+OPEN_TOFU_VERSION = '1.8.5'
+COSIGN_VERSION = '2.4.1'
+# Yandex Cloud doesn't publish checksums for yc binaries: pin them here (by `dpkg --print-architecture`). Until then
+# `toolchain` verifies yc against the checksum of its first download and prints it. Update with YC_CLI_VERSION
+YC_CLI_SHA256: dict[str, str] = {
+    'amd64': '',
+    'arm64': '',
+}
+
+# Service account credentials are cached between runs (see credentials.py): keys are rotated after
+# YC_KEY_ROTATION_DAYS, replaced ones are deleted after YC_KEY_GRACE_HOURS
+YC_KEY_ROTATION_DAYS = 30
+YC_KEY_GRACE_HOURS = 24
+YC_TOKEN_REFRESH_MARGIN_MINUTES = 60
+
+TOFU_PLUGIN_CACHE_DIR = '/root/.cache/tofu-plugins'
+TOFU_PLAN_PATH = '/tmp/tofu.plan'
+
+# Server host layout (see opentofu/disk.tf and opentofu/vm.tf)
+FACTORIO_IMAGE = 'factoriotools/factorio'
+FACTORIO_UID = 845  # `factorio` user inside FACTORIO_IMAGE
+FACTORIO_BINARY = '/opt/factorio/bin/x64/factorio'  # inside FACTORIO_IMAGE
+# Mods shipped with the game: saves may depend on them without any mod files
+FACTORIO_BUILTIN_MODS = ['base', 'elevated-rails', 'quality', 'space-age']
+# Working directory of `benchmark-save` containers
+FACTORIO_BENCHMARK_DIR = '/tmp/benchmark'
+FACTORIO_DATA_DIR = '/factorio-data'
+FACTORIO_SAVES_DIR = f'{FACTORIO_DATA_DIR}/saves'
+# Mod zips and mod-list.json, `.manifest.json` with their sha256 is kept there by `sync-mods` (see mods.py)
+FACTORIO_MODS_DIR = f'{FACTORIO_DATA_DIR}/mods'
+# Content-addressed copies of uploaded saves: <sha256>.zip
+FACTORIO_SAVE_STORE_DIR = f'{FACTORIO_DATA_DIR}/save-store'
+FACTORIO_SAVE_STORE_KEEP = 5
+# Partially uploaded files, owned by HOST_USERNAME
+FACTORIO_UPLOAD_DIR = f'{FACTORIO_DATA_DIR}/.upload'
+# `docker save` tarballs of staged Factorio images, <tag>.tar with <tag>.tar.sha256 (see `stage-image`)
+FACTORIO_IMAGES_DIR = f'{FACTORIO_DATA_DIR}/images'
+FACTORIO_IMAGES_KEEP = 2
+# How long to wait for Factorio to load the map after its container is (re)started
+FACTORIO_READY_TIMEOUT = 300
+# RCON of factoriotools/factorio: enabled by default, password is generated on the first start
+FACTORIO_RCON_PORT = 27015
+FACTORIO_RCON_PASSWORD_FILE = f'{FACTORIO_DATA_DIR}/config/rconpw'
+# Telemetry collector on the host (see telemetry.py): scripts, log and hourly metric files
+FACTORIO_TELEMETRY_DIR = f'{FACTORIO_DATA_DIR}/telemetry'
+TELEMETRY_INTERVAL_SECONDS = 10
+TELEMETRY_RETENTION_DAYS = 14
+# Save staging (see `start-save-staging`): FACTORIO_SAVES_DIR is a tmpfs of this size, saves are flushed from it to
+# the data disk, which stays reachable at FACTORIO_SAVES_DISK_DIR. Scripts and flusher log are kept on the data disk
+FACTORIO_SAVE_STAGING_DIR = f'{FACTORIO_DATA_DIR}/save-staging'
+FACTORIO_SAVES_DISK_DIR = '/var/lib/factorio-saves-disk'
+SAVE_STAGING_TMPFS_MB = 2048
+SAVE_STAGING_FLUSH_SECONDS = 2
+# Parallel mod transfers of `sync-mods`: they share one SSH connection, so keep it below sshd MaxSessions (10)
+MOD_SYNC_PARALLELISM = 8
+
+# Deduplicated save backups (see backup.py). Name must be unique across the whole platform
+YC_BACKUP_BUCKET_NAME = 'factorio-backups-47953'
+YC_STORAGE_ENDPOINT = 'https://storage.yandexcloud.net'
+YC_STORAGE_REGION = 'ru-central1'
+# `backup-saves` deletes backups of all but the BACKUP_KEEP saves it saw most recently
+BACKUP_KEEP = 30
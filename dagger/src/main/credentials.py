@@ -0,0 +1,210 @@
+"""Cached service account credentials: IAM key, static access key and IAM token
+
+Stdlib only: the file is copied into the yc container and run as a script with a cache volume as `--state-dir`:
+
+    python3 credentials.py ensure --state-dir /credentials --service-account-id ID --output /run/credentials.json
+    python3 credentials.py prune --state-dir /credentials --service-account-id ID
+
+`ensure` reuses cached credentials while they are valid and writes them to `--output`. Keys older than
+`--rotate-after-days` are replaced; the token is refreshed `--token-margin-minutes` before it expires. Replaced keys
+are deleted `--grace-hours` later (running jobs may still use them) by the first `ensure` after that: no yc calls
+are made until then.
+`prune` deletes replaced keys after `--grace-hours` too (0: right away) and also looks for keys of the service account
+which no cache can use anymore (older than the rotation period plus grace).
+
+The state file is readable by root only: it holds the private IAM key and the secret of the access key.
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import typing as tp
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+SCRIPT_PATH = '/opt/credentials.py'
+STATE_DIR = '/var/lib/yc-credentials'
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def _yc(*args: str, env: tp.Optional[dict[str, str]] = None) -> tp.Any:
+    result = subprocess.run(['yc', *args, '--format=json'], capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(f'yc {" ".join(args)} failed: {result.stderr.strip()}')
+    return json.loads(result.stdout) if result.stdout.strip() else None
+
+
+class CredentialStore:
+    def __init__(self, state_dir: Path, service_account_id: str):
+        self.state_file = state_dir / 'credentials.json'
+        self.service_account_id = service_account_id
+        self.state: dict[str, tp.Any] = {}
+
+    def load(self):
+        state = json.loads(self.state_file.read_text()) if self.state_file.exists() else {}
+        if state.get('service_account_id') != self.service_account_id:
+            # Account was recreated or changed: keys of the old one are gone with it
+            state = {'service_account_id': self.service_account_id, 'superseded': []}
+        self.state = state
+
+    def save(self):
+        # mkstemp creates the file with mode 0600
+        fd, tmp = tempfile.mkstemp(dir=self.state_file.parent)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.state_file)
+
+    def _expired(self, entry: tp.Optional[dict], max_age: timedelta) -> bool:
+        return entry is None or _now() - _parse_time(entry['created_at']) > max_age
+
+    def _supersede(self, kind: str, entry: tp.Optional[dict]):
+        if entry is not None:
+            self.state['superseded'].append({'kind': kind, 'id': entry['id'], 'superseded_at': _now().isoformat()})
+
+    def _new_iam_key(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            key_file = Path(tmp) / 'key.json'
+            _yc('iam', 'key', 'create', '--service-account-id', self.service_account_id, '--output', str(key_file))
+            key = json.loads(key_file.read_text())
+        self._supersede('key', self.state.get('iam_key'))
+        self.state['iam_key'] = {'id': key['id'], 'created_at': _now().isoformat(), 'key': key}
+        self.state.pop('iam_token', None)
+
+    def _new_access_key(self):
+        created = _yc('iam', 'access-key', 'create', '--service-account-id', self.service_account_id)
+        self._supersede('access-key', self.state.get('access_key'))
+        self.state['access_key'] = {
+            'id': created['access_key']['id'],
+            'key_id': created['access_key']['key_id'],
+            'secret': created['secret'],
+            'created_at': _now().isoformat(),
+        }
+
+    def _new_token(self, lifetime: timedelta):
+        with tempfile.TemporaryDirectory() as home:
+            # Separate config: the caller's yc profile stays untouched
+            env = dict(os.environ, HOME=home)
+            key_file = Path(home) / 'key.json'
+            key_file.write_text(json.dumps(self.state['iam_key']['key']))
+            subprocess.run(['yc', 'config', 'set', 'service-account-key', str(key_file)], env=env, check=True)
+            token = _yc('iam', 'create-token', env=env)
+        expires_at = token.get('expires_at') or (_now() + lifetime).isoformat()
+        self.state['iam_token'] = {'value': token['iam_token'], 'expires_at': expires_at}
+
+    def ensure(self, rotate_after: timedelta, token_margin: timedelta, token_lifetime: timedelta) -> list[str]:
+        """Bring credentials up to date, returns what had to be (re)created"""
+        changes = []
+        if self._expired(self.state.get('iam_key'), rotate_after):
+            self._new_iam_key()
+            changes.append('iam key')
+        if self._expired(self.state.get('access_key'), rotate_after):
+            self._new_access_key()
+            changes.append('access key')
+        token = self.state.get('iam_token')
+        if token is None or _parse_time(token['expires_at']) - _now() < token_margin:
+            try:
+                self._new_token(token_lifetime)
+            except RuntimeError:
+                # Cached key could have been deleted outside of this cache: one retry with a new key
+                self._new_iam_key()
+                self._new_token(token_lifetime)
+                changes.append('iam key')
+            changes.append('iam token')
+        return changes
+
+    def delete_superseded(self, grace: timedelta) -> list[str]:
+        """Delete keys replaced more than `grace` ago. Failed deletions are retried by the next call"""
+        deleted = []
+        keep = []
+        for entry in self.state['superseded']:
+            if _now() - _parse_time(entry['superseded_at']) < grace:
+                keep.append(entry)
+                continue
+            try:
+                self._delete(entry['kind'], entry['id'])
+            except RuntimeError as e:
+                print(f'WARNING: {e}', file=sys.stderr)
+                keep.append(entry)
+                continue
+            deleted.append(f'{entry["kind"]} {entry["id"]}')
+        self.state['superseded'] = keep
+        return deleted
+
+    def prune(self, grace: timedelta, rotate_after: timedelta) -> list[str]:
+        """Delete superseded keys after `grace` and untracked ones no cache can still use"""
+        deleted = self.delete_superseded(grace)
+        in_use = {e['id'] for e in self.state['superseded']}
+        in_use |= {self.state[k]['id'] for k in ('iam_key', 'access_key') if k in self.state}
+        for kind, listed in (
+            ('key', _yc('iam', 'key', 'list', '--service-account-id', self.service_account_id)),
+            ('access-key', _yc('iam', 'access-key', 'list', '--service-account-id', self.service_account_id)),
+        ):
+            for key in listed or []:
+                if key['id'] not in in_use and _now() - _parse_time(key['created_at']) > rotate_after + grace:
+                    self._delete(kind, key['id'])
+                    deleted.append(f'{kind} {key["id"]}')
+        return deleted
+
+    def _delete(self, kind: str, key_id: str):
+        try:
+            _yc('iam', kind, 'delete', key_id)
+        except RuntimeError as e:
+            if 'not found' not in str(e).lower():
+                raise
+
+    def output(self) -> dict[str, tp.Any]:
+        return {
+            'iam_key': self.state['iam_key']['key'],
+            'access_key': {k: self.state['access_key'][k] for k in ('id', 'key_id', 'secret')},
+            'iam_token': self.state['iam_token']['value'],
+            'expires_at': self.state['iam_token']['expires_at'],
+        }
+
+
+def main(args: argparse.Namespace) -> int:
+    state_dir = Path(args.state_dir)
+    state_dir.mkdir(parents=True, exist_ok=True)
+    with open(state_dir / 'credentials.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        store = CredentialStore(state_dir, args.service_account_id)
+        store.load()
+        rotate_after = timedelta(days=args.rotate_after_days)
+        grace = timedelta(hours=args.grace_hours)
+        if args.command == 'ensure':
+            changes = store.ensure(
+                rotate_after, timedelta(minutes=args.token_margin_minutes), timedelta(hours=args.token_lifetime_hours)
+            )
+            store.save()
+            with open(os.open(args.output, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+                json.dump(store.output(), f)
+            print(f'Credentials: {", ".join(changes) or "all reused"}', file=sys.stderr)
+            deleted = store.delete_superseded(grace)
+        else:
+            deleted = store.prune(grace, rotate_after)
+        store.save()
+        print(f'Deleted keys: {", ".join(deleted) or "none"}', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['ensure', 'prune'])
+    parser.add_argument('--state-dir', required=True)
+    parser.add_argument('--service-account-id', required=True)
+    parser.add_argument('--output', default='/dev/stdout')
+    parser.add_argument('--rotate-after-days', type=float, default=30)
+    parser.add_argument('--token-margin-minutes', type=float, default=60)
+    parser.add_argument('--token-lifetime-hours', type=float, default=12)
+    parser.add_argument('--grace-hours', type=float, default=24)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,94 @@
+"""Fleet mode: several servers of one project, each its own instance and data disk (see opentofu/variables.tf)
+
+Operations run on hosts concurrently with a limit; a failed host doesn't stop the others.
+"""
+
+import asyncio
+import json
+import re
+import time
+import typing as tp
+
+import pydantic
+
+from main.autoscale import VmSize
+from main.config import YC_ZONES
+from main.tracing import tracer
+
+
+class FleetError(ValueError):
+    pass
+
+
+class ServerSpec(pydantic.BaseModel):
+    name: str
+    zone: tp.Optional[str] = None
+    image_tag: tp.Optional[str] = None
+    # Unset: keep the size of the existing instance (or the default of variables.tf for a new one)
+    cores: tp.Optional[int] = None
+    memory_gb: tp.Optional[int] = None
+    preemptible: tp.Optional[bool] = None
+
+
+class HostResult(pydantic.BaseModel):
+    host: str
+    ok: bool
+    seconds: float
+    result: tp.Optional[str] = None
+    error: tp.Optional[str] = None
+
+
+def parse_fleet(text: str) -> list[ServerSpec]:
+    """JSON list of server specs, e.g. `[{"name": "vanilla"}, {"name": "k2", "cores": 4, "memory_gb": 16}]`"""
+    try:
+        specs = pydantic.TypeAdapter(list[ServerSpec]).validate_json(text)
+    except pydantic.ValidationError as e:
+        raise FleetError(f'Invalid fleet: {e}') from None
+    names = [spec.name for spec in specs]
+    # Names go into instance and disk names of the cloud
+    invalid = [name for name in names if not re.fullmatch(r'[a-z][a-z0-9-]{0,57}[a-z0-9]', name)]
+    if invalid:
+        raise FleetError(f'Invalid server names (lowercase letters, digits and dashes): {", ".join(invalid)}')
+    duplicated = sorted({name for name in names if names.count(name) > 1})
+    if duplicated:
+        raise FleetError(f'Duplicated server names: {", ".join(duplicated)}')
+    zones = sorted({spec.zone for spec in specs if spec.zone is not None and spec.zone not in YC_ZONES})
+    if zones:
+        raise FleetError(f'Unknown zones: {", ".join(zones)} (known: {", ".join(YC_ZONES)})')
+    return specs
+
+
+def tf_servers(specs: tp.Sequence[ServerSpec], sizes: dict[str, VmSize]) -> str:
+    """`servers` variable of opentofu/variables.tf; unset sizes are taken from `sizes` of existing instances"""
+    servers = {}
+    for spec in specs:
+        size = sizes.get(spec.name)
+        server = {
+            'zone': spec.zone,
+            'image_tag': spec.image_tag,
+            'cores': spec.cores if spec.cores is not None else size and size.cores,
+            'memory': spec.memory_gb if spec.memory_gb is not None else size and size.memory_gb,
+            'preemptible': spec.preemptible if spec.preemptible is not None else size and size.preemptible,
+        }
+        servers[spec.name] = {k: v for k, v in server.items() if v is not None}
+    return json.dumps(servers)
+
+
+async def run_on_hosts(
+    hosts: tp.Sequence[str], concurrency: int, action: tp.Callable[[str], tp.Awaitable[tp.Any]]
+) -> list[HostResult]:
+    """`action(host)` on every host, at most `concurrency` at a time. Results are in the order of `hosts`"""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(host: str) -> HostResult:
+        async with semaphore:
+            started = time.monotonic()
+            with tracer.span(host, 'host'):
+                try:
+                    result = await action(host)
+                except Exception as e:
+                    return HostResult(host=host, ok=False, seconds=time.monotonic() - started, error=str(e))
+            value = result if result is None or isinstance(result, str) else str(result)
+            return HostResult(host=host, ok=True, seconds=time.monotonic() - started, result=value)
+
+    return list(await asyncio.gather(*(run(host) for host in hosts)))
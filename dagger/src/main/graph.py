@@ -0,0 +1,79 @@
+"""Minimal async dependency graph: run independent steps concurrently"""
+
+import asyncio
+import typing as tp
+from dataclasses import dataclass
+
+from main.tracing import tracer
+
+
+@dataclass
+class _Node:
+    name: str
+    fn: tp.Callable[..., tp.Awaitable[tp.Any]]
+    deps: tuple[str, ...]
+    estimate: float
+
+
+class TaskGraph:
+    """Steps are added in dependency order, so the graph can never contain a cycle.
+
+    Each step is called with results of its dependencies as keyword arguments.
+    `estimate` is the expected duration in seconds (cold cache) used only for dry-run reports.
+    """
+
+    def __init__(self):
+        self._nodes: dict[str, _Node] = {}
+
+    def add(
+        self,
+        name: str,
+        fn: tp.Callable[..., tp.Awaitable[tp.Any]],
+        deps: tp.Sequence[str] = (),
+        estimate: float = 1.0,
+    ) -> 'TaskGraph':
+        if name in self._nodes:
+            raise ValueError(f'Duplicated step: {name}')
+        unknown = [d for d in deps if d not in self._nodes]
+        if unknown:
+            raise ValueError(f'Step {name} depends on unknown steps: {unknown}')
+        self._nodes[name] = _Node(name=name, fn=fn, deps=tuple(deps), estimate=estimate)
+        return self
+
+    async def run(self) -> dict[str, tp.Any]:
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def run_node(node: _Node) -> tp.Any:
+            results = await asyncio.gather(*(tasks[d] for d in node.deps))
+            with tracer.span(node.name, 'step'):
+                return await node.fn(**dict(zip(node.deps, results)))
+
+        # Insertion order is a topological order: dependencies always have their tasks created first
+        for node in self._nodes.values():
+            tasks[node.name] = asyncio.ensure_future(run_node(node))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for t in tasks.values():
+                t.cancel()
+            raise
+        return {name: t.result() for name, t in tasks.items()}
+
+    def critical_path(self) -> tuple[list[str], float]:
+        """Longest chain of dependent steps by estimated duration"""
+        best: dict[str, tuple[float, list[str]]] = {}
+        for node in self._nodes.values():
+            before = max((best[d] for d in node.deps), key=lambda b: b[0], default=(0.0, []))
+            best[node.name] = (before[0] + node.estimate, before[1] + [node.name])
+        total, path = max(best.values(), key=lambda b: b[0], default=(0.0, []))
+        return path, total
+
+    def describe(self) -> str:
+        lines = ['Steps:']
+        for node in self._nodes.values():
+            deps = ', '.join(node.deps) or '-'
+            lines.append(f'  {node.name:<20} ~{node.estimate:>5.1f}s  after: {deps}')
+        path, total = self.critical_path()
+        serial = sum(n.estimate for n in self._nodes.values())
+        lines.append(f'Critical path (~{total:.1f}s, serial ~{serial:.1f}s): {" -> ".join(path)}')
+        return '\n'.join(lines)
@@ -1,22 +1,114 @@
+import dataclasses
 import json
+import re
+import shlex
+import sys
+import time
 import typing as tp
+import uuid
 from datetime import datetime
-from textwrap import dedent
+from functools import partial
+from pathlib import Path
 
 import dagger
 import pydantic
-from dagger import DaggerError, dag, enum_type, function, object_type
+from dagger import DaggerError, Doc, dag, enum_type, function, object_type
 
+from main import autoscale, credentials, fleet, rcon, recompress, saves, storage, telemetry
+from main import mods as mods_tool
+from main.backup import BackupIndex, backup_files, load_index, restore_file
+from main.benchmarks import (
+    BenchmarkReport,
+    SaveBenchmarkReport,
+    compare_ups,
+    summarize_run,
+    summarize_save_benchmark,
+)
+from main.cache import lookup_cache
 from main.config import (
+    BACKUP_KEEP,
+    COSIGN_VERSION,
+    FACTORIO_BENCHMARK_DIR,
+    FACTORIO_BINARY,
+    FACTORIO_BUILTIN_MODS,
+    FACTORIO_IMAGE,
     FACTORIO_IMAGE_TAG,
+    FLEET_CONCURRENCY,
+    HOST_IDLE_STOP_MINUTES,
     HOST_INSTANCE_NAME,
+    HOST_SIZES,
+    HOST_TARGET_UPS,
     HOST_USERNAME,
+    OPEN_TOFU_VERSION,
+    SAVE_STAGING_FLUSH_SECONDS,
+    SAVE_STAGING_TMPFS_MB,
+    TELEMETRY_INTERVAL_SECONDS,
+    TOFU_PLAN_PATH,
+    TOFU_PLUGIN_CACHE_DIR,
+    TOOLCHAIN_PACKAGES,
+    UBUNTU_IMAGE,
+    YC_BACKUP_BUCKET_NAME,
+    YC_CLI_SHA256,
+    YC_CLI_VERSION,
     YC_FOLDER_NAME,
+    YC_KEY_GRACE_HOURS,
+    YC_KEY_ROTATION_DAYS,
     YC_SERVICE_ACCOUNT,
+    YC_STORAGE_ENDPOINT,
+    YC_STORAGE_REGION,
     YC_TOFU_BUCKET_NAME,
+    YC_TOKEN_REFRESH_MARGIN_MINUTES,
     YC_ZONE,
 )
-from main.utils import add_env_variables, exec_bash, exec_bash_and_save_exit_code, install_packages
+from main.graph import TaskGraph
+from main.remote import (
+    LOG_OFFSETS_DIR,
+    MOD_CACHE_DIR,
+    MODS_TOOL_PATH,
+    RCON_CLIENT_PATH,
+    SAVE_STAGING_SCRIPT_PATH,
+    SSH_ENDPOINT_DIR,
+    SSH_HOST,
+    STORAGE_TOOL_PATH,
+    TELEMETRY_STAGING_DIR,
+    benchmark_disk_sh,
+    container_command_sh,
+    download_saves_sh,
+    install_save_sh,
+    metrics_report_sh,
+    on_host,
+    probe_ssh_sh,
+    rcon_sh,
+    save_staging_sh,
+    ssh_config,
+    stage_image_sh,
+    start_save_staging_sh,
+    start_telemetry_sh,
+    stop_save_staging_sh,
+    stop_telemetry_sh,
+    store_ssh_endpoint_sh,
+    sync_mods_sh,
+    tail_logs_sh,
+    telemetry_collector_sh,
+    upload_save_sh,
+    wait_image_sh,
+)
+from main.s3 import S3Bucket
+from main.simulation import SIMULATED_HOST, simulated_host, with_fake_cloud
+from main.tracing import instrumented, traced, tracer
+from main.utils import (
+    DOWNLOAD_CACHE_DIR,
+    FETCH_VERIFIED_SH,
+    add_env_variables,
+    exec_bash,
+    exec_bash_and_save_exit_code,
+    exec_stdout,
+    exec_sync,
+    export_to_runtime,
+    file_from_runtime,
+    install_packages,
+    runtime_tempdir,
+)
 
 
 @enum_type
@@ -26,6 +118,21 @@ class MachineCommand(dagger.Enum):
     RESTART = 'restart', 'Restart machine'
 
 
+@enum_type
+class ContainerCommand(dagger.Enum):
+    START = 'start', 'Start Factorio container and wait until the map is loaded'
+    STOP = 'stop', 'Stop Factorio container'
+    RESTART = 'restart', 'Restart Factorio container and wait until the map is loaded'
+
+
+@enum_type
+class SaveCompression(dagger.Enum):
+    NONE = 'none', 'Upload the save as is'
+    FAST = 'fast', 'Recompress with zlib level 1'
+    DEFAULT = 'default', 'Recompress with zlib level 6'
+    BEST = 'best', 'Recompress with zlib level 9: slowest, smallest'
+
+
 class YcFolderInfo(pydantic.BaseModel):
     id: str
     cloud_id: str
@@ -63,25 +170,121 @@ class YcServiceAccessAccountKey(pydantic.BaseModel):
         populate_by_name = True
 
 
+@dataclasses.dataclass(frozen=True)
+class ServiceCredentials:
+    """Service account credentials (see credentials.py) as secrets: they must not end up in container layers"""
+
+    iam_key: dagger.Secret  # Authorized key JSON for `yc config set service-account-key`
+    access_key: dagger.Secret  # YcServiceAccessAccountKey JSON
+    access_key_id: str
+    access_key_secret: dagger.Secret
+    iam_token: dagger.Secret
+
+    @classmethod
+    def from_output(cls, output: str) -> 'ServiceCredentials':
+        """From `credentials.py ensure` output"""
+        data = json.loads(output)
+        access_key = YcServiceAccessAccountKey.model_validate(data['access_key'])
+        return cls(
+            iam_key=dag.set_secret('yc-service-account-key', json.dumps(data['iam_key'])),
+            access_key=dag.set_secret('service-account-key', access_key.model_dump_json()),
+            access_key_id=access_key.key_id,
+            access_key_secret=dag.set_secret('service-account-key-secret', access_key.secret),
+            iam_token=dag.set_secret('yc-iam-token', data['iam_token']),
+        )
+
+
 @object_type
 class FactorioServer:
+    toolchain_tarball: tp.Annotated[
+        tp.Optional[dagger.File], Doc('Prebuilt toolchain image (see `export-toolchain`) for offline runs')
+    ] = None
+    simulate: tp.Annotated[bool, Doc('Use local fakes instead of Yandex Cloud, OpenTofu and the server host')] = False
+    cache_seed: tp.Annotated[str, Doc('Any new value invalidates Dagger layer caches of all tool containers')] = ''
+    trace_format: tp.Annotated[str, Doc('Dump spans of each call to stderr: "json" (JSON lines) or "otlp"')] = ''
+    host: tp.Annotated[str, Doc('Server to operate on: its instance name, one of `servers`')] = HOST_INSTANCE_NAME
+    servers: tp.Annotated[
+        str,
+        Doc(
+            'Fleet mode: JSON list of servers, each its own VM: [{"name", "zone", "image_tag", "cores", "memory_gb", '
+            '"preemptible"}], only name is required'
+        ),
+    ] = ''
+
+    def _cache_volume(self, name: str) -> dagger.CacheVolume:
+        """Cache volume with cloud-related state: simulation mode must never share it with real runs"""
+        return dag.cache_volume(f'{name}-simulated' if self.simulate else name)
+
+    def _host_volume(self, name: str) -> dagger.CacheVolume:
+        """Cache volume of `host`: the first server keeps the one it had before the fleet"""
+        return self._cache_volume(name if self.host == HOST_INSTANCE_NAME else f'{name}-{self.host}')
+
+    def _fleet(self) -> list[fleet.ServerSpec]:
+        try:
+            return fleet.parse_fleet(self.servers) if self.servers else [fleet.ServerSpec(name=HOST_INSTANCE_NAME)]
+        except fleet.FleetError as e:
+            raise DaggerError(str(e)) from None
+
+    def _image_tag(self) -> str:
+        """Factorio image of `host`: from its fleet spec, FACTORIO_IMAGE_TAG by default"""
+        spec = next((s for s in self._fleet() if s.name == self.host), None)
+        return spec.image_tag if spec is not None and spec.image_tag else FACTORIO_IMAGE_TAG
+
     @function
     def ubuntu_base(self) -> dagger.Container:
+        c = dag.container().from_(UBUNTU_IMAGE)
+        if self.cache_seed:
+            c = c.with_env_variable('CACHE_SEED', self.cache_seed)
+        return c.with_(install_packages(TOOLCHAIN_PACKAGES)).with_(add_env_variables(HOME='/root'))
+
+    @function
+    def toolchain(self) -> dagger.Container:
+        """All CLI tools in one image: yc, tofu, cosign, ssh. Pinned versions, verified checksums"""
+        if self.simulate:
+            return tp.cast(dagger.Container, self.ubuntu_base()).with_(with_fake_cloud(self.cache_seed))
+        if self.toolchain_tarball is not None:
+            return dag.container().import_(self.toolchain_tarball)
+        yc_sums = ' '.join(f'[{arch}]={s}' for arch, s in YC_CLI_SHA256.items())
+        base = tp.cast(dagger.Container, self.ubuntu_base())
         return (
-            dag.container()
-            .from_('ubuntu:noble')
-            .with_(install_packages(['curl']))
-            .with_(add_env_variables(HOME='/root'))
+            base.with_mounted_cache(DOWNLOAD_CACHE_DIR, dag.cache_volume('toolchain-downloads'))
+            .with_(
+                exec_bash(
+                    FETCH_VERIFIED_SH
+                    + f"""
+                ARCH="$(dpkg --print-architecture)"
+
+                declare -A YC_SHA256=({yc_sums})
+                mkdir -p /opt/yc/bin
+                fetch_verified "https://storage.yandexcloud.net/yandexcloud-yc/release/{YC_CLI_VERSION}/linux/${{ARCH}}/yc" "${{YC_SHA256[$ARCH]:-}}" /opt/yc/bin/yc
+                chmod +x /opt/yc/bin/yc
+
+                TOFU_RELEASE="https://github.com/opentofu/opentofu/releases/download/v{OPEN_TOFU_VERSION}"
+                TOFU_ZIP="tofu_{OPEN_TOFU_VERSION}_linux_${{ARCH}}.zip"
+                TOFU_SHA256="$(published_checksum "${{TOFU_RELEASE}}/tofu_{OPEN_TOFU_VERSION}_SHA256SUMS" "$TOFU_ZIP")"
+                fetch_verified "${{TOFU_RELEASE}}/${{TOFU_ZIP}}" "$TOFU_SHA256" /tmp/tofu.zip
+                unzip -o -q /tmp/tofu.zip tofu -d /usr/local/bin
+                rm -f /tmp/tofu.zip
+
+                COSIGN_RELEASE="https://github.com/sigstore/cosign/releases/download/v{COSIGN_VERSION}"
+                COSIGN_SHA256="$(published_checksum "${{COSIGN_RELEASE}}/cosign_checksums.txt" "cosign-linux-${{ARCH}}")"
+                fetch_verified "${{COSIGN_RELEASE}}/cosign-linux-${{ARCH}}" "$COSIGN_SHA256" /usr/local/bin/cosign
+                chmod +x /usr/local/bin/cosign
+            """  # noqa: E501
+                )
+            )
+            .without_mount(DOWNLOAD_CACHE_DIR)
+            .with_env_variable('PATH', '/opt/yc/bin:$PATH', expand=True)
         )
 
+    @function
+    def export_toolchain(self) -> dagger.File:
+        """Tarball of the toolchain image for offline runs: pass it back via `--toolchain-tarball`"""
+        return self.toolchain().as_tarball()
+
     @function
     def yandex_cloud_cli(self) -> dagger.Container:
-        base = tp.cast(dagger.Container, self.ubuntu_base())
-        return base.with_(
-            exec_bash("""
-                curl https://storage.yandexcloud.net/yandexcloud-yc/install.sh | bash -s -- -i /opt/yc -a
-            """)
-        ).with_env_variable('PATH', '/opt/yc/bin:$PATH', expand=True)
+        return self.toolchain()
 
     @function
     async def logged_yandex_cloud_cli(self) -> dagger.Container:
@@ -98,9 +301,12 @@ class FactorioServer:
 
     @function
     async def init_yc_folder(self) -> str:
+        return await lookup_cache.get_or_resolve(('yc-folder', YC_FOLDER_NAME), self._resolve_yc_folder)
+
+    async def _resolve_yc_folder(self) -> str:
         c = await self.logged_yandex_cloud_cli()
         folders = pydantic.TypeAdapter(list[YcFolderInfo]).validate_json(
-            await c.with_exec(['yc', 'resource-manager', 'folder', 'list', '--format=json']).stdout()
+            await exec_stdout(c, ['yc', 'resource-manager', 'folder', 'list', '--format=json'])
         )
         for f in folders:
             if f.name == YC_FOLDER_NAME:
@@ -108,7 +314,8 @@ class FactorioServer:
                 break
         else:
             target_folder = YcFolderInfo.model_validate_json(
-                await c.with_exec(
+                await exec_stdout(
+                    c,
                     [
                         'yc',
                         'resource-manager',
@@ -119,23 +326,29 @@ class FactorioServer:
                         '--description',
                         'Managed by: https://github.com/azorej/factorio-server/tree/main',
                         '--format=json',
-                    ]
-                ).stdout()
+                    ],
+                )
             )
 
         if target_folder.status != 'ACTIVE':
-            raise DaggerError(f'Folder {YC_FOLDER_NAME} in invalid state: {f.status}')
+            raise DaggerError(f'Folder {YC_FOLDER_NAME} in invalid state: {target_folder.status}')
 
         return target_folder.model_dump_json()
 
     @function
     async def init_yc_service_account(self) -> str:
+        return await lookup_cache.get_or_resolve(
+            ('yc-service-account', YC_FOLDER_NAME, YC_SERVICE_ACCOUNT), self._resolve_yc_service_account
+        )
+
+    async def _resolve_yc_service_account(self) -> str:
         c = await self.logged_yandex_cloud_cli()
         folder = YcFolderInfo.model_validate_json(await self.init_yc_folder())
         accounts = pydantic.TypeAdapter(list[YcServiceAccount]).validate_json(
-            await c.with_exec(
-                ['yc', 'iam', 'service-account', 'list', f'--folder-id={folder.id}', '--format=json']
-            ).stdout()
+            await exec_stdout(
+                c,
+                ['yc', 'iam', 'service-account', 'list', f'--folder-id={folder.id}', '--format=json'],
+            )
         )
         for a in accounts:
             if a.name == YC_SERVICE_ACCOUNT:
@@ -143,7 +356,8 @@ class FactorioServer:
                 break
         else:
             target_account = YcServiceAccount.model_validate_json(
-                await c.with_exec(
+                await exec_stdout(
+                    c,
                     [
                         'yc',
                         'iam',
@@ -153,11 +367,12 @@ class FactorioServer:
                         YC_SERVICE_ACCOUNT,
                         f'--folder-id={folder.id}',
                         '--format=json',
-                    ]
-                ).stdout()
+                    ],
+                )
             )
 
-        await c.with_exec(
+        await exec_sync(
+            c,
             [
                 'yc',
                 'resource-manager',
@@ -168,31 +383,84 @@ class FactorioServer:
                 f'role=editor,subject=serviceAccount:{target_account.id}',
                 '-y',
                 f'--folder-id={folder.id}',
-            ]
-        ).sync()
+            ],
+        )
 
         return target_account.model_dump_json()
 
+    async def _credentials_cli(self) -> dagger.Container:
+        return (
+            (await self.logged_yandex_cloud_cli())
+            .with_new_file(credentials.SCRIPT_PATH, Path(credentials.__file__).read_text())
+            .with_mounted_cache(
+                credentials.STATE_DIR, self._cache_volume('yc-credentials'), sharing=dagger.CacheSharingMode.LOCKED
+            )
+            .with_env_variable('CACHEBUSTER', str(datetime.now()))
+        )
+
+    async def service_credentials(self) -> ServiceCredentials:
+        """IAM key, access key and IAM token of the service account, reused between runs while valid"""
+        return await lookup_cache.get_or_resolve(
+            ('yc-credentials', YC_FOLDER_NAME, YC_SERVICE_ACCOUNT), self._resolve_service_credentials
+        )
+
+    async def _resolve_service_credentials(self, rotate: bool = False) -> ServiceCredentials:
+        account = YcServiceAccount.model_validate_json(await self.init_yc_service_account())
+        # Written to a directory of its own, not into the layers of the container, and read once
+        c = await exec_sync(
+            (await self._credentials_cli()).with_mounted_directory('/run/credentials', dag.directory()),
+            [
+                'python3',
+                credentials.SCRIPT_PATH,
+                'ensure',
+                f'--state-dir={credentials.STATE_DIR}',
+                f'--service-account-id={account.id}',
+                '--output=/run/credentials/credentials.json',
+                f'--rotate-after-days={0 if rotate else YC_KEY_ROTATION_DAYS}',
+                f'--token-margin-minutes={YC_TOKEN_REFRESH_MARGIN_MINUTES}',
+                f'--grace-hours={YC_KEY_GRACE_HOURS}',
+            ],
+        )
+        return ServiceCredentials.from_output(await c.file('/run/credentials/credentials.json').contents())
+
+    async def _prune_service_credentials(self, grace_hours: float):
+        account = YcServiceAccount.model_validate_json(await self.init_yc_service_account())
+        await exec_sync(
+            await self._credentials_cli(),
+            [
+                'python3',
+                credentials.SCRIPT_PATH,
+                'prune',
+                f'--state-dir={credentials.STATE_DIR}',
+                f'--service-account-id={account.id}',
+                f'--rotate-after-days={YC_KEY_ROTATION_DAYS}',
+                f'--grace-hours={grace_hours}',
+            ],
+        )
+
+    @function
+    @instrumented
+    async def rotate_yc_credentials(
+        self,
+        revoke_now: tp.Annotated[
+            bool, Doc('Delete the replaced keys right away (e.g. after a leak): jobs still using them fail')
+        ] = False,
+    ) -> str:
+        """Replace cached IAM and access keys now and delete keys no cache uses anymore. Replaced keys are deleted
+        after YC_KEY_GRACE_HOURS, or right away with `revoke_now`
+        """
+        await self._resolve_service_credentials(rotate=True)
+        await self._prune_service_credentials(grace_hours=0 if revoke_now else YC_KEY_GRACE_HOURS)
+        if revoke_now:
+            return 'Credentials rotated, replaced keys are deleted'
+        return f'Credentials rotated, replaced keys are deleted after {YC_KEY_GRACE_HOURS} hours'
+
     @function
     async def service_logged_yandex_cloud_cli(self) -> dagger.Container:
-        account_info = YcServiceAccount.model_validate_json(await self.init_yc_service_account())
         folder = YcFolderInfo.model_validate_json(await self.init_yc_folder())
+        creds = await self.service_credentials()
         c = await self.logged_yandex_cloud_cli()
-        return c.with_exec(
-            [
-                'yc',
-                'iam',
-                'key',
-                'create',
-                '--service-account-id',
-                account_info.id,
-                '--folder-name',
-                YC_FOLDER_NAME,
-                '--output',
-                '${HOME}/key.json',
-            ],
-            expand=True,
-        ).with_(
+        return c.with_mounted_secret('${HOME}/key.json', creds.iam_key, expand=True).with_(
             exec_bash(
                 f"""
                         yc config profile create tofu-sa
@@ -206,111 +474,143 @@ class FactorioServer:
 
     @function
     async def create_yc_service_account_access_key(self) -> dagger.Secret:
-        c = await self.logged_yandex_cloud_cli()
-        folder = YcFolderInfo.model_validate_json(await self.init_yc_folder())
-        account_info = YcServiceAccount.model_validate_json(await self.init_yc_service_account())
-        key = YcServiceAccessAccountKey.model_validate_json(
-            await c.with_exec(
-                [
-                    'yc',
-                    'iam',
-                    'access-key',
-                    'create',
-                    '--service-account-name',
-                    account_info.name,
-                    f'--folder-id={folder.id}',
-                    '--format=json',
-                ]
-            ).stdout()
-        )
-        return dag.set_secret('service-account-key', key.model_dump_json())
+        """Static access key of the service account (cached, see `service_credentials`)"""
+        return (await self.service_credentials()).access_key
 
     @function
     async def init_tofu_backend_storage(self) -> str:
+        return await lookup_cache.get_or_resolve(
+            ('yc-bucket', YC_FOLDER_NAME, YC_TOFU_BUCKET_NAME), partial(self._resolve_bucket, YC_TOFU_BUCKET_NAME)
+        )
+
+    @function
+    async def init_backup_storage(self) -> str:
+        return await lookup_cache.get_or_resolve(
+            ('yc-bucket', YC_FOLDER_NAME, YC_BACKUP_BUCKET_NAME), partial(self._resolve_bucket, YC_BACKUP_BUCKET_NAME)
+        )
+
+    async def _resolve_bucket(self, name: str) -> str:
         c = await self.logged_yandex_cloud_cli()
         folder = YcFolderInfo.model_validate_json(await self.init_yc_folder())
         buckets = pydantic.TypeAdapter(list[YcBucketInfo]).validate_json(
-            await c.with_exec(['yc', 'storage', 'bucket', 'list', '--folder-id', folder.id, '--format=json']).stdout()
+            await exec_stdout(c, ['yc', 'storage', 'bucket', 'list', '--folder-id', folder.id, '--format=json'])
         )
         for b in buckets:
-            if b.name == YC_TOFU_BUCKET_NAME:
+            if b.name == name:
                 target_bucket = b
                 break
         else:
             target_bucket = YcBucketInfo.model_validate_json(
-                await c.with_exec(
+                await exec_stdout(
+                    c,
                     [
                         'yc',
                         'storage',
                         'bucket',
                         'create',
-                        f'--name={YC_TOFU_BUCKET_NAME}',
+                        f'--name={name}',
                         '--default-storage-class=Standard',
                         '--max-size=0',
                         f'--folder-id={folder.id}',
                         '--format=json',
-                    ]
-                ).stdout()
+                    ],
+                )
             )
         return target_bucket.model_dump_json()
 
     @function
     async def open_tofu_cli(self) -> dagger.Container:
-        platform = (await dag.default_platform()).split('/')[1]
-        base = tp.cast(dagger.Container, self.ubuntu_base())
-        return base.with_(install_packages(['zip', 'wget'])).with_(
-            exec_bash(f"""
-                # https://docs.sigstore.dev/cosign/system_config/installation/#with-the-cosign-binary-or-rpmdpkg-package
-                curl -O -L "https://github.com/sigstore/cosign/releases/latest/download/cosign-linux-{platform}"
-                mv cosign-linux-{platform} /usr/local/bin/cosign
-                chmod +x /usr/local/bin/cosign
+        return self.toolchain()
+
+    def _tofu_bootstrap_graph(self) -> TaskGraph:
+        async def folder() -> YcFolderInfo:
+            return YcFolderInfo.model_validate_json(await self.init_yc_folder())
+
+        async def service_account(folder: YcFolderInfo) -> YcServiceAccount:
+            return YcServiceAccount.model_validate_json(await self.init_yc_service_account())
+
+        async def credentials(service_account: YcServiceAccount) -> ServiceCredentials:
+            return await self.service_credentials()
+
+        async def bucket(folder: YcFolderInfo) -> YcBucketInfo:
+            return YcBucketInfo.model_validate_json(await self.init_tofu_backend_storage())
 
-                # https://opentofu.org/docs/intro/install/standalone/
-                curl --proto '=https' --tlsv1.2 -fsSL https://get.opentofu.org/install-opentofu.sh -o install-opentofu.sh
-                chmod +x install-opentofu.sh
-                ./install-opentofu.sh --install-method standalone
-                rm -f install-opentofu.sh
-            """)  # noqa
+        async def tofu_image() -> dagger.Container:
+            # Force the build now so it overlaps with cloud bootstrap instead of running at `tofu init`
+            return await (await self.open_tofu_cli()).sync()
+
+        return (
+            TaskGraph()
+            .add('folder', folder, estimate=5)
+            .add('service_account', service_account, deps=['folder'], estimate=4)
+            .add('credentials', credentials, deps=['service_account'], estimate=1)
+            .add('bucket', bucket, deps=['folder'], estimate=3)
+            .add('tofu_image', tofu_image, estimate=30)
         )
 
     @function
-    async def logged_open_tofu_cli(self, open_tofu_dir: dagger.Directory) -> dagger.Container:
-        logged_yc = await self.service_logged_yandex_cloud_cli()
-        yc_token = json.loads(await logged_yc.with_exec(['yc', 'iam', 'create-token', '--format=json']).stdout())[
-            'iam_token'
-        ]
-        yc_cloud_id = await logged_yc.with_exec(['yc', 'config', 'get', 'cloud-id']).stdout()
-        yc_folder_id = YcFolderInfo.model_validate_json(await self.init_yc_folder()).id
-        yc_tofu_bucket = YcBucketInfo.model_validate_json(await self.init_tofu_backend_storage()).name
-        yc_service_key = YcServiceAccessAccountKey.model_validate_json(
-            await (await self.create_yc_service_account_access_key()).plaintext()
-        )
-        terraform_cache = dag.cache_volume('teraform-cache')
-        c = await self.open_tofu_cli()
+    def tofu_bootstrap_dry_run(self) -> str:
+        """Print bootstrap steps of `logged_open_tofu_cli` and its critical path without running anything"""
+        return self._tofu_bootstrap_graph().describe()
+
+    @function
+    @instrumented
+    async def logged_open_tofu_cli(
+        self,
+        open_tofu_dir: dagger.Directory,
+        cores: tp.Annotated[tp.Optional[int], Doc('VM cores (default: keep the size of the existing VM)')] = None,
+        memory_gb: tp.Annotated[tp.Optional[int], Doc('VM memory (default: keep the existing)')] = None,
+        preemptible: tp.Annotated[tp.Optional[bool], Doc('Preemptible VM (default: keep the existing)')] = None,
+        image_tag: tp.Annotated[
+            tp.Optional[str], Doc('Factorio image (default: FACTORIO_IMAGE_TAG or of the fleet spec)')
+        ] = None,
+    ) -> dagger.Container:
+        """OpenTofu with backend and credentials ready. Size and image arguments apply to `host`"""
+        steps = await self._tofu_bootstrap_graph().run()
+        server_vars = await self._tofu_server_vars(cores, memory_gb, preemptible, image_tag)
+        folder: YcFolderInfo = steps['folder']
+        service_credentials: ServiceCredentials = steps['credentials']
         c = (
-            c.with_(
+            tp.cast(dagger.Container, steps['tofu_image'])
+            .with_secret_variable('YC_TOKEN', service_credentials.iam_token)
+            # S3 backend credentials: passed via env, so they are not part of saved backend config
+            .with_env_variable('AWS_ACCESS_KEY_ID', service_credentials.access_key_id)
+            .with_secret_variable('AWS_SECRET_ACCESS_KEY', service_credentials.access_key_secret)
+            .with_(
                 add_env_variables(
-                    YC_TOKEN=yc_token,
-                    YC_CLOUD_ID=yc_cloud_id,
-                    YC_FOLDER_ID=yc_folder_id,
+                    YC_CLOUD_ID=folder.cloud_id,
+                    YC_FOLDER_ID=folder.id,
                     YC_ZONE=YC_ZONE,
-                    YC_TOFU_BUCKET=yc_tofu_bucket,
-                    ACCESS_KEY=yc_service_key.key_id,
-                    SECRET_KEY=yc_service_key.secret,
+                    YC_TOFU_BUCKET=steps['bucket'].name,
+                    TF_PLUGIN_CACHE_DIR=TOFU_PLUGIN_CACHE_DIR,
+                    TF_IN_AUTOMATION=1,
                     TF_VAR_zone=YC_ZONE,
                     TF_VAR_username=HOST_USERNAME,
                     TF_VAR_host_instance_name=HOST_INSTANCE_NAME,
-                    TF_VAR_factorio_image_tag=FACTORIO_IMAGE_TAG,
+                    **server_vars,
                 )
             )
             .with_mounted_directory('${HOME}/opentofu', open_tofu_dir, expand=True)
             .with_workdir('${HOME}/opentofu', expand=True)
-            .with_mounted_cache('${HOME}/opentofu/.terraform', terraform_cache, expand=True)
+            .with_mounted_cache(TOFU_PLUGIN_CACHE_DIR, dag.cache_volume('tofu-plugin-cache'))
+            .with_mounted_cache('${HOME}/opentofu/.terraform', self._cache_volume('teraform-cache'), expand=True)
             .with_(
                 exec_bash(
                     """
                         cd ${HOME}/opentofu
-                        tofu init -reconfigure -backend-config="bucket=${YC_TOFU_BUCKET}" -backend-config="region=${YC_ZONE}" -backend-config="access_key=${ACCESS_KEY}" -backend-config="secret_key=${SECRET_KEY}"
+                        # Reuse lock file from previous runs unless the project has its own
+                        if [ ! -f .terraform.lock.hcl ] && [ -f .terraform/lock.hcl ]; then
+                            cp .terraform/lock.hcl .terraform.lock.hcl
+                        fi
+                        FINGERPRINT="$( (cat *.tf .terraform.lock.hcl 2>/dev/null; echo "${YC_TOFU_BUCKET} ${YC_ZONE}") | sha256sum)"
+                        if [ "$(cat .terraform/init-fingerprint 2>/dev/null)" != "$FINGERPRINT" ]; then
+                            tofu init -reconfigure -input=false -backend-config="bucket=${YC_TOFU_BUCKET}" -backend-config="region=${YC_ZONE}"
+                            cp .terraform.lock.hcl .terraform/lock.hcl
+                            FINGERPRINT="$( (cat *.tf .terraform.lock.hcl; echo "${YC_TOFU_BUCKET} ${YC_ZONE}") | sha256sum)"
+                            echo "$FINGERPRINT" > .terraform/init-fingerprint
+                        else
+                            echo "Nothing changed since last 'tofu init': skipping it"
+                        fi
                     """,  # noqa: E501
                     expand=True,
                 )
@@ -318,13 +618,66 @@ class FactorioServer:
         )
         return c
 
+    async def _tofu_server_vars(
+        self,
+        cores: tp.Optional[int],
+        memory_gb: tp.Optional[int],
+        preemptible: tp.Optional[bool],
+        image_tag: tp.Optional[str],
+    ) -> dict[str, str]:
+        # Size of a live VM is only changed on request (see `resize-server`): plain applies keep it
+        if self.servers:
+            specs = self._fleet()
+            overrides = {'cores': cores, 'memory_gb': memory_gb, 'preemptible': preemptible, 'image_tag': image_tag}
+            overrides = {k: v for k, v in overrides.items() if v is not None}
+            if overrides and self.host not in [spec.name for spec in specs]:
+                raise DaggerError(f'Server {self.host} is not in the fleet')
+            specs = [spec.model_copy(update=overrides) if spec.name == self.host else spec for spec in specs]
+            instances = await lookup_cache.get_or_resolve(('server-instances',), self._server_instances)
+            sizes = {i['name']: autoscale.VmSize.from_instance(i) for i in instances}
+            # Default of servers without their own image_tag: the variable has no default in variables.tf
+            return {'TF_VAR_servers': fleet.tf_servers(specs, sizes), 'TF_VAR_factorio_image_tag': FACTORIO_IMAGE_TAG}
+        size = await self._vm_size()
+        server_vars = size.tf_vars() if size is not None else {}
+        overrides = {'TF_VAR_cores': cores, 'TF_VAR_memory': memory_gb, 'TF_VAR_preemptible': preemptible}
+        server_vars.update({k: str(v).lower() for k, v in overrides.items() if v is not None})
+        server_vars['TF_VAR_factorio_image_tag'] = image_tag or FACTORIO_IMAGE_TAG
+        return server_vars
+
+    @function
+    @instrumented
+    async def plan_tofu(self, open_tofu_dir: dagger.Directory) -> dagger.File:
+        """Binary plan for `apply-tofu --plan` / `force-apply-tofu --plan`.
+        Keep it private: plan contains sensitive values (e.g. generated SSH key)
+        """
+        return (
+            (await self.logged_open_tofu_cli(open_tofu_dir=open_tofu_dir))
+            .with_env_variable('CACHEBUSTER', str(datetime.now()))
+            .with_exec(['tofu', 'plan', '-input=false', f'-out={TOFU_PLAN_PATH}'])
+            .file(TOFU_PLAN_PATH)
+        )
+
+    async def _apply_saved_plan(self, open_tofu_dir: dagger.Directory, plan: dagger.File):
+        await exec_sync(
+            (await self.logged_open_tofu_cli(open_tofu_dir=open_tofu_dir))
+            .with_file(TOFU_PLAN_PATH, plan)
+            .with_env_variable('CACHEBUSTER', str(datetime.now())),
+            ['tofu', 'apply', '-input=false', TOFU_PLAN_PATH],
+        )
+
     @function
-    async def apply_tofu(self, open_tofu_dir: dagger.Directory):
+    @instrumented
+    async def apply_tofu(self, open_tofu_dir: dagger.Directory, plan: tp.Optional[dagger.File] = None):
+        if plan is not None:
+            return await self._apply_saved_plan(open_tofu_dir, plan)
         await (await self.logged_open_tofu_cli(open_tofu_dir=open_tofu_dir)).terminal(cmd=['tofu', 'apply']).sync()
 
     @function
-    async def force_apply_tofu(self, open_tofu_dir: dagger.Directory):
-        await (
+    @instrumented
+    async def force_apply_tofu(self, open_tofu_dir: dagger.Directory, plan: tp.Optional[dagger.File] = None):
+        if plan is not None:
+            return await self._apply_saved_plan(open_tofu_dir, plan)
+        await traced(
             (await self.logged_open_tofu_cli(open_tofu_dir=open_tofu_dir))
             .with_env_variable('CACHEBUSTER', str(datetime.now()))
             .with_(
@@ -336,10 +689,12 @@ class FactorioServer:
                     expand=True,
                 )
             )
-            .sync()
+            .sync(),
+            'tofu apply',
         )
 
     @function
+    @instrumented
     async def export_ssh_keys(self, open_tofu_dir: dagger.Directory) -> dagger.Directory:
         c = await self.logged_open_tofu_cli(open_tofu_dir=open_tofu_dir)
         return c.with_(
@@ -355,110 +710,739 @@ class FactorioServer:
             )
         ).directory('${HOME}/.ssh', expand=True)
 
+    async def _server_instances(self) -> list[dict[str, tp.Any]]:
+        folder = YcFolderInfo.model_validate_json(await self.init_yc_folder())
+        instances = json.loads(
+            await exec_stdout(
+                (await self.logged_yandex_cloud_cli()).with_env_variable('CACHEBUSTER', str(datetime.now())),
+                ['yc', 'compute', 'instance', 'list', f'--folder-id={folder.id}', '--format=json'],
+            )
+        )
+        return instances
+
+    async def _server_instance(self) -> tp.Optional[dict[str, tp.Any]]:
+        instances = await lookup_cache.get_or_resolve(('server-instances',), self._server_instances)
+        return next((i for i in instances if i['name'] == self.host), None)
+
+    async def _vm_size(self) -> tp.Optional[autoscale.VmSize]:
+        instance = await self._server_instance()
+        return autoscale.VmSize.from_instance(instance) if instance is not None else None
+
     @function
+    @instrumented
     async def resolve_public_ip(self) -> str:
         folder = YcFolderInfo.model_validate_json(await self.init_yc_folder())
         return json.loads(
-            await (await self.logged_yandex_cloud_cli())
-            .with_env_variable('CACHEBUSTER', str(datetime.now()))
-            .with_exec(
+            await exec_stdout(
+                (await self.logged_yandex_cloud_cli()).with_env_variable('CACHEBUSTER', str(datetime.now())),
                 [
                     'yc',
                     'compute',
                     'instance',
                     'get',
                     f'--folder-id={folder.id}',
-                    f'--name={HOST_INSTANCE_NAME}',
+                    f'--name={self.host}',
                     '--format=json',
-                ]
+                ],
             )
-            .stdout()
         )['network_interfaces'][0]['primary_v4_address']['one_to_one_nat']['address']
 
+    async def _probe_ssh(self, c: dagger.Container) -> str:
+        probe = c.with_env_variable('CACHEBUSTER', str(datetime.now())).with_(
+            exec_bash(probe_ssh_sh('/tmp/ssh-status'))
+        )
+        return (await traced(probe.file('/tmp/ssh-status').contents(), 'ssh probe')).strip()
+
+    async def _store_ssh_endpoint(self, c: dagger.Container, ip: str, keys: tp.Optional[dagger.Directory] = None):
+        if keys is not None:
+            c = c.with_mounted_directory('/tmp/ssh-keys', keys)
+        script = store_ssh_endpoint_sh(ip, '/tmp/ssh-keys' if keys is not None else '')
+        await c.with_env_variable('CACHEBUSTER', str(datetime.now())).with_(exec_bash(script)).sync()
+
     @function
+    @instrumented
     async def ssh_container(self, open_tofu_dir: dagger.Directory) -> dagger.Container:
-        ip = await self.resolve_public_ip()
-        keys = await self.export_ssh_keys(open_tofu_dir=open_tofu_dir)
-        return (
-            self.ubuntu_base()
-            .with_(install_packages(['openssh-client']))
-            .with_mounted_directory('${HOME}/.ssh', keys, expand=True)
-            .with_new_file(
-                '${HOME}/.ssh/config',
-                dedent(f"""Host factorio-server
-                    HostName {ip}
-                    User {HOST_USERNAME}
-                """),
-                expand=True,
-            )
+        """Toolchain with `ssh factorio-server` configured. Address and keys are cached between calls and looked up
+        again (cheapest first) only when the cached ones stop working"""
+        c = (
+            self.toolchain()
+            .with_mounted_cache(SSH_ENDPOINT_DIR, self._host_volume('ssh-endpoint'))
+            .with_new_file('${HOME}/.ssh/config', ssh_config(), expand=True)
+            .with_new_file(RCON_CLIENT_PATH, Path(rcon.__file__).read_text())
         )
+        if self.simulate:
+            c = c.with_service_binding(SIMULATED_HOST, simulated_host(self.ubuntu_base(), self.cache_seed))
+        status = await self._probe_ssh(c)
+        ip = None
+        if status == 'failed':
+            # Usually the VM got a new public address after a stop
+            ip = await self.resolve_public_ip()
+            await self._store_ssh_endpoint(c, ip)
+            status = await self._probe_ssh(c)
+        if status != 'ok':
+            ip = ip or await self.resolve_public_ip()
+            await self._store_ssh_endpoint(c, ip, await self.export_ssh_keys(open_tofu_dir=open_tofu_dir))
+            if await self._probe_ssh(c) != 'ok':
+                raise DaggerError(f'Server {self.host} is unreachable over SSH at {ip}')
+        return c
 
     @function
+    @instrumented
     async def open_ssh(self, open_tofu_dir: dagger.Directory):
-        await (
-            (await self.ssh_container(open_tofu_dir=open_tofu_dir))
-            .terminal(cmd=['ssh', '-o', 'StrictHostKeyChecking=no', 'factorio-server'])
-            .sync()
+        await (await self.ssh_container(open_tofu_dir=open_tofu_dir)).terminal(cmd=['ssh', SSH_HOST]).sync()
+
+    async def _inspect_save(self, save: dagger.File, image_tag: str = FACTORIO_IMAGE_TAG) -> saves.SaveInfo:
+        path = await traced(export_to_runtime(save, await save.name()), 'export save')
+        try:
+            info = saves.inspect_save(path)
+            saves.check_compatible(info, saves.image_tag_version(image_tag))
+        except saves.SaveFormatError as e:
+            raise DaggerError(str(e)) from None
+        finally:
+            path.unlink()
+        return info
+
+    @function
+    @instrumented
+    async def inspect_save(self, save: dagger.File) -> str:
+        """Version, mods and sizes of a save; fails if it is broken or too new for the server"""
+        return (await self._inspect_save(save, self._image_tag())).model_dump_json()
+
+    async def _recompress_save(self, save: dagger.File, level: SaveCompression) -> dagger.File:
+        src = await traced(export_to_runtime(save, await save.name()), 'export save')
+        dst = runtime_tempdir() / src.name
+        try:
+            report = await traced(recompress.recompress_save(src, dst, str(level)), 'recompress save', level=str(level))
+        except recompress.RecompressError as e:
+            raise DaggerError(str(e)) from None
+        finally:
+            src.unlink()
+        print(
+            f'Recompressed {src.name}: {report.original_size} -> {report.size} bytes in '
+            f'{report.compress_seconds + report.verify_seconds:.1f}s with {report.workers} workers '
+            f'(pays off on uplinks below {report.break_even_mbit:.0f} Mbit/s)',
+            file=sys.stderr,
         )
+        return file_from_runtime(dst)
+
+    @function
+    @instrumented
+    async def recompress_save(self, save: dagger.File, level: SaveCompression = SaveCompression.DEFAULT) -> dagger.File:
+        """Recompress save members in parallel. Contents are verified to be byte-identical to the source"""
+        return await self._recompress_save(save, level)
 
     @function
-    async def upload_save(self, open_tofu_dir: dagger.Directory, save: dagger.File):
+    @instrumented
+    async def upload_save(
+        self,
+        open_tofu_dir: dagger.Directory,
+        save: dagger.File,
+        restart_machine: tp.Annotated[bool, Doc('Reboot the VM instead of restarting only the container')] = False,
+        compression: tp.Annotated[SaveCompression, Doc('Recompress the save before transfer')] = SaveCompression.NONE,
+    ):
         """In case of devcontainer you need to copy save from host system to container fs
         You can do it like this (from host system):
         > CONTAINER_ID=$(docker ps --format 'table {{.ID}}\t{{.Image}}' | awk '{ if ($2~/^vsc-factorio-server.*/) print $1 }'); docker cp ${PATH_TO_SAVE} "${CONTAINER_ID}:/save.zip"
         """  # noqa: E501
-        # TODO:
-        # 1. Remove magic literals: 845 (factorio docker user), paths
-        # 2. Think how to restart Docker (without restarting machine)
-        # 3. Think how to upload saves from host machine more easily
+        # TODO: Think how to upload saves from host machine more easily
+        # Pre-flight: a bad save would be found only after the server is stopped and restarted
+        await self._inspect_save(save, self._image_tag())
+        if compression != SaveCompression.NONE:
+            save = await self._recompress_save(save, compression)
         c = await self.ssh_container(open_tofu_dir=open_tofu_dir)
-        await (
+        save_name = shlex.quote(await save.name())
+        await traced(
             c.with_file('/save.zip', save)
+            .with_env_variable('CACHEBUSTER', str(datetime.now()))
             .with_(
                 exec_bash(
-                    """
-                        #!bash
-                        scp -o StrictHostKeyChecking=no /save.zip factorio-server:/home/factorio-sre/original.zip
-                        ssh -o StrictHostKeyChecking=no factorio-server <<-'ENDSSH'
-                            #!/usr/bin/env bash
-                            set -xeuo pipefail
-                            CONTAINER_ID="$(docker ps --format "table {{.ID}}" | tail -n +2)"
-                            if [ -n "$CONTAINER_ID" ]; then
-                                docker container stop "$CONTAINER_ID"
-                            fi
-                            sudo rm -f /factorio-data/saves/*
-                            sudo mv /home/factorio-sre/original.zip /factorio-data/saves
-                            sudo chown -R 845:845 /factorio-data
-                        ENDSSH
-                    """,  # noqa: E501
-                ),
+                    upload_save_sh('/save.zip')
+                    # No `/quit` over RCON: the container restarts on exit (`restartPolicy: Always`) and would load
+                    # the old save. `docker stop` of install_save_sh sends SIGTERM, on which Factorio exits cleanly
+                    + on_host(install_save_sh(start=not restart_machine), '"$SAVE_SHA256"', save_name)
+                )
             )
-            .sync()
+            .sync(),
+            'upload save',
         )
-        await self.command_server_machine(MachineCommand.RESTART)
+        if restart_machine:
+            await self.command_server_machine(MachineCommand.RESTART)
 
     @function
-    async def command_server_machine(self, command: MachineCommand):
-        folder = YcFolderInfo.model_validate_json(await self.init_yc_folder())
-        (
-            await (await self.logged_yandex_cloud_cli())
+    @instrumented
+    async def command_server_container(self, open_tofu_dir: dagger.Directory, command: ContainerCommand):
+        """Start/stop/restart only Factorio container over SSH: seconds instead of minutes of VM reboot"""
+        await traced(
+            (await self.ssh_container(open_tofu_dir=open_tofu_dir))
             .with_env_variable('CACHEBUSTER', str(datetime.now()))
-            .with_exec(
-                ['yc', 'compute', 'instance', str(command), f'--folder-id={folder.id}', f'--name={HOST_INSTANCE_NAME}']
+            .with_(exec_bash(on_host(container_command_sh(str(command)))))
+            .sync(),
+            f'container {command}',
+        )
+
+    @function
+    @instrumented
+    async def sync_mods(
+        self,
+        open_tofu_dir: dagger.Directory,
+        mods: tp.Annotated[tp.Optional[dagger.Directory], Doc('Mod zips, with mod-list.json if it has one')] = None,
+        mod_list: tp.Annotated[
+            tp.Optional[dagger.File], Doc('mod-list.json: enabled mods missing in `mods` come from the mod portal')
+        ] = None,
+        portal_username: tp.Annotated[tp.Optional[str], Doc('Mod portal account (see player-data.json)')] = None,
+        portal_token: tp.Annotated[tp.Optional[dagger.Secret], Doc('`service-token` of player-data.json')] = None,
+        prune: tp.Annotated[bool, Doc('Delete mods of the server missing in `mods`/`mod_list`')] = True,
+        restart: tp.Annotated[bool, Doc('Restart the Factorio container if mods changed')] = True,
+    ):
+        """Make server mods match the given ones. Mods are kept in a local content-addressed cache and only files
+        missing on the server (by sha256 manifest) are transferred, in parallel over one SSH connection
+        """
+        if mods is None and mod_list is None:
+            raise DaggerError('Either mods or mod_list is required')
+        if mod_list is None and 'mod-list.json' in await mods.entries():
+            mod_list = mods.file('mod-list.json')
+        c = (
+            (await self.ssh_container(open_tofu_dir=open_tofu_dir))
+            .with_new_file(MODS_TOOL_PATH, Path(mods_tool.__file__).read_text())
+            .with_mounted_cache(MOD_CACHE_DIR, self._cache_volume('mod-cache'))
+        )
+        stage = ['python3', MODS_TOOL_PATH, 'stage', '--cache', MOD_CACHE_DIR, '--output', '/tmp/mods.json']
+        if mods is not None:
+            c = c.with_mounted_directory('/tmp/mods-input', mods)
+            stage += ['--input', '/tmp/mods-input']
+        if mod_list is not None:
+            c = c.with_file('/tmp/mod-list.json', mod_list)
+            version = saves.image_tag_version(self._image_tag())
+            stage += ['--mod-list', '/tmp/mod-list.json', '--builtin-mods', *FACTORIO_BUILTIN_MODS]
+            stage += ['--factorio-version', '.'.join(map(str, version[:2]))] if version else []
+        if portal_username is not None and portal_token is not None:
+            c = c.with_mounted_secret('/run/secrets/mod-portal-token', portal_token)
+            stage += ['--username', portal_username, '--token-file', '/run/secrets/mod-portal-token']
+        script = sync_mods_sh('/tmp/mods.json', '/tmp/mod-list.json' if mod_list is not None else '', prune)
+        if restart:
+            save_and_restart = rcon_sh(['/server-save'], optional=True) + on_host(container_command_sh('restart'))
+            script += f'if [ -n "$MODS_CHANGED" ]; then\n{save_and_restart}fi\n'
+        # Always staged again: the cache volume may have been pruned, portal may have new releases
+        c = await traced(c.with_env_variable('CACHEBUSTER', str(datetime.now())).with_exec(stage).sync(), 'stage mods')
+        await traced(
+            c.with_env_variable('CACHEBUSTER', str(datetime.now())).with_(exec_bash(script)).sync(),
+            'sync mods',
+        )
+
+    @function
+    @instrumented
+    async def stage_image(
+        self,
+        open_tofu_dir: dagger.Directory,
+        image_tag: tp.Annotated[
+            tp.Optional[str], Doc(f'Tag of {FACTORIO_IMAGE} (default: FACTORIO_IMAGE_TAG or of the fleet spec)')
+        ] = None,
+    ):
+        """Get a Factorio image onto the host (from the data disk or the registry), check it and keep its tarball on
+        the data disk. The running server is not touched"""
+        image_tag = image_tag or self._image_tag()
+        if not re.fullmatch(r'[\w][\w.-]*', image_tag):
+            raise DaggerError(f'Invalid image tag: {image_tag}')
+        version = saves.image_tag_version(image_tag)
+        script = stage_image_sh(image_tag, '.'.join(map(str, version)) if version else '')
+        await traced(
+            (await self.ssh_container(open_tofu_dir=open_tofu_dir))
+            .with_env_variable('CACHEBUSTER', str(datetime.now()))
+            .with_(exec_bash(on_host(script)))
+            .sync(),
+            'stage image',
+            image_tag=image_tag,
+        )
+
+    async def _apply_image_tags(
+        self, open_tofu_dir: dagger.Directory, hosts: list[str], image_tag: tp.Optional[str] = None
+    ):
+        # Only container declarations in instance metadata change: applied without stopping VMs. The COI agent then
+        # replaces the Factorio container; VMs not in `hosts` keep their declarations until they are switched too
+        c = await self.logged_open_tofu_cli(open_tofu_dir, image_tag=image_tag)
+        targets = [f'-target=yandex_compute_instance.server["{host}"]' for host in hosts]
+        await traced(
+            c.with_env_variable('CACHEBUSTER', str(datetime.now()))
+            .with_exec(['tofu', 'apply', '-input=false', '-auto-approve', *targets])
+            .sync(),
+            'tofu apply',
+            hosts=len(hosts),
+        )
+
+    async def _wait_image(self, open_tofu_dir: dagger.Directory, image_tag: str) -> str:
+        await traced(
+            (await self.ssh_container(open_tofu_dir=open_tofu_dir))
+            .with_env_variable('CACHEBUSTER', str(datetime.now()))
+            .with_(exec_bash(on_host(wait_image_sh(image_tag))))
+            .sync(),
+            'wait image',
+            image_tag=image_tag,
+        )
+        return image_tag
+
+    @function
+    @instrumented
+    async def upgrade_server(
+        self,
+        open_tofu_dir: dagger.Directory,
+        image_tag: tp.Annotated[
+            tp.Optional[str], Doc(f'Tag of {FACTORIO_IMAGE} (default: FACTORIO_IMAGE_TAG or of the fleet spec)')
+        ] = None,
+    ):
+        """Switch the server to another Factorio image: it is staged while the old server runs, then the game is
+        saved and the image tag of opentofu/vm.tf is applied to the VM without stopping it. The COI agent replaces
+        the container with one of the already loaded image (the server is down only while the map loads)
+        """
+        configured = self._image_tag()
+        image_tag = image_tag or configured
+        await self.stage_image(open_tofu_dir=open_tofu_dir, image_tag=image_tag)
+        await self._save_game(open_tofu_dir)
+        await self._apply_image_tags(open_tofu_dir, [self.host], image_tag)
+        await self._wait_image(open_tofu_dir, image_tag)
+        if image_tag != configured:
+            where = 'image_tag of the fleet spec' if self.servers else 'FACTORIO_IMAGE_TAG in config.py'
+            print(
+                f'WARNING: set {where} to {image_tag!r}, otherwise the next apply-tofu brings back {configured}',
+                file=sys.stderr,
             )
-            .sync()
+
+    @function
+    @instrumented
+    async def tail_logs(
+        self,
+        open_tofu_dir: dagger.Directory,
+        since: tp.Annotated[
+            str, Doc('Start here instead of the remembered offset: docker logs --since value (e.g. 10m)')
+        ] = '',
+        grep: tp.Annotated[str, Doc('Only lines matching this extended regex')] = '',
+        max_lines: tp.Annotated[int, Doc('Only this many last lines')] = 1000,
+        timestamps: tp.Annotated[bool, Doc('Prefix lines with docker timestamps')] = False,
+        cursor: tp.Annotated[str, Doc('Name of the remembered offset: each reader keeps its own')] = 'default',
+    ) -> str:
+        """Factorio container logs added since the previous call. The read offset is kept in a cache volume; the
+        whole log is read on the first call and after the container is replaced. Lines are filtered on the host
+        """
+        if not re.fullmatch(r'[\w-]+', cursor):
+            raise DaggerError(f'Invalid cursor name: {cursor}')
+        c = (
+            (await self.ssh_container(open_tofu_dir=open_tofu_dir))
+            .with_mounted_cache(LOG_OFFSETS_DIR, self._host_volume('log-offsets'))
+            .with_env_variable('CACHEBUSTER', str(datetime.now()))
+        )
+        script = tail_logs_sh(f'{LOG_OFFSETS_DIR}/{cursor}', since, grep, max_lines, timestamps)
+        return await exec_stdout(c, ['bash', '-c', script])
+
+    async def _rcon(self, open_tofu_dir: dagger.Directory, commands: list[str]) -> list[str]:
+        c = await traced(
+            (await self.ssh_container(open_tofu_dir=open_tofu_dir))
+            .with_env_variable('CACHEBUSTER', str(datetime.now()))
+            .with_(exec_bash(rcon_sh(commands, output='/tmp/rcon.json')))
+            .sync(),
+            'rcon',
+            commands=len(commands),
+        )
+        return json.loads(await c.file('/tmp/rcon.json').contents())
+
+    @function
+    @instrumented
+    async def rcon_exec(self, open_tofu_dir: dagger.Directory, command: str) -> str:
+        """Run admin command (e.g. `/players`) or chat message on the server, returns its response"""
+        return (await self._rcon(open_tofu_dir, [command]))[0]
+
+    @function
+    @instrumented
+    async def rcon_batch(self, open_tofu_dir: dagger.Directory, commands: list[str]) -> str:
+        """Run commands in order over one pipelined RCON connection, returns JSON list of responses"""
+        return json.dumps(await self._rcon(open_tofu_dir, commands))
+
+    @function
+    @instrumented
+    async def start_telemetry(
+        self,
+        open_tofu_dir: dagger.Directory,
+        interval: tp.Annotated[int, Doc('Seconds between samples')] = TELEMETRY_INTERVAL_SECONDS,
+        lua_ticks: tp.Annotated[bool, Doc('Exact UPS from game.tick: Lua commands disable achievements')] = False,
+    ):
+        """Install the telemetry collector on the host and (re)start it if its files or settings changed"""
+        c = (
+            (await self.ssh_container(open_tofu_dir=open_tofu_dir))
+            .with_new_file(f'{TELEMETRY_STAGING_DIR}/rcon.py', Path(rcon.__file__).read_text())
+            .with_new_file(f'{TELEMETRY_STAGING_DIR}/telemetry.py', Path(telemetry.__file__).read_text())
+            .with_new_file(f'{TELEMETRY_STAGING_DIR}/collector.sh', telemetry_collector_sh(interval, lua_ticks))
+        )
+        await traced(
+            c.with_env_variable('CACHEBUSTER', str(datetime.now())).with_(exec_bash(start_telemetry_sh())).sync(),
+            'start telemetry',
+        )
+
+    @function
+    @instrumented
+    async def stop_telemetry(self, open_tofu_dir: dagger.Directory):
+        """Stop the telemetry collector. Collected metrics stay on the data disk"""
+        await traced(
+            (await self.ssh_container(open_tofu_dir=open_tofu_dir))
+            .with_env_variable('CACHEBUSTER', str(datetime.now()))
+            .with_(exec_bash(on_host(stop_telemetry_sh())))
+            .sync(),
+            'stop telemetry',
+        )
+
+    @function
+    @instrumented
+    async def metrics_report(
+        self,
+        open_tofu_dir: dagger.Directory,
+        window_minutes: tp.Annotated[float, Doc('Summarize samples of this many last minutes')] = 60,
+        lag_ups: tp.Annotated[float, Doc('Samples with lower UPS count as lag')] = 57,
+    ) -> str:
+        """Percentiles of UPS, RCON latency, players, container CPU/memory and data disk I/O (see `telemetry.py`).
+        `lag` compares metrics of lagging and normal samples: CPU near 100% of one core points to the map,
+        near 100% of all cores to the VM size, disk latency/utilization to the disk
+        """
+        c = (await self.ssh_container(open_tofu_dir=open_tofu_dir)).with_env_variable(
+            'CACHEBUSTER', str(datetime.now())
+        )
+        return await exec_stdout(c, ['bash', '-c', metrics_report_sh(window_minutes, lag_ups)])
+
+    @function
+    @instrumented
+    async def start_save_staging(
+        self,
+        open_tofu_dir: dagger.Directory,
+        size_mb: tp.Annotated[int, Doc('Size cap of the tmpfs: saves that do not fit fail')] = SAVE_STAGING_TMPFS_MB,
+        flush_interval: tp.Annotated[
+            float, Doc('Seconds between flusher passes: a save is flushed once unchanged for one pass')
+        ] = SAVE_STAGING_FLUSH_SECONDS,
+    ):
+        """Stage saves on a tmpfs, so autosaves of big maps don't stall the game on the network disk. A flusher
+        copies complete saves to the data disk crash-safely (fsync and rename, see `storage.py`); a crash of the VM
+        loses only saves not flushed yet. The game is saved and the Factorio container restarted once to see the tmpfs
+        """
+        c = (
+            (await self.ssh_container(open_tofu_dir=open_tofu_dir))
+            .with_new_file(STORAGE_TOOL_PATH, Path(storage.__file__).read_text())
+            .with_new_file(SAVE_STAGING_SCRIPT_PATH, save_staging_sh(size_mb, flush_interval))
+        )
+        await traced(
+            c.with_env_variable('CACHEBUSTER', str(datetime.now()))
+            .with_(exec_bash(rcon_sh(['/server-save'], optional=True) + start_save_staging_sh()))
+            .sync(),
+            'start save staging',
+        )
+
+    @function
+    @instrumented
+    async def stop_save_staging(self, open_tofu_dir: dagger.Directory):
+        """Flush staged saves to the data disk and write saves there directly again (the Factorio container is
+        restarted)"""
+        await traced(
+            (await self.ssh_container(open_tofu_dir=open_tofu_dir))
+            .with_env_variable('CACHEBUSTER', str(datetime.now()))
+            .with_(exec_bash(rcon_sh(['/server-save'], optional=True) + on_host(stop_save_staging_sh())))
+            .sync(),
+            'stop save staging',
+        )
+
+    @function
+    @instrumented
+    async def benchmark_disk(
+        self,
+        open_tofu_dir: dagger.Directory,
+        size_mb: tp.Annotated[int, Doc('Size of the sequential writes')] = 256,
+        random_writes: tp.Annotated[int, Doc('Number of synchronous 4 KiB random writes')] = 2000,
+        runs: tp.Annotated[int, Doc('Runs of the autosave-sized write')] = 3,
+    ) -> str:
+        """Write throughput and latency of the data disk, JSON report (see `storage.py`): buffered and synchronous
+        sequential writes, synchronous random writes and an autosave-sized crash-safe write, compared with a tmpfs.
+        Runs next to the game, so it competes with its I/O: prefer a time without players
+        """
+        c = (
+            (await self.ssh_container(open_tofu_dir=open_tofu_dir))
+            .with_new_file(STORAGE_TOOL_PATH, Path(storage.__file__).read_text())
+            .with_env_variable('CACHEBUSTER', str(datetime.now()))
+        )
+        return await exec_stdout(c, ['bash', '-c', benchmark_disk_sh(size_mb, random_writes, runs)])
+
+    async def _backup_bucket(
+        self,
+        s3_endpoint: str,
+        s3_region: str,
+        s3_bucket: str,
+        s3_access_key: tp.Optional[dagger.Secret],
+        s3_secret_key: tp.Optional[dagger.Secret],
+    ) -> S3Bucket:
+        if s3_access_key is not None and s3_secret_key is not None:
+            access_key, secret_key = await s3_access_key.plaintext(), await s3_secret_key.plaintext()
+        else:
+            key = YcServiceAccessAccountKey.model_validate_json(
+                await (await self.create_yc_service_account_access_key()).plaintext()
+            )
+            access_key, secret_key = key.key_id, key.secret
+        if not s3_bucket:
+            s3_bucket = YcBucketInfo.model_validate_json(await self.init_backup_storage()).name
+        return S3Bucket(
+            endpoint=s3_endpoint, bucket=s3_bucket, access_key=access_key, secret_key=secret_key, region=s3_region
+        )
+
+    @function
+    @instrumented
+    async def backup_saves(
+        self,
+        open_tofu_dir: dagger.Directory,
+        s3_endpoint: str = YC_STORAGE_ENDPOINT,
+        s3_region: str = YC_STORAGE_REGION,
+        s3_bucket: str = '',
+        s3_access_key: tp.Optional[dagger.Secret] = None,
+        s3_secret_key: tp.Optional[dagger.Secret] = None,
+        keep: tp.Annotated[int, Doc('Saves to keep, by the last backup that saw them')] = BACKUP_KEEP,
+    ) -> str:
+        """Deduplicated backup of all server saves. Only chunks missing in the bucket are uploaded.
+        By default uses bucket YC_BACKUP_BUCKET_NAME; pass s3_* arguments to use other storage (e.g. local MinIO)
+        """
+        bucket = await self._backup_bucket(s3_endpoint, s3_region, s3_bucket, s3_access_key, s3_secret_key)
+        saves_dir = (
+            (await self.ssh_container(open_tofu_dir=open_tofu_dir))
+            .with_env_variable('CACHEBUSTER', str(datetime.now()))
+            .with_(
+                exec_bash(
+                    # Fresh state of the running game, if it is running
+                    rcon_sh(['/server-save'], optional=True) + download_saves_sh('/backup/saves')
+                )
+            )
+            .directory('/backup/saves')
+        )
+        local_saves = await traced(export_to_runtime(saves_dir, 'saves'), 'export saves')
+        report = await backup_files(bucket, local_saves.glob('*.zip'), keep)
+        return report.model_dump_json()
+
+    @function
+    @instrumented
+    async def list_backups(
+        self,
+        s3_endpoint: str = YC_STORAGE_ENDPOINT,
+        s3_region: str = YC_STORAGE_REGION,
+        s3_bucket: str = '',
+        s3_access_key: tp.Optional[dagger.Secret] = None,
+        s3_secret_key: tp.Optional[dagger.Secret] = None,
+    ) -> str:
+        bucket = await self._backup_bucket(s3_endpoint, s3_region, s3_bucket, s3_access_key, s3_secret_key)
+        return (await load_index(bucket)).model_dump_json()
+
+    @function
+    @instrumented
+    async def restore_save(
+        self,
+        name: str = '',
+        save_sha256: str = '',
+        open_tofu_dir: tp.Optional[dagger.Directory] = None,
+        s3_endpoint: str = YC_STORAGE_ENDPOINT,
+        s3_region: str = YC_STORAGE_REGION,
+        s3_bucket: str = '',
+        s3_access_key: tp.Optional[dagger.Secret] = None,
+        s3_secret_key: tp.Optional[dagger.Secret] = None,
+    ) -> dagger.File:
+        """Restore the newest backup matching name and/or sha256 (the newest one if both are empty).
+        If `open_tofu_dir` is passed, restored save is also uploaded to the server
+        """
+        bucket = await self._backup_bucket(s3_endpoint, s3_region, s3_bucket, s3_access_key, s3_secret_key)
+        index: BackupIndex = await load_index(bucket)
+        try:
+            entry = index.find(name=name, sha256=save_sha256)
+        except LookupError as e:
+            raise DaggerError(str(e)) from None
+        out_path = runtime_tempdir() / entry.name
+        await restore_file(bucket, entry, out_path)
+        save = file_from_runtime(out_path)
+        if open_tofu_dir is not None:
+            await self.upload_save(open_tofu_dir=open_tofu_dir, save=save)
+        return save
+
+    async def _save_game(self, open_tofu_dir: dagger.Directory):
+        await traced(
+            (await self.ssh_container(open_tofu_dir=open_tofu_dir))
+            .with_env_variable('CACHEBUSTER', str(datetime.now()))
+            .with_(exec_bash(rcon_sh(['/server-save'], optional=True)))
+            .sync(),
+            'save game',
+        )
+
+    @function
+    @instrumented
+    async def resize_server(
+        self,
+        open_tofu_dir: dagger.Directory,
+        cores: int,
+        memory_gb: int,
+        preemptible: tp.Annotated[tp.Optional[bool], Doc('Default: keep the existing')] = None,
+    ):
+        """Change VM size with `tofu apply`: the VM is stopped for the change, the game is saved before"""
+        instance = await self._server_instance()
+        if instance is not None and instance['status'] == 'RUNNING':
+            await self._save_game(open_tofu_dir)
+        c = await self.logged_open_tofu_cli(open_tofu_dir, cores=cores, memory_gb=memory_gb, preemptible=preemptible)
+        await traced(
+            c.with_env_variable('CACHEBUSTER', str(datetime.now()))
+            .with_exec(['tofu', 'apply', '-input=false', '-auto-approve'])
+            .sync(),
+            'tofu apply',
+            cores=cores,
+            memory_gb=memory_gb,
+        )
+
+    @function
+    @instrumented
+    async def autoscale_server(
+        self,
+        open_tofu_dir: dagger.Directory,
+        idle_minutes: tp.Annotated[float, Doc('Stop the VM after this long without players')] = HOST_IDLE_STOP_MINUTES,
+        target_ups: tp.Annotated[float, Doc('Samples below this UPS count as lag')] = HOST_TARGET_UPS,
+        load_minutes: tp.Annotated[float, Doc('Window of telemetry the size is judged on')] = 60,
+        apply_resize: tp.Annotated[bool, Doc('Resize the VM instead of only recommending it')] = False,
+        dry_run: tp.Annotated[bool, Doc('Only report the decision')] = False,
+    ) -> str:
+        """One scheduler tick (run it periodically, e.g. from cron): stop the idle VM, recommend or apply a resize
+        from telemetry (see `start-telemetry`). Returns the decision as JSON
+        """
+        instance = await self._server_instance()
+        if instance is None:
+            raise DaggerError(f'Instance {self.host} does not exist')
+        decision = autoscale.AutoscaleDecision(
+            instance_status=instance['status'], current_size=autoscale.VmSize.from_instance(instance)
+        )
+        if instance['status'] != 'RUNNING':
+            decision.reasons.append('Instance is not running')
+            return decision.model_dump_json(indent=2)
+        c = (await self.ssh_container(open_tofu_dir=open_tofu_dir)).with_env_variable(
+            'CACHEBUSTER', str(datetime.now())
+        )
+        script = metrics_report_sh(idle_minutes, target_ups) + metrics_report_sh(load_minutes, target_ups)
+        idle_report, load_report = [
+            json.loads(line) for line in (await exec_stdout(c, ['bash', '-ec', script])).splitlines()
+        ]
+        now = time.time()
+        autoscale.decide_stop(decision, idle_report, idle_minutes, now)
+        autoscale.decide_size(decision, load_report, HOST_SIZES, target_ups, now)
+        if dry_run:
+            return decision.model_dump_json(indent=2)
+        if decision.stop:
+            await self._save_game(open_tofu_dir)
+            await self.command_server_machine(MachineCommand.STOP)
+            decision.actions.append('Stopped the VM')
+        elif decision.recommended_size is not None and apply_resize:
+            size = decision.recommended_size
+            await self.resize_server(open_tofu_dir, cores=size.cores, memory_gb=size.memory_gb)
+            decision.actions.append(f'Resized the VM to {size.cores} cores, {size.memory_gb} GB')
+        return decision.model_dump_json(indent=2)
+
+    @function
+    async def command_server_machine(self, command: MachineCommand):
+        folder = YcFolderInfo.model_validate_json(await self.init_yc_folder())
+        await exec_sync(
+            (await self.logged_yandex_cloud_cli()).with_env_variable('CACHEBUSTER', str(datetime.now())),
+            ['yc', 'compute', 'instance', str(command), f'--folder-id={folder.id}', f'--name={self.host}'],
+        )
+
+    async def _on_fleet(
+        self,
+        hosts: tp.Optional[list[str]],
+        concurrency: int,
+        action: tp.Callable[['FactorioServer'], tp.Awaitable[tp.Any]],
+    ) -> list[fleet.HostResult]:
+        names = [spec.name for spec in self._fleet()]
+        unknown = [host for host in hosts or [] if host not in names]
+        if unknown:
+            raise DaggerError(f'Not in the fleet: {", ".join(unknown)}')
+        return await fleet.run_on_hosts(
+            hosts or names, concurrency, lambda host: action(dataclasses.replace(self, host=host))
+        )
+
+    @staticmethod
+    def _fleet_report(results: list[fleet.HostResult], note: str = '') -> str:
+        report = json.dumps([r.model_dump() for r in results], indent=2)
+        failed = [r.host for r in results if not r.ok]
+        if failed:
+            raise DaggerError(f'Failed on {len(failed)} of {len(results)} servers: {", ".join(failed)}{note}\n{report}')
+        return report
+
+    @function
+    @instrumented
+    async def fleet_upload_save(
+        self,
+        open_tofu_dir: dagger.Directory,
+        save: dagger.File,
+        hosts: tp.Annotated[tp.Optional[list[str]], Doc('Servers of the fleet (default: all)')] = None,
+        concurrency: tp.Annotated[int, Doc('Servers handled at once')] = FLEET_CONCURRENCY,
+        compression: tp.Annotated[SaveCompression, Doc('Recompress the save before transfer')] = SaveCompression.NONE,
+    ) -> str:
+        """`upload-save` to servers of the fleet, a few at a time. Returns per-server results as JSON"""
+        if compression != SaveCompression.NONE:
+            save = await self._recompress_save(save, compression)  # once for all servers
+        results = await self._on_fleet(
+            hosts, concurrency, lambda server: server.upload_save(open_tofu_dir=open_tofu_dir, save=save)
         )
+        return self._fleet_report(results)
+
+    @function
+    @instrumented
+    async def fleet_command_machine(
+        self,
+        command: MachineCommand,
+        hosts: tp.Annotated[tp.Optional[list[str]], Doc('Servers of the fleet (default: all)')] = None,
+        concurrency: tp.Annotated[int, Doc('Servers handled at once')] = FLEET_CONCURRENCY,
+    ) -> str:
+        """Start/stop/restart VMs of the fleet, a few at a time. Returns per-server results as JSON"""
+        results = await self._on_fleet(hosts, concurrency, lambda server: server.command_server_machine(command))
+        return self._fleet_report(results)
+
+    @function
+    @instrumented
+    async def fleet_upgrade(
+        self,
+        open_tofu_dir: dagger.Directory,
+        hosts: tp.Annotated[tp.Optional[list[str]], Doc('Servers of the fleet (default: all)')] = None,
+        concurrency: tp.Annotated[int, Doc('Servers handled at once')] = FLEET_CONCURRENCY,
+    ) -> str:
+        """`upgrade-server` of fleet servers to image tags of their specs: images are staged a few servers at a time,
+        then one `tofu apply` switches all servers that got their image. Returns per-server results as JSON
+        """
+
+        async def stage(server: 'FactorioServer') -> str:
+            await server.stage_image(open_tofu_dir=open_tofu_dir)
+            return server._image_tag()
+
+        staged = await self._on_fleet(hosts, concurrency, stage)
+        results = {r.host: r for r in staged}
+        # A server that failed staging or saving keeps the declaration of its old image: switching it would lose the
+        # progress since its last autosave
+        switched = [r.host for r in staged if r.ok]
+        if switched:
+            saved = await self._on_fleet(switched, concurrency, lambda server: server._save_game(open_tofu_dir))
+            results |= {r.host: r for r in saved if not r.ok}
+            switched = [r.host for r in saved if r.ok]
+        if switched:
+            await self._apply_image_tags(open_tofu_dir, switched)
+            ready = await self._on_fleet(
+                switched, concurrency, lambda server: server._wait_image(open_tofu_dir, server._image_tag())
+            )
+            results |= {r.host: r for r in ready}
+        return self._fleet_report(list(results.values()))
 
     @function
+    @instrumented
     async def login_yandex_cloud(self) -> dagger.Secret:
-        yc_config_volume = dag.cache_volume('yc_config')
+        # CACHEBUSTER below re-checks credentials on every call, so resolve them once per call graph
+        return await lookup_cache.get_or_resolve(('yc-login',), self._resolve_login_yandex_cloud)
+
+    async def _resolve_login_yandex_cloud(self) -> dagger.Secret:
+        yc_config_volume = self._cache_volume('yc_config')
         c = self.yandex_cloud_cli().with_mounted_cache('${HOME}/.config/yandex-cloud', yc_config_volume, expand=True)  # type: ignore
 
         exit_code_file = '/exit_code'
-        check_logged_c = (
-            await c.with_env_variable('CACHEBUSTER', str(datetime.now()))
+        check_logged_c = await traced(
+            c.with_env_variable('CACHEBUSTER', str(datetime.now()))
             .with_(exec_bash_and_save_exit_code('yc resource-manager folder list', exit_code_file))
-            .sync()
+            .sync(),
+            'yc login check',
         )
         logged_in = (await check_logged_c.file(exit_code_file).contents()).strip() == '0'
 
@@ -472,3 +1456,83 @@ class FactorioServer:
         )
 
         return dag.set_secret('yc-creds', await yc_config.contents())
+
+    @function
+    async def benchmark_pipeline(self, open_tofu_dir: dagger.Directory, runs: int = 3) -> str:
+        """Run login, apply and save upload against fake yc/tofu/ssh and report cold vs warm timings as JSON.
+        The first run uses a fresh cache seed (cold Dagger layers), the rest reuse it (warm)
+        """
+        seed = f'benchmark-{uuid.uuid4()}'
+        server = dataclasses.replace(self, simulate=True, cache_seed=seed, trace_format='')
+        save_path = runtime_tempdir() / 'benchmark.zip'
+        # Upload pre-flight check needs a real archive; the seed keeps its sha256 unique, as the host store is cached
+        saves.write_minimal_save(save_path, saves.image_tag_version(FACTORIO_IMAGE_TAG) or (2, 0, 0), seed)
+        save = file_from_runtime(save_path)
+        report = BenchmarkReport(runs=[])
+        for i in range(max(1, runs)):
+            lookup_cache.invalidate()
+            tracer.reset()
+            started = time.perf_counter()
+            await server.login_yandex_cloud()
+            await server.force_apply_tofu(open_tofu_dir=open_tofu_dir)
+            await server.upload_save(open_tofu_dir=open_tofu_dir, save=save)
+            wall_ms = (time.perf_counter() - started) * 1000
+            report.runs.append(summarize_run('cold' if i == 0 else f'warm-{i}', wall_ms, tracer.spans))
+        return report.model_dump_json(indent=2)
+
+    async def _benchmark_save(self, save: dagger.File, image_tag: str, ticks: int, runs: int) -> str:
+        info = await self._inspect_save(save, image_tag)
+        # Without the entrypoint nothing enables built-in expansion mods the save depends on
+        builtin = [m.name for m in info.mods or [] if m.name in FACTORIO_BUILTIN_MODS]
+        mod_list = json.dumps({'mods': [{'name': name, 'enabled': True} for name in dict.fromkeys(['base', *builtin])]})
+        c = (
+            dag.container()
+            .from_(f'{FACTORIO_IMAGE}:{image_tag}')
+            .with_new_file(f'{FACTORIO_BENCHMARK_DIR}/mods/mod-list.json', mod_list)
+            .with_file(f'{FACTORIO_BENCHMARK_DIR}/save.zip', save)
+            .with_env_variable('CACHEBUSTER', str(datetime.now()))
+        )
+        return await exec_stdout(
+            c,
+            [
+                FACTORIO_BINARY,
+                '--mod-directory',
+                f'{FACTORIO_BENCHMARK_DIR}/mods',
+                '--benchmark',
+                f'{FACTORIO_BENCHMARK_DIR}/save.zip',
+                '--benchmark-ticks',
+                str(ticks),
+                '--benchmark-runs',
+                str(runs),
+                '--benchmark-verbose',
+                'all',
+                '--disable-audio',
+            ],
+        )
+
+    @function
+    @instrumented
+    async def benchmark_save(
+        self,
+        save: dagger.File,
+        ticks: tp.Annotated[int, Doc('Ticks per run (60 ticks is one game second)')] = 1000,
+        runs: tp.Annotated[int, Doc('Runs per save and image tag')] = 3,
+        compare_saves: tp.Annotated[tp.Optional[list[dagger.File]], Doc('More saves to compare with')] = None,
+        image_tags: tp.Annotated[
+            tp.Optional[list[str]], Doc(f'Factorio image tags to compare (default: {FACTORIO_IMAGE_TAG})')
+        ] = None,
+    ) -> str:
+        """Measure tick time of saves with headless Factorio `--benchmark` on this machine, JSON report.
+        Benchmarks run one after another: parallel runs would compete for CPU. `relative_ups` compares each
+        result with the first one. Saves can use only built-in mods
+        """
+        report = SaveBenchmarkReport(benchmarks=[])
+        for tag in image_tags or [FACTORIO_IMAGE_TAG]:
+            for file in [save, *(compare_saves or [])]:
+                output = await traced(self._benchmark_save(file, tag, ticks, runs), 'factorio benchmark', tag=tag)
+                try:
+                    report.benchmarks.append(summarize_save_benchmark(await file.name(), tag, output))
+                except ValueError as e:
+                    raise DaggerError(f'{await file.name()} ({tag}): {e}') from None
+        compare_ups(report)
+        return report.model_dump_json(indent=2)
@@ -0,0 +1,185 @@
+"""Mod sync: content-addressed mod cache and sha256 manifests of mod directories
+
+Stdlib only: copied into the tool container and to the server host and run as a script:
+
+    python3 mods.py manifest --dir /factorio-data/mods
+    python3 mods.py stage --cache /cache --input mods/ --output desired.json
+    python3 mods.py stage --cache /cache --mod-list mod-list.json --factorio-version 2.0 --builtin-mods base ... \
+        --username U --token-file T ...
+    python3 mods.py diff --desired desired.json --current current.json --upload upload.txt --delete delete.txt
+
+`manifest` prints {file name: sha256} of mod zips in `--dir` and keeps it in `.manifest.json` there: a file is rehashed
+only if its size or mtime changed. `stage` puts mods into the cache as `sha256/<sha256>.zip` (local zips, or releases
+from the mod portal for mods of mod-list.json missing in the cache) and writes the desired manifest. `diff` lists
+files to upload (as `<sha256>  <name>`) and to delete. `--builtin-mods` ship with the game: never downloaded.
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import typing as tp
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+MANIFEST_NAME = '.manifest.json'
+PORTAL_URL = 'https://mods.factorio.com'
+DOWNLOAD_CONCURRENCY = 8
+
+_READ_SIZE = 1024 * 1024
+
+
+def file_hash(path: Path, algorithm: str = 'sha256') -> str:
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        while chunk := f.read(_READ_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def mod_name(file_name: str) -> str:
+    """`Krastorio2_1.3.24.zip` -> `Krastorio2`"""
+    return file_name.removesuffix('.zip').rsplit('_', 1)[0]
+
+
+def manifest(directory: Path) -> dict[str, str]:
+    path = directory / MANIFEST_NAME
+    known = json.loads(path.read_text()) if path.exists() else {}
+    entries = {}
+    for mod in sorted(directory.glob('*.zip')):
+        stat = mod.stat()
+        entry = known.get(mod.name)
+        if entry is None or (entry['size'], entry['mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+            entry = {'sha256': file_hash(mod), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        entries[mod.name] = entry
+    if entries != known:
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(entries))
+        os.replace(tmp, path)
+    return {name: entry['sha256'] for name, entry in entries.items()}
+
+
+class ModCache:
+    def __init__(self, root: Path):
+        self.root = root
+        (root / 'sha256').mkdir(parents=True, exist_ok=True)
+        # Release file names are immutable on the portal: name -> sha256 saves both the API call and the download
+        (root / 'releases').mkdir(exist_ok=True)
+
+    def path(self, sha256: str) -> Path:
+        return self.root / 'sha256' / f'{sha256}.zip'
+
+    def add(self, source: Path, sha256: tp.Optional[str] = None) -> str:
+        sha256 = sha256 or file_hash(source)
+        if not self.path(sha256).exists():
+            fd, tmp = tempfile.mkstemp(dir=self.root / 'sha256')
+            with os.fdopen(fd, 'wb') as out, open(source, 'rb') as f:
+                shutil.copyfileobj(f, out, _READ_SIZE)
+            os.replace(tmp, self.path(sha256))
+        return sha256
+
+    def release(self, file_name: str) -> tp.Optional[str]:
+        path = self.root / 'releases' / file_name
+        if path.exists() and self.path(sha256 := path.read_text().strip()).exists():
+            return sha256
+        return None
+
+    def add_release(self, file_name: str, source: Path) -> str:
+        sha256 = self.add(source)
+        (self.root / 'releases' / file_name).write_text(sha256)
+        return sha256
+
+
+def _latest_release(name: str, factorio_version: str) -> dict[str, tp.Any]:
+    with urllib.request.urlopen(f'{PORTAL_URL}/api/mods/{urllib.parse.quote(name)}', timeout=60) as response:
+        releases = json.load(response)['releases']
+    compatible = [r for r in releases if r['info_json'].get('factorio_version') == factorio_version]
+    if not compatible:
+        raise RuntimeError(f'Mod {name} has no release for Factorio {factorio_version}')
+    return compatible[-1]
+
+
+def _download(cache: ModCache, name: str, args: argparse.Namespace, auth: str) -> tuple[str, str]:
+    release = _latest_release(name, args.factorio_version)
+    sha256 = cache.release(release['file_name'])
+    if sha256 is None:
+        with tempfile.TemporaryDirectory(dir=cache.root) as tmp:
+            target = Path(tmp) / release['file_name']
+            with urllib.request.urlopen(f'{PORTAL_URL}{release["download_url"]}?{auth}', timeout=600) as response:
+                with open(target, 'wb') as out:
+                    shutil.copyfileobj(response, out, _READ_SIZE)
+            if file_hash(target, 'sha1') != release['sha1']:
+                raise RuntimeError(f'{release["file_name"]}: sha1 mismatch after download')
+            sha256 = cache.add_release(release['file_name'], target)
+    return release['file_name'], sha256
+
+
+def stage(args: argparse.Namespace) -> dict[str, str]:
+    cache = ModCache(Path(args.cache))
+    desired: dict[str, str] = {}
+    if args.input:
+        for mod in sorted(Path(args.input).glob('*.zip')):
+            desired[mod.name] = cache.add(mod)
+    if args.mod_list:
+        local = {mod_name(file_name) for file_name in desired}
+        mods = json.loads(Path(args.mod_list).read_text())['mods']
+        skip = set(args.builtin_mods or []) | local
+        missing = [m['name'] for m in mods if m['enabled'] and m['name'] not in skip]
+        if missing:
+            if not args.username or not args.token_file:
+                raise RuntimeError(f'Mod portal credentials are required to download: {", ".join(missing)}')
+            token = Path(args.token_file).read_text().strip()
+            auth = urllib.parse.urlencode({'username': args.username, 'token': token})
+            with concurrent.futures.ThreadPoolExecutor(DOWNLOAD_CONCURRENCY) as pool:
+                for file_name, sha256 in pool.map(lambda name: _download(cache, name, args, auth), missing):
+                    desired[file_name] = sha256
+    return desired
+
+
+def diff(desired: dict[str, str], current: dict[str, str]) -> tuple[list[str], list[str]]:
+    upload = sorted(name for name, sha256 in desired.items() if current.get(name) != sha256)
+    delete = sorted(name for name in current if name not in desired)
+    return upload, delete
+
+
+def main(args: argparse.Namespace) -> int:
+    try:
+        if args.command == 'manifest':
+            print(json.dumps(manifest(Path(args.dir))))
+        elif args.command == 'stage':
+            Path(args.output).write_text(json.dumps(stage(args)))
+        else:
+            desired = json.loads(Path(args.desired).read_text())
+            upload, delete = diff(desired, json.loads(Path(args.current).read_text()))
+            # `sha256sum -c` format: the host checks transferred files with it
+            Path(args.upload).write_text(''.join(f'{desired[name]}  {name}\n' for name in upload))
+            Path(args.delete).write_text(''.join(f'{name}\n' for name in delete))
+            print(f'Mods to upload: {len(upload)}, to delete: {len(delete)}', file=sys.stderr)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['manifest', 'stage', 'diff'])
+    parser.add_argument('--dir')
+    parser.add_argument('--cache')
+    parser.add_argument('--input')
+    parser.add_argument('--mod-list')
+    parser.add_argument('--factorio-version')
+    parser.add_argument('--builtin-mods', nargs='*')
+    parser.add_argument('--username')
+    parser.add_argument('--token-file')
+    parser.add_argument('--output')
+    parser.add_argument('--desired')
+    parser.add_argument('--current')
+    parser.add_argument('--upload')
+    parser.add_argument('--delete')
+    sys.exit(main(parser.parse_args()))
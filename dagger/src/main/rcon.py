@@ -0,0 +1,142 @@
+"""Source RCON client for Factorio admin commands
+
+Stdlib only: besides being imported, the file is copied into tool containers and run as a script next to an SSH tunnel
+to the server (RCON port is not exposed to the internet):
+
+    python3 rcon.py --port 27015 --password-file rconpw /server-save /players
+
+One connection is kept for all commands and reopened if the server drops it. Commands are pipelined: all requests
+are written at once and responses are matched by request id, so a batch costs one round trip.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import struct
+import sys
+import typing as tp
+
+TYPE_RESPONSE = 0
+TYPE_COMMAND = 2
+TYPE_AUTH_RESPONSE = 2
+TYPE_AUTH = 3
+AUTH_FAILED_ID = -1
+
+_HEADER = struct.Struct('<iii')  # size, request id, type
+
+
+class RconError(Exception):
+    pass
+
+
+def encode_packet(request_id: int, packet_type: int, body: str) -> bytes:
+    payload = body.encode() + b'\x00\x00'
+    return _HEADER.pack(_HEADER.size - 4 + len(payload), request_id, packet_type) + payload
+
+
+async def read_packet(reader: asyncio.StreamReader) -> tuple[int, int, str]:
+    size, request_id, packet_type = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    body = await reader.readexactly(size - (_HEADER.size - 4))
+    return request_id, packet_type, body[:-2].decode(errors='replace')
+
+
+class RconClient:
+    def __init__(self, host: str, port: int, password: str, timeout: float = 10.0, retries: int = 1):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.retries = retries
+        self._ids = itertools.count(1)
+        self._streams: tp.Optional[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = None
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self) -> 'RconClient':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._streams is not None:
+            _, writer = self._streams
+            self._streams = None
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def _connect(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        if self._streams is None:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+            auth_id = next(self._ids)
+            writer.write(encode_packet(auth_id, TYPE_AUTH, self.password))
+            await writer.drain()
+            while True:
+                request_id, packet_type, _ = await asyncio.wait_for(read_packet(reader), self.timeout)
+                if request_id == AUTH_FAILED_ID:
+                    writer.close()
+                    raise RconError('Authentication failed: wrong RCON password')
+                if packet_type == TYPE_AUTH_RESPONSE and request_id == auth_id:
+                    break
+            self._streams = reader, writer
+        return self._streams
+
+    async def _pipeline(self, commands: list[str]) -> list[str]:
+        reader, writer = await self._connect()
+        ids = [next(self._ids) for _ in commands]
+        writer.write(b''.join(encode_packet(i, TYPE_COMMAND, c) for i, c in zip(ids, commands)))
+        await writer.drain()
+        responses: dict[int, str] = {}
+        while len(responses) < len(ids):
+            request_id, _, body = await asyncio.wait_for(read_packet(reader), self.timeout)
+            if request_id in ids:
+                # Responses come in order: packets with the same id before the next response are parts of one. Factorio
+                # sends a response in one packet, so the last one is not waited for
+                responses[request_id] = responses.get(request_id, '') + body
+        return [responses[i] for i in ids]
+
+    async def batch(self, commands: tp.Sequence[str]) -> list[str]:
+        """Run commands in order over one connection, return their responses"""
+        if not commands:
+            return []
+        async with self._lock:
+            for attempt in itertools.count():
+                reused = self._streams is not None
+                try:
+                    return await self._pipeline(list(commands))
+                except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                    await self.close()
+                    # Only a connection kept from earlier calls may have gone stale: retrying on a fresh one could
+                    # run non-idempotent commands (e.g. `/quit`) twice
+                    if not reused or attempt >= self.retries:
+                        raise RconError(f'RCON connection to {self.host}:{self.port} failed: {e!r}') from e
+        raise AssertionError('unreachable')
+
+    async def execute(self, command: str) -> str:
+        return (await self.batch([command]))[0]
+
+
+async def _main(args: argparse.Namespace) -> int:
+    with open(args.password_file) as f:
+        password = f.read().strip()
+    try:
+        async with RconClient(args.host, args.port, password, timeout=args.timeout) as client:
+            responses = await client.batch(args.commands)
+    except RconError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(json.dumps(responses))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=27015)
+    parser.add_argument('--password-file', required=True)
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('commands', nargs='+')
+    sys.exit(asyncio.run(_main(parser.parse_args())))
@@ -0,0 +1,180 @@
+"""Parallel recompression of save archives before upload
+
+Members are deflated in a process pool (zlib holds the GIL for small buffers, so threads don't scale) and written in
+the original order by a minimal zip writer: `zipfile` can't store already compressed data. A member keeps its
+original bytes when recompression doesn't make it smaller, so the result is never larger than the source.
+Every member of the result is read back and compared by sha256 with the source before it is used.
+"""
+
+import asyncio
+import collections
+import hashlib
+import os
+import struct
+import time
+import typing as tp
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pydantic
+
+LEVELS = {'fast': 1, 'default': 6, 'best': 9}
+
+_READ_SIZE = 1024 * 1024
+_ZIP32_LIMIT = 0xFFFFFFFF
+_UTF8_FLAG = 0x800
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END_RECORD = struct.Struct('<IHHHHIIH')
+
+
+class RecompressError(Exception):
+    pass
+
+
+class RecompressReport(pydantic.BaseModel):
+    level: str
+    workers: int
+    members: int
+    recompressed_members: int
+    original_size: int
+    size: int
+    compress_seconds: float
+    verify_seconds: float
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.original_size - self.size
+
+    @property
+    def break_even_mbit(self) -> float:
+        """Uplink speed below which the upload gets faster than the time spent on recompression"""
+        spent = self.compress_seconds + self.verify_seconds
+        return self.saved_bytes * 8 / spent / 1e6 if spent > 0 else float('inf')
+
+
+class _Member(tp.NamedTuple):
+    name: str
+    data: bytes
+    sha256: str
+
+
+def _deflate_member(path: str, name: str, level: int) -> _Member:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    digest = hashlib.sha256()
+    parts = []
+    # Reading through zipfile also checks CRC of the source member
+    with zipfile.ZipFile(path) as archive, archive.open(name) as f:
+        while chunk := f.read(_READ_SIZE):
+            digest.update(chunk)
+            parts.append(compressor.compress(chunk))
+    parts.append(compressor.flush())
+    return _Member(name, b''.join(parts), digest.hexdigest())
+
+
+def _member_sha256(path: str, name: str) -> str:
+    digest = hashlib.sha256()
+    with zipfile.ZipFile(path) as archive, archive.open(name) as f:
+        while chunk := f.read(_READ_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _raw_data(f: tp.BinaryIO, info: zipfile.ZipInfo) -> bytes:
+    f.seek(info.header_offset)
+    header = f.read(_LOCAL_HEADER.size)
+    name_length, extra_length = _LOCAL_HEADER.unpack(header)[-2:]
+    f.seek(info.header_offset + _LOCAL_HEADER.size + name_length + extra_length)
+    return f.read(info.compress_size)
+
+
+def _dos_time(info: zipfile.ZipInfo) -> tuple[int, int]:
+    year, month, day, hour, minute, second = info.date_time
+    return hour << 11 | minute << 5 | second // 2, (year - 1980) << 9 | month << 5 | day
+
+
+class _ZipWriter:
+    """Writes members with given compressed data; no zip64, encryption or data descriptors"""
+
+    def __init__(self, f: tp.BinaryIO):
+        self._f = f
+        self._central: list[bytes] = []
+
+    def add(self, info: zipfile.ZipInfo, method: int, data: bytes):
+        if len(data) > _ZIP32_LIMIT or info.file_size > _ZIP32_LIMIT or self._f.tell() > _ZIP32_LIMIT:
+            raise RecompressError(f'{info.filename}: archives over 4 GiB are not supported')
+        name = info.filename.encode()
+        flags = _UTF8_FLAG if not info.filename.isascii() else 0
+        dos_time, dos_date = _dos_time(info)
+        offset = self._f.tell()
+        common = (20, flags, method, dos_time, dos_date, info.CRC, len(data), info.file_size, len(name))
+        self._f.write(_LOCAL_HEADER.pack(0x04034B50, *common, 0))
+        self._f.write(name)
+        self._f.write(data)
+        central = _CENTRAL_HEADER.pack(0x02014B50, 20, *common, 0, 0, 0, 0, info.external_attr, offset)
+        self._central.append(central + name)
+
+    def close(self):
+        offset = self._f.tell()
+        directory = b''.join(self._central)
+        self._f.write(directory)
+        count = len(self._central)
+        self._f.write(_END_RECORD.pack(0x06054B50, 0, 0, count, count, len(directory), offset, 0))
+
+
+async def recompress_save(
+    src: Path, dst: Path, level: str = 'default', workers: tp.Optional[int] = None
+) -> RecompressReport:
+    """Write `src` recompressed into `dst`, raises RecompressError if the result doesn't match the source"""
+    workers = workers or os.cpu_count() or 1
+    loop = asyncio.get_running_loop()
+    with zipfile.ZipFile(src) as archive:
+        infos = archive.infolist()
+    if any(info.flag_bits & 0x1 for info in infos):
+        raise RecompressError(f'{src.name}: encrypted archives are not supported')
+
+    started = time.monotonic()
+    source_sha256 = {}
+    recompressed = 0
+    with ProcessPoolExecutor(workers) as pool:
+        with open(src, 'rb') as source, open(dst, 'wb') as out:
+            writer = _ZipWriter(out)
+            # Bounded window: members are written in order and at most a few of them wait in memory
+            pending: collections.deque = collections.deque()
+            for info in infos:
+                future = loop.run_in_executor(pool, _deflate_member, str(src), info.filename, LEVELS[level])
+                pending.append((info, future))
+                if len(pending) >= 2 * workers:
+                    recompressed += await _write_next(writer, source, pending, source_sha256)
+            while pending:
+                recompressed += await _write_next(writer, source, pending, source_sha256)
+            writer.close()
+        compressed_at = time.monotonic()
+        verify = [loop.run_in_executor(pool, _member_sha256, str(dst), info.filename) for info in infos]
+        for info, result_sha256 in zip(infos, await asyncio.gather(*verify)):
+            if result_sha256 != source_sha256[info.filename]:
+                raise RecompressError(f'{src.name}: {info.filename} differs after recompression')
+
+    return RecompressReport(
+        level=level,
+        workers=workers,
+        members=len(infos),
+        recompressed_members=recompressed,
+        original_size=src.stat().st_size,
+        size=dst.stat().st_size,
+        compress_seconds=compressed_at - started,
+        verify_seconds=time.monotonic() - compressed_at,
+    )
+
+
+async def _write_next(writer: _ZipWriter, source: tp.BinaryIO, pending: collections.deque, sha256: dict) -> int:
+    info, future = pending.popleft()
+    member: _Member = await future
+    sha256[info.filename] = member.sha256
+    if len(member.data) < info.compress_size:
+        writer.add(info, zipfile.ZIP_DEFLATED, member.data)
+        return 1
+    writer.add(info, info.compress_type, _raw_data(source, info))
+    return 0
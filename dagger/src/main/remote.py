@@ -0,0 +1,721 @@
+"""Bash snippets for the server host. They run from `FactorioServer.ssh_container`"""
+
+import shlex
+from textwrap import dedent
+
+from main.config import (
+    FACTORIO_BINARY,
+    FACTORIO_DATA_DIR,
+    FACTORIO_IMAGE,
+    FACTORIO_IMAGES_DIR,
+    FACTORIO_IMAGES_KEEP,
+    FACTORIO_MODS_DIR,
+    FACTORIO_RCON_PASSWORD_FILE,
+    FACTORIO_RCON_PORT,
+    FACTORIO_READY_TIMEOUT,
+    FACTORIO_SAVE_STAGING_DIR,
+    FACTORIO_SAVE_STORE_DIR,
+    FACTORIO_SAVE_STORE_KEEP,
+    FACTORIO_SAVES_DIR,
+    FACTORIO_SAVES_DISK_DIR,
+    FACTORIO_TELEMETRY_DIR,
+    FACTORIO_UID,
+    FACTORIO_UPLOAD_DIR,
+    HOST_USERNAME,
+    MOD_SYNC_PARALLELISM,
+    TELEMETRY_RETENTION_DAYS,
+)
+
+SSH_HOST = 'factorio-server'
+# Cache volume with the last known good address and key of the host (see `FactorioServer.ssh_container`)
+SSH_ENDPOINT_DIR = '/var/lib/ssh-endpoint'
+# `main/rcon.py` is copied here in `FactorioServer.ssh_container`
+RCON_CLIENT_PATH = '/opt/rcon.py'
+# Files of the telemetry collector prepared in `ssh_container` before they are installed on the host
+TELEMETRY_STAGING_DIR = '/opt/telemetry'
+_TELEMETRY_FILES = ('rcon.py', 'telemetry.py', 'collector.sh')
+# `main/mods.py` is copied here in `FactorioServer.sync_mods`, mod zips are cached in MOD_CACHE_DIR/sha256/
+MODS_TOOL_PATH = '/opt/mods.py'
+MOD_CACHE_DIR = '/var/cache/factorio-mods'
+# `main/storage.py` is copied here for `FactorioServer.benchmark_disk` and save staging, `staging.sh` (see
+# `save_staging_sh`) next to it
+STORAGE_TOOL_PATH = '/opt/storage.py'
+SAVE_STAGING_SCRIPT_PATH = '/opt/staging.sh'
+# Cache volume with read offsets of `FactorioServer.tail_logs`: `<container id> <timestamp of the last read line>`
+LOG_OFFSETS_DIR = '/var/lib/log-offsets'
+
+_IMAGE_REGEX = FACTORIO_IMAGE.replace('/', '\\/')
+
+# Sets CONTAINER_ID to Factorio container (running or stopped), empty if there is none
+FACTORIO_CONTAINER_ID_SH = f"""
+CONTAINER_ID="$(docker ps -a --format '{{{{.ID}}}} {{{{.Image}}}}' | awk '$2 ~ /^{_IMAGE_REGEX}:/ {{ print $1; exit }}')"
+"""  # noqa: E501
+
+# Factorio logs this once the map is loaded and the server accepts players
+FACTORIO_READY_LOG_LINE = 'changing state from(CreatingGame) to(InGame)'
+
+
+def ssh_config() -> str:
+    """Client config: endpoint comes from SSH_ENDPOINT_DIR, all ssh/scp/rsync calls of one script share a connection"""
+    return dedent(f"""
+        Host {SSH_HOST}
+            User {HOST_USERNAME}
+            StrictHostKeyChecking no
+            UserKnownHostsFile /dev/null
+            LogLevel ERROR
+            ControlMaster auto
+            ControlPath /tmp/ssh-%C
+            ControlPersist 60
+            ServerAliveInterval 15
+            Include {SSH_ENDPOINT_DIR}/config
+    """).lstrip()
+
+
+def store_ssh_endpoint_sh(address: str, keys_dir: str = '') -> str:
+    """Save host address (and keys from `keys_dir`, if given) into SSH_ENDPOINT_DIR"""
+    script = f"""
+mkdir -p {SSH_ENDPOINT_DIR}
+printf 'HostName %s\\nIdentityFile {SSH_ENDPOINT_DIR}/id_rsa\\n' {shlex.quote(address)} > {SSH_ENDPOINT_DIR}/config.tmp
+"""
+    if keys_dir:
+        script += f"""
+install -m 400 {keys_dir}/id_rsa {SSH_ENDPOINT_DIR}/id_rsa.tmp
+install -m 444 {keys_dir}/id_rsa.pub {SSH_ENDPOINT_DIR}/id_rsa.pub
+mv {SSH_ENDPOINT_DIR}/id_rsa.tmp {SSH_ENDPOINT_DIR}/id_rsa
+"""
+    return script + f'mv {SSH_ENDPOINT_DIR}/config.tmp {SSH_ENDPOINT_DIR}/config\n'
+
+
+def probe_ssh_sh(status_file: str) -> str:
+    """Write `ok`, `missing` (nothing cached) or `failed` into `status_file`, never fails itself"""
+    return f"""
+if [ ! -f {SSH_ENDPOINT_DIR}/config ] || [ ! -f {SSH_ENDPOINT_DIR}/id_rsa ]; then
+    echo missing > {status_file}
+elif ssh -o ConnectTimeout=10 -o BatchMode=yes {SSH_HOST} true; then
+    echo ok > {status_file}
+else
+    echo failed > {status_file}
+fi
+"""
+
+
+def on_host(script: str, *args: str) -> str:
+    """Run `script` on the server host. `args` are bash words of the calling script, available as $1, $2, ..."""
+    # ssh joins its arguments into one command line for the remote shell: quoted once more to survive the split
+    words = ' '.join(f'"$(printf %q {arg})"' for arg in args)
+    header = f"ssh {SSH_HOST} /bin/bash -s -- {words} <<'ENDSSH'"
+    return f'{header}\nset -xeuo pipefail\n{dedent(script).strip()}\nENDSSH\n'
+
+
+def rcon_sh(commands: list[str], output: str = '/dev/stdout', optional: bool = False) -> str:
+    """Run RCON commands through an SSH tunnel (RCON port is not exposed), JSON list of responses goes to `output`.
+    If `optional`, an unreachable server (e.g. stopped container) is only a warning
+    """
+    words = ' '.join(shlex.quote(c) for c in commands)
+    run = f'python3 {RCON_CLIENT_PATH} --port {FACTORIO_RCON_PORT} --password-file /tmp/rconpw {words} > {output}'
+    if optional:
+        run = f'{run} || echo "WARNING: RCON is unavailable, commands are skipped" >&2'
+    # Forwarding is added to the shared connection (see `ssh_config`), which the first command opens
+    return f"""
+ssh {SSH_HOST} sudo cat {FACTORIO_RCON_PASSWORD_FILE} > /tmp/rconpw{' || true' if optional else ''}
+ssh -O forward -L 127.0.0.1:{FACTORIO_RCON_PORT}:127.0.0.1:{FACTORIO_RCON_PORT} {SSH_HOST}
+{run}
+"""
+
+
+def upload_save_sh(local_path: str) -> str:
+    """Upload save into content-addressed store on the host, skipping transfer if the host already has it.
+
+    Transfer is resumable and delta-encoded: rsync reuses partial upload (or the current save as basis).
+    Sets SAVE_SHA256.
+    """
+    prepare = on_host(
+        f"""
+        sudo mkdir -p {FACTORIO_UPLOAD_DIR} {FACTORIO_SAVE_STORE_DIR}
+        sudo chown {HOST_USERNAME} {FACTORIO_UPLOAD_DIR}
+        PART="{FACTORIO_UPLOAD_DIR}/$1.zip"
+        CURRENT="$(ls -1t {FACTORIO_SAVES_DIR}/*.zip 2>/dev/null | head -n 1 || true)"
+        if [ ! -f "$PART" ] && [ -n "$CURRENT" ]; then
+            cp "$CURRENT" "$PART"
+        fi
+        """,
+        '"$SAVE_SHA256"',
+    )
+    commit = on_host(
+        f"""
+        PART="{FACTORIO_UPLOAD_DIR}/$1.zip"
+        echo "$1  $PART" | sha256sum -c --quiet -
+        sudo mv "$PART" "{FACTORIO_SAVE_STORE_DIR}/$1.zip"
+        """,
+        '"$SAVE_SHA256"',
+    )
+    target = f'{SSH_HOST}:{FACTORIO_UPLOAD_DIR}/${{SAVE_SHA256}}.zip'
+    return f"""
+SAVE_SHA256="$(sha256sum {local_path} | cut -c1-64)"
+if ssh {SSH_HOST} test -f "{FACTORIO_SAVE_STORE_DIR}/${{SAVE_SHA256}}.zip"; then
+    echo "Server already has save ${{SAVE_SHA256}}: skipping transfer"
+else
+{prepare}
+    if ssh {SSH_HOST} command -v rsync >/dev/null; then
+        for attempt in 1 2 3 4 5; do
+            rsync --inplace --partial --no-whole-file --compress {local_path} "{target}" && break
+            [ "$attempt" -lt 5 ] || exit 1
+            sleep 5
+        done
+    else
+        scp {local_path} "{target}"
+    fi
+{commit}
+fi
+"""
+
+
+# Sets READY if container $CONTAINER_ID has loaded the map since $STARTED_AT (FACTORIO_READY_TIMEOUT seconds at most)
+_WAIT_READY_SH = f"""
+set +x  # don't log every poll
+READY=''
+for i in $(seq {FACTORIO_READY_TIMEOUT * 2}); do
+    if docker logs --since "$STARTED_AT" "$CONTAINER_ID" 2>&1 | grep -qF '{FACTORIO_READY_LOG_LINE}'; then
+        READY=1
+        echo "Factorio is ready in $(( i / 2 ))s"
+        break
+    fi
+    sleep 0.5
+done
+set -x
+"""
+
+
+def container_command_sh(command: str, wait_ready: bool = True) -> str:
+    """Host script: `docker container <command>` for Factorio container (`start`, `stop` or `restart`).
+    After `start`/`restart` waits until the server has loaded the map (FACTORIO_READY_TIMEOUT seconds at most)
+    """
+    script = FACTORIO_CONTAINER_ID_SH + dedent(f"""
+        if [ -z "$CONTAINER_ID" ]; then
+            echo "Factorio container not found" >&2
+            exit 1
+        fi
+        STARTED_AT="$(date -u +%Y-%m-%dT%H:%M:%S)"
+        docker container {command} "$CONTAINER_ID"
+    """)
+    if command == 'stop' or not wait_ready:
+        return script
+    return (
+        script
+        + _WAIT_READY_SH
+        + dedent(f"""
+        if [ -z "$READY" ]; then
+            echo "Factorio is not ready after {FACTORIO_READY_TIMEOUT}s, last logs:" >&2
+            docker logs --tail 50 "$CONTAINER_ID" >&2
+            exit 1
+        fi
+    """)
+    )
+
+
+def download_saves_sh(local_dir: str) -> str:
+    """Copy all saves from the host into `local_dir`, waiting for saves in progress (written to *.tmp.zip first)"""
+    return f"""
+ssh {SSH_HOST} "for i in \\$(seq 60); do ls {FACTORIO_SAVES_DIR}/*.tmp.zip >/dev/null 2>&1 || exit 0; sleep 1; done"
+mkdir -p {local_dir}
+ssh {SSH_HOST} "cd {FACTORIO_SAVES_DIR} && sudo find . -maxdepth 1 -name '*.zip' ! -name '*.tmp.zip' -print0 | sudo tar --null -T - -cf -" \\
+    | tar -xf - -C {local_dir}
+"""  # noqa: E501
+
+
+def install_save_sh(start: bool = True) -> str:
+    """Host script: make stored save `$1` the only save, named `$2`. Factorio container (not the VM) is stopped
+    for the swap and, if `start`, started again and awaited
+    """
+    return (
+        FACTORIO_CONTAINER_ID_SH
+        + dedent(f"""
+        if [ -n "$CONTAINER_ID" ]; then
+            docker container stop "$CONTAINER_ID"
+        fi
+        sudo mkdir -p {FACTORIO_SAVES_DIR}
+        sudo rm -f {FACTORIO_SAVES_DIR}/*
+        sudo cp "{FACTORIO_SAVE_STORE_DIR}/$1.zip" "{FACTORIO_SAVES_DIR}/$2"
+        sudo chown -R {FACTORIO_UID}:{FACTORIO_UID} {FACTORIO_SAVES_DIR}
+        ls -1t {FACTORIO_SAVE_STORE_DIR}/*.zip | tail -n +{FACTORIO_SAVE_STORE_KEEP + 1} | xargs -r sudo rm -f
+        if [ -z "$CONTAINER_ID" ]; then
+            echo "WARNING: Factorio container not found, save will be picked up on its next start" >&2
+            exit 0
+        fi
+        """)
+        + (container_command_sh('start') if start else '')
+    )
+
+
+def stage_image_sh(tag: str, version: str = '') -> str:
+    """Host script: make image `tag` available locally, from the tarball on the data disk or from the registry.
+    The image is checked to run Factorio `version` (if given) and saved to FACTORIO_IMAGES_DIR: after the boot disk
+    is replaced, staging loads it from there instead of pulling
+    """
+    image = f'{FACTORIO_IMAGE}:{tag}'
+    script = dedent(f"""
+        sudo mkdir -p {FACTORIO_IMAGES_DIR}
+        cd {FACTORIO_IMAGES_DIR}
+        if docker image inspect {image} > /dev/null 2>&1; then
+            echo "Image {image} is already on the host"
+        elif [ -f {tag}.tar.sha256 ] && sha256sum -c --quiet {tag}.tar.sha256; then
+            docker load -i {tag}.tar
+        else
+            docker pull {image}
+        fi
+        # Nothing is started: the check doesn't touch the data dir or the network of the running server
+        docker run --rm --network none --entrypoint {FACTORIO_BINARY} {image} --version | tee /tmp/factorio-version
+    """)
+    if version:
+        script += dedent(f"""
+            if ! grep -qF 'Version: {version} ' /tmp/factorio-version; then
+                echo "Image {image} doesn't run Factorio {version}" >&2
+                exit 1
+            fi
+        """)
+    return script + dedent(f"""
+        if [ ! -f {tag}.tar.sha256 ]; then
+            sudo docker save -o {tag}.tar.tmp {image}
+            sudo mv {tag}.tar.tmp {tag}.tar
+            sha256sum {tag}.tar | sudo tee {tag}.tar.sha256.tmp > /dev/null
+            sudo mv {tag}.tar.sha256.tmp {tag}.tar.sha256
+        fi
+        ls -1t *.tar | tail -n +{FACTORIO_IMAGES_KEEP + 1} | while read -r TARBALL; do
+            sudo rm -f "$TARBALL" "$TARBALL.sha256"
+        done
+    """)
+
+
+def wait_image_sh(tag: str) -> str:
+    """Host script: wait until the COI agent has replaced the Factorio container with one of image `tag` (after the
+    container declaration in instance metadata changed, see `_apply_image_tags`) and the server has loaded the map
+    """
+    image = f'{FACTORIO_IMAGE}:{tag}'
+    return (
+        dedent(f"""
+        set +x  # don't log every poll
+        CONTAINER_ID=''
+        for i in $(seq {FACTORIO_READY_TIMEOUT * 2}); do
+            CONTAINER_ID="$(docker ps --format '{{{{.ID}}}} {{{{.Image}}}}' \\
+                | awk '$2 == "{image}" {{ print $1; exit }}')"
+            [ -z "$CONTAINER_ID" ] || break
+            sleep 0.5
+        done
+        set -x
+        if [ -z "$CONTAINER_ID" ]; then
+            echo "No container of {image} after {FACTORIO_READY_TIMEOUT}s: the declaration wasn't picked up" >&2
+            exit 1
+        fi
+        STARTED_AT="$(docker inspect --format '{{{{.State.StartedAt}}}}' "$CONTAINER_ID")"
+        """)
+        + _WAIT_READY_SH
+        + dedent(f"""
+        if [ -z "$READY" ]; then
+            echo "Factorio of {image} is not ready after {FACTORIO_READY_TIMEOUT}s, last logs:" >&2
+            docker logs --tail 50 "$CONTAINER_ID" >&2
+            exit 1
+        fi
+        """)
+    )
+
+
+def telemetry_collector_sh(interval: int, lua_ticks: bool) -> str:
+    """`collector.sh`: starts the collector with its settings, on install and on boot"""
+    args = [
+        f'--dir {FACTORIO_TELEMETRY_DIR}',
+        f'--data-dir {FACTORIO_DATA_DIR}',
+        f'--image {FACTORIO_IMAGE}',
+        f'--port {FACTORIO_RCON_PORT}',
+        f'--password-file {FACTORIO_RCON_PASSWORD_FILE}',
+        f'--interval {interval}',
+        f'--retention-days {TELEMETRY_RETENTION_DAYS}',
+    ] + (['--lua-ticks'] if lua_ticks else [])
+    command = f'python3 {FACTORIO_TELEMETRY_DIR}/telemetry.py collect {" ".join(args)}'
+    return f'exec {command} >> {FACTORIO_TELEMETRY_DIR}/collector.log 2>&1 < /dev/null\n'
+
+
+_STOP_COLLECTOR_SH = f"""
+if [ -f {FACTORIO_TELEMETRY_DIR}/collector.pid ]; then
+    sudo kill "$(cat {FACTORIO_TELEMETRY_DIR}/collector.pid)" 2>/dev/null || true
+fi
+# Collector holds the lock until it has flushed its buffer
+sudo flock {FACTORIO_TELEMETRY_DIR}/collector.lock true
+"""
+
+
+def start_telemetry_sh() -> str:
+    """Install files of TELEMETRY_STAGING_DIR on the host and (re)start the collector if they changed.
+    Collector is started on boot by cron where the host has it
+    """
+    files = ' '.join(f'{TELEMETRY_STAGING_DIR}/{name}' for name in _TELEMETRY_FILES)
+    install = on_host(f"""
+sudo mkdir -p {FACTORIO_TELEMETRY_DIR}
+CHANGED=''
+for name in {' '.join(_TELEMETRY_FILES)}; do
+    sudo cmp -s "/tmp/telemetry/$name" "{FACTORIO_TELEMETRY_DIR}/$name" || CHANGED=1
+done
+if [ -n "$CHANGED" ]; then
+{_STOP_COLLECTOR_SH}
+sudo install -m 644 /tmp/telemetry/* {FACTORIO_TELEMETRY_DIR}/
+fi
+# Exits at once if the collector is already running
+sudo setsid -f bash {FACTORIO_TELEMETRY_DIR}/collector.sh
+if command -v crontab > /dev/null; then
+    (sudo crontab -l 2>/dev/null | grep -v telemetry/collector.sh || true
+     echo "@reboot bash {FACTORIO_TELEMETRY_DIR}/collector.sh") | sudo crontab -
+fi
+rm -rf /tmp/telemetry
+""")
+    return f"""
+ssh {SSH_HOST} mkdir -p /tmp/telemetry
+scp {files} {SSH_HOST}:/tmp/telemetry/
+{install}"""
+
+
+def stop_telemetry_sh() -> str:
+    """Host script: stop the collector and remove it from boot. Collected metrics are kept"""
+    return (
+        _STOP_COLLECTOR_SH
+        + """
+if command -v crontab > /dev/null; then
+    (sudo crontab -l 2>/dev/null | grep -v telemetry/collector.sh || true) | sudo crontab -
+fi
+"""
+    )
+
+
+def metrics_report_sh(window_minutes: float, lag_ups: float) -> str:
+    """Percentiles of collected metrics (see `telemetry.report`), JSON goes to stdout"""
+    return (
+        f'ssh {SSH_HOST} sudo python3 {FACTORIO_TELEMETRY_DIR}/telemetry.py report --dir {FACTORIO_TELEMETRY_DIR} '
+        f'--window-minutes {window_minutes} --lag-ups {lag_ups}\n'
+    )
+
+
+def sync_mods_sh(desired: str, mod_list: str = '', prune: bool = True) -> str:
+    """Bring FACTORIO_MODS_DIR to the manifest `desired` (see `mods.py stage`), transferring only files the host
+    doesn't have. Sets MODS_CHANGED if anything on the host changed
+    """
+    transfer = on_host(f"""
+        sudo mkdir -p {FACTORIO_UPLOAD_DIR}/mods
+        sudo chown {HOST_USERNAME} {FACTORIO_UPLOAD_DIR} {FACTORIO_UPLOAD_DIR}/mods
+        """)
+    commit = on_host(f"""
+        cd {FACTORIO_UPLOAD_DIR}/mods
+        while read -r SHA256 NAME; do
+            echo "$SHA256  $SHA256.zip" | sha256sum -c --quiet -
+            sudo chown {FACTORIO_UID}:{FACTORIO_UID} "$SHA256.zip"
+            sudo mv "$SHA256.zip" "{FACTORIO_MODS_DIR}/$NAME"
+        done < /tmp/mod-sync/upload.txt
+        while read -r NAME; do
+            sudo rm -f "{FACTORIO_MODS_DIR}/$NAME"
+        done < /tmp/mod-sync/delete.txt
+        if [ -f /tmp/mod-sync/mod-list.json ]; then
+            sudo install -o {FACTORIO_UID} -g {FACTORIO_UID} -m 644 /tmp/mod-sync/mod-list.json {FACTORIO_MODS_DIR}/
+        fi
+        sudo python3 /tmp/mod-sync/mods.py manifest --dir {FACTORIO_MODS_DIR} > /dev/null
+        rm -rf /tmp/mod-sync
+        """)
+    script = f"""
+mkdir -p /tmp/mod-sync
+ssh {SSH_HOST} mkdir -p /tmp/mod-sync
+scp {MODS_TOOL_PATH} {mod_list} {SSH_HOST}:/tmp/mod-sync/
+ssh {SSH_HOST} sudo mkdir -p {FACTORIO_MODS_DIR}
+ssh {SSH_HOST} sudo python3 /tmp/mod-sync/mods.py manifest --dir {FACTORIO_MODS_DIR} > /tmp/mod-sync/current.json
+python3 {MODS_TOOL_PATH} diff --desired {desired} --current /tmp/mod-sync/current.json \\
+    --upload /tmp/mod-sync/upload.txt --delete /tmp/mod-sync/delete.txt
+"""
+    if not prune:
+        script += ': > /tmp/mod-sync/delete.txt\n'
+    script += 'MODS_CHANGED=""\n'
+    if mod_list:
+        script += f"""
+if ! ssh {SSH_HOST} sudo cat {FACTORIO_MODS_DIR}/mod-list.json 2>/dev/null | cmp -s - {mod_list}; then
+    MODS_CHANGED=1
+fi
+"""
+    return (
+        script
+        + f"""
+if [ -s /tmp/mod-sync/upload.txt ] || [ -s /tmp/mod-sync/delete.txt ]; then
+    MODS_CHANGED=1
+fi
+if [ -n "$MODS_CHANGED" ]; then
+{transfer}
+    # Staged under their sha256: names from mod zips never reach a remote path. Transfers are multiplexed over
+    # the connection of `ssh_config`, so parallel files cost no extra handshakes
+    cut -d ' ' -f 1 /tmp/mod-sync/upload.txt \\
+        | xargs -r -P {MOD_SYNC_PARALLELISM} -I '{{}}' scp -q '{MOD_CACHE_DIR}/sha256/{{}}.zip' \\
+            '{SSH_HOST}:{FACTORIO_UPLOAD_DIR}/mods/{{}}.zip'
+    scp /tmp/mod-sync/upload.txt /tmp/mod-sync/delete.txt {SSH_HOST}:/tmp/mod-sync/
+{commit}
+else
+    echo "Mods on the server are up to date"
+    ssh {SSH_HOST} rm -rf /tmp/mod-sync
+fi
+"""
+    )
+
+
+def tail_logs_sh(offset_file: str, since: str = '', pattern: str = '', max_lines: int = 1000, timestamps: bool = False):
+    """New lines of Factorio container logs since the offset in `offset_file` (or `since`, a docker logs --since
+    value), updating the offset. Filtering and truncation happen on the host, new lines go to stdout
+    """
+    # Timestamps of `docker logs` are fixed width, so they compare as strings. --since is inclusive: lines at the
+    # offset itself were read already
+    read_logs = on_host(
+        FACTORIO_CONTAINER_ID_SH
+        + dedent(f"""
+        if [ -z "$CONTAINER_ID" ]; then
+            echo "Factorio container not found" >&2
+            exit 1
+        fi
+        SINCE={shlex.quote(since)}
+        AFTER=''
+        if [ -z "$SINCE" ] && [ "$1" = "$CONTAINER_ID" ]; then
+            SINCE="$2"
+            AFTER="$2"
+        fi
+        LAST="$(mktemp)"
+        docker logs --timestamps ${{SINCE:+--since "$SINCE"}} "$CONTAINER_ID" 2>&1 \\
+            | awk -v after="$AFTER" -v last="$LAST" \\
+                'BEGIN {{ ts = after }} $1 <= after {{ next }} {{ ts = $1; print }} END {{ print ts > last }}' \\
+            | {'cat' if timestamps else 'cut -d " " -f 2-'} \\
+            | {{ grep -E -- {shlex.quote(pattern or '.')} || [ $? = 1 ]; }} \\
+            | tail -n {max_lines}
+        echo "#offset $CONTAINER_ID $(cat "$LAST")"
+        rm -f "$LAST"
+        """),
+        '"$OFFSET_ID"',
+        '"$OFFSET_TS"',
+    )
+    # Run with plain `bash -c`: a failed read must not reset the offset
+    return f"""
+set -euo pipefail
+OFFSET_ID=''
+OFFSET_TS=''
+if [ -f {offset_file} ]; then
+    read -r OFFSET_ID OFFSET_TS < {offset_file} || true
+fi
+{{
+{read_logs}}} > /tmp/logs.txt
+LAST_LINE="$(tail -n 1 /tmp/logs.txt)"
+if [[ "$LAST_LINE" != '#offset '* ]]; then
+    echo "No read offset in the host output, keeping the previous one" >&2
+    exit 1
+fi
+echo "${{LAST_LINE#'#offset '}}" > {offset_file}.tmp
+mv {offset_file}.tmp {offset_file}
+head -n -1 /tmp/logs.txt
+"""
+
+
+def save_staging_sh(size_mb: int, flush_interval: float) -> str:
+    """`staging.sh`, run as root on `start-save-staging`/`stop-save-staging` and on boot:
+
+    `enable` mounts a tmpfs over FACTORIO_SAVES_DIR (the data disk one stays at FACTORIO_SAVES_DISK_DIR), fills it
+    from the disk and starts the flusher (see `storage.flush`); `disable` flushes what is left and unmounts it.
+    The Factorio container sees only mounts made before its start: a running one is stopped for the change and
+    started again
+    """
+    flush = (
+        f'python3 {FACTORIO_SAVE_STAGING_DIR}/storage.py flush --src {FACTORIO_SAVES_DIR} '
+        f'--dst {FACTORIO_SAVES_DISK_DIR} --state-dir {FACTORIO_SAVE_STAGING_DIR} --interval {flush_interval}'
+    )
+    return dedent(f"""
+        set -Eeuo pipefail
+        SAVES={FACTORIO_SAVES_DIR}
+        DISK={FACTORIO_SAVES_DISK_DIR}
+        DIR={FACTORIO_SAVE_STAGING_DIR}
+        # One run at a time (e.g. on boot and from `start-save-staging`)
+        exec 9> "$DIR/staging.lock"
+        flock 9
+
+        find_factorio () {{
+            {FACTORIO_CONTAINER_ID_SH.strip()}
+            RUNNING=''
+            if [ -n "$CONTAINER_ID" ] && docker ps -q | grep -qx "$CONTAINER_ID"; then
+                RUNNING=1
+            fi
+        }}
+
+        stop_factorio () {{
+            [ -z "$RUNNING" ] || docker stop "$CONTAINER_ID"
+        }}
+
+        start_factorio () {{
+            [ -z "$RUNNING" ] || docker start "$CONTAINER_ID"
+        }}
+
+        # A running flusher holds flusher.lock, until its last pass is done
+        start_flusher () {{
+            flock -n "$DIR/flusher.lock" true || return 0
+            rm -f "$DIR/flusher.pid"
+            setsid -f {flush} >> "$DIR/flusher.log" 2>&1 < /dev/null 9>&-
+            for i in $(seq 100); do
+                [ ! -s "$DIR/flusher.pid" ] || return 0
+                sleep 0.1
+            done
+            echo "Flusher did not start, see $DIR/flusher.log" >&2
+            exit 1
+        }}
+
+        stop_flusher () {{
+            if ! flock -n "$DIR/flusher.lock" true; then
+                kill "$(cat "$DIR/flusher.pid")"
+                flock "$DIR/flusher.lock" true
+            fi
+        }}
+
+        rollback () {{
+            ! mountpoint -q "$SAVES" || umount "$SAVES"
+            ! mountpoint -q "$DISK" || umount "$DISK"
+            start_factorio
+        }}
+
+        enable () {{
+            if mountpoint -q "$SAVES"; then
+                mount -o remount,size={size_mb}m "$SAVES"
+                start_flusher
+                return
+            fi
+            mkdir -p "$SAVES" "$DISK"
+            USED_MB="$(( $(du -sk --exclude='*.tmp.zip' "$SAVES" | cut -f 1) / 1024 ))"
+            if [ "$USED_MB" -gt {size_mb * 8 // 10} ]; then
+                echo "Saves take $USED_MB MB: more than 80% of the {size_mb} MB tmpfs" >&2
+                exit 1
+            fi
+            find_factorio
+            stop_factorio
+            trap rollback ERR
+            mount --bind "$SAVES" "$DISK"
+            mount -t tmpfs -o size={size_mb}m,mode=0755,uid={FACTORIO_UID},gid={FACTORIO_UID} factorio-saves "$SAVES"
+            cp -a "$DISK"/. "$SAVES"/
+            trap - ERR
+            start_flusher
+            start_factorio
+        }}
+
+        disable () {{
+            if ! mountpoint -q "$SAVES"; then
+                stop_flusher
+                return
+            fi
+            find_factorio
+            stop_factorio
+            trap start_factorio ERR
+            stop_flusher
+            # Catches up on what the flusher missed, e.g. while it wasn't running
+            {flush} --once
+            umount "$SAVES"
+            umount "$DISK"
+            trap - ERR
+            start_factorio
+        }}
+
+        case "$1" in
+            enable) enable ;;
+            disable) disable ;;
+            stop-flusher) stop_flusher ;;
+            boot)
+                # The container of opentofu/vm.tf is started on boot too: the tmpfs goes under it afterwards
+                for i in $(seq 120); do
+                    docker ps -a -q 2>/dev/null | grep -q . && break
+                    sleep 1
+                done
+                enable ;;
+        esac
+    """)
+
+
+def start_save_staging_sh() -> str:
+    """Install `storage.py` and `staging.sh` on the host and enable save staging, restarting the flusher if they
+    changed. If the tmpfs wasn't mounted yet, waits until the restarted server is ready. Enabled on boot by cron
+    where the host has it
+    """
+    install = on_host(f"""
+sudo mkdir -p {FACTORIO_SAVE_STAGING_DIR}
+CHANGED=''
+for name in storage.py staging.sh; do
+    sudo cmp -s "/tmp/save-staging/$name" "{FACTORIO_SAVE_STAGING_DIR}/$name" || CHANGED=1
+done
+if [ -n "$CHANGED" ] && [ -f {FACTORIO_SAVE_STAGING_DIR}/staging.sh ]; then
+    sudo bash {FACTORIO_SAVE_STAGING_DIR}/staging.sh stop-flusher
+fi
+sudo install -m 644 /tmp/save-staging/* {FACTORIO_SAVE_STAGING_DIR}/
+rm -rf /tmp/save-staging
+{FACTORIO_CONTAINER_ID_SH}
+STAGED=''
+! mountpoint -q {FACTORIO_SAVES_DIR} || STAGED=1
+STARTED_AT="$(date -u +%Y-%m-%dT%H:%M:%S)"
+sudo bash {FACTORIO_SAVE_STAGING_DIR}/staging.sh enable
+if command -v crontab > /dev/null; then
+    (sudo crontab -l 2>/dev/null | grep -v save-staging/staging.sh || true
+     echo "@reboot bash {FACTORIO_SAVE_STAGING_DIR}/staging.sh boot >> {FACTORIO_SAVE_STAGING_DIR}/flusher.log 2>&1") \
+        | sudo crontab -
+fi
+if [ -z "$STAGED" ] && [ -n "$CONTAINER_ID" ] && docker ps -q | grep -qx "$CONTAINER_ID"; then
+{_WAIT_READY_SH}
+    if [ -z "$READY" ]; then
+        echo "Factorio is not ready after {FACTORIO_READY_TIMEOUT}s on the staged saves, last logs:" >&2
+        docker logs --tail 50 "$CONTAINER_ID" >&2
+        exit 1
+    fi
+fi
+""")
+    return f"""
+ssh {SSH_HOST} mkdir -p /tmp/save-staging
+scp {STORAGE_TOOL_PATH} {SSH_HOST}:/tmp/save-staging/storage.py
+scp {SAVE_STAGING_SCRIPT_PATH} {SSH_HOST}:/tmp/save-staging/staging.sh
+{install}"""
+
+
+def stop_save_staging_sh() -> str:
+    """Host script: flush staged saves to the data disk, unmount the tmpfs and remove staging from boot. A running
+    Factorio container is restarted on the disk saves and awaited
+    """
+    return (
+        FACTORIO_CONTAINER_ID_SH
+        + dedent(f"""
+        if [ ! -f {FACTORIO_SAVE_STAGING_DIR}/staging.sh ]; then
+            echo "Save staging is not installed"
+            exit 0
+        fi
+        STAGED=''
+        ! mountpoint -q {FACTORIO_SAVES_DIR} || STAGED=1
+        STARTED_AT="$(date -u +%Y-%m-%dT%H:%M:%S)"
+        sudo bash {FACTORIO_SAVE_STAGING_DIR}/staging.sh disable
+        if command -v crontab > /dev/null; then
+            (sudo crontab -l 2>/dev/null | grep -v save-staging/staging.sh || true) | sudo crontab -
+        fi
+        if [ -z "$STAGED" ] || [ -z "$CONTAINER_ID" ] || ! docker ps -q | grep -qx "$CONTAINER_ID"; then
+            exit 0
+        fi
+    """)
+        + _WAIT_READY_SH
+        + dedent(f"""
+        if [ -z "$READY" ]; then
+            echo "Factorio is not ready after {FACTORIO_READY_TIMEOUT}s on the disk saves, last logs:" >&2
+            docker logs --tail 50 "$CONTAINER_ID" >&2
+            exit 1
+        fi
+    """)
+    )
+
+
+def benchmark_disk_sh(size_mb: int, random_writes: int, runs: int) -> str:
+    """Run `storage.py bench` on the data disk of the host, JSON report goes to stdout. Autosave-sized writes are
+    compared with /dev/shm, a tmpfs like the one of save staging
+    """
+    args = [
+        f'--dir {FACTORIO_DATA_DIR}',
+        f'--saves-dir {FACTORIO_SAVES_DIR}',
+        '--compare-dir /dev/shm',
+        f'--size-mb {size_mb}',
+        f'--random-writes {random_writes}',
+        f'--runs {runs}',
+    ]
+    return f"""
+scp -q {STORAGE_TOOL_PATH} {SSH_HOST}:/tmp/storage.py
+ssh {SSH_HOST} sudo python3 /tmp/storage.py bench {' '.join(args)}
+"""
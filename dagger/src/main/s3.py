@@ -0,0 +1,114 @@
+"""Minimal S3 client (AWS Signature V4) on top of stdlib: enough for Yandex Object Storage and MinIO"""
+
+import hashlib
+import hmac
+import typing as tp
+import urllib.error
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+EMPTY_SHA256 = hashlib.sha256(b'').hexdigest()
+_S3_NS = '{http://s3.amazonaws.com/doc/2006-03-01/}'
+
+
+class S3Error(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f'S3 error {status}: {message}')
+        self.status = status
+
+
+@dataclass(frozen=True)
+class S3Bucket:
+    endpoint: str
+    bucket: str
+    access_key: str
+    secret_key: str
+    region: str
+    timeout: float = 60.0
+
+    def _request(
+        self,
+        method: str,
+        key: str = '',
+        query: tp.Optional[dict[str, str]] = None,
+        body: bytes = b'',
+        body_sha256: tp.Optional[str] = None,
+    ) -> tp.Any:
+        url = urllib.parse.urlsplit(self.endpoint)
+        path = '/' + urllib.parse.quote(f'{self.bucket}/{key}' if key else self.bucket, safe='/-_.~')
+        query_string = urllib.parse.urlencode(sorted((query or {}).items()), quote_via=urllib.parse.quote)
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        payload_hash = body_sha256 or hashlib.sha256(body).hexdigest()
+        headers = {'host': url.netloc, 'x-amz-content-sha256': payload_hash, 'x-amz-date': amz_date}
+
+        signed_headers = ';'.join(sorted(headers))
+        canonical_request = '\n'.join(
+            [method, path, query_string]
+            + [f'{k}:{headers[k]}' for k in sorted(headers)]
+            + ['', signed_headers, payload_hash]
+        )
+        scope = f'{now:%Y%m%d}/{self.region}/s3/aws4_request'
+        string_to_sign = '\n'.join(
+            ['AWS4-HMAC-SHA256', amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()]
+        )
+        signing_key = f'AWS4{self.secret_key}'.encode()
+        for part in (f'{now:%Y%m%d}', self.region, 's3', 'aws4_request'):
+            signing_key = hmac.new(signing_key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        headers['authorization'] = (
+            f'AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, '
+            f'SignedHeaders={signed_headers}, Signature={signature}'
+        )
+        if method == 'PUT':
+            headers['content-type'] = 'application/octet-stream'  # urllib defaults to form data otherwise
+
+        request = urllib.request.Request(
+            f'{url.scheme}://{url.netloc}{path}' + (f'?{query_string}' if query_string else ''),
+            data=body if method == 'PUT' else None,
+            headers=headers,
+            method=method,
+        )
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            raise S3Error(e.code, e.read().decode(errors='replace') or str(e.reason)) from None
+
+    def put(self, key: str, data: bytes, sha256: tp.Optional[str] = None):
+        with self._request('PUT', key, body=data, body_sha256=sha256):
+            pass
+
+    def get(self, key: str) -> bytes:
+        with self._request('GET', key, body_sha256=EMPTY_SHA256) as response:
+            return response.read()
+
+    def delete(self, key: str):
+        """Deleting a missing key is not an error"""
+        with self._request('DELETE', key, body_sha256=EMPTY_SHA256):
+            pass
+
+    def exists(self, key: str) -> bool:
+        try:
+            with self._request('HEAD', key, body_sha256=EMPTY_SHA256):
+                return True
+        except S3Error as e:
+            if e.status == 404:
+                return False
+            raise
+
+    def list_keys(self, prefix: str = '') -> tp.Iterator[str]:
+        token = None
+        while True:
+            query = {'list-type': '2', 'prefix': prefix}
+            if token:
+                query['continuation-token'] = token
+            with self._request('GET', query=query, body_sha256=EMPTY_SHA256) as response:
+                root = ET.fromstring(response.read())
+            for item in root.iter(f'{_S3_NS}Contents'):
+                yield tp.cast(str, item.findtext(f'{_S3_NS}Key'))
+            token = root.findtext(f'{_S3_NS}NextContinuationToken')
+            if root.findtext(f'{_S3_NS}IsTruncated') != 'true' or not token:
+                return
@@ -0,0 +1,191 @@
+"""Factorio save inspection without extracting the archive
+
+A save is a zip with one top-level directory: `level-init.dat` and `level.dat<N>` (zlib streams), scripts, preview.
+Sizes come from the zip central directory; version and mods from the header every level file starts with, which is
+inflated incrementally only as far as it is parsed. Memory use does not depend on the save size.
+
+Header layout (little endian, "optimized" integers take one byte if it is below 255):
+    u16 x4 version, u8 (since 0.18), campaign, level name, base mod (strings), u8 difficulty, bool finished,
+    bool player won, next level (string), bool x3, bool allow non-admin debug options (since 0.17),
+    optimized u16 x3 + u16 "loaded from" version, u8 allowed commands,
+    optimized u32 mod count, then per mod: name (string), optimized u16 x3 version, u32 crc
+Only the version is guaranteed to stay at its place: mods are reported when the rest parses sanely.
+"""
+
+import re
+import struct
+import typing as tp
+import zipfile
+import zlib
+from pathlib import Path
+
+import pydantic
+
+_LEVEL_FILE = re.compile(r'^level(-init)?\.dat\d*$')
+_MOD_NAME = re.compile(r'^[\w.\- ]+$')
+_READ_SIZE = 16 * 1024
+# Header with a few hundred mods is a few KiB: anything longer is not a header we understand
+_MAX_HEADER_SIZE = 1024 * 1024
+_MAX_MODS = 10000
+
+
+class SaveFormatError(ValueError):
+    pass
+
+
+class ModInfo(pydantic.BaseModel):
+    name: str
+    version: str
+    crc: int
+
+
+class SaveInfo(pydantic.BaseModel):
+    name: str
+    version: str
+    mods: tp.Optional[list[ModInfo]]  # None: header layout is not known for this version
+    entries: int
+    compressed_size: int
+    uncompressed_size: int
+    level_size: int  # level-init.dat + level.dat<N> as stored in the zip: proxy for map size
+
+    @property
+    def version_tuple(self) -> tuple[int, ...]:
+        return parse_version(self.version)
+
+
+def parse_version(version: str) -> tuple[int, ...]:
+    return tuple(int(part) for part in version.split('.'))
+
+
+class _HeaderReader:
+    """Reads the beginning of a (possibly zlib compressed) level file, inflating no more than was asked for"""
+
+    def __init__(self, stream: tp.BinaryIO):
+        self._stream = stream
+        self._buffer = bytearray()
+        self._consumed = 0
+        first = stream.read(_READ_SIZE)
+        # 0x78 is the zlib header byte for every compression level; plain headers start with the major version
+        self._inflater = zlib.decompressobj() if first[:1] == b'\x78' else None
+        self._pending = first
+
+    def _fill(self, size: int):
+        while len(self._buffer) - self._consumed < size:
+            if self._consumed + size > _MAX_HEADER_SIZE:
+                raise SaveFormatError('Level header is too long')
+            if self._inflater is not None and self._inflater.unconsumed_tail:
+                data = self._inflater.decompress(self._inflater.unconsumed_tail, _READ_SIZE)
+            else:
+                chunk, self._pending = self._pending or self._stream.read(_READ_SIZE), b''
+                if not chunk:
+                    raise SaveFormatError('Level header is truncated')
+                data = chunk if self._inflater is None else self._inflater.decompress(chunk, _READ_SIZE)
+            self._buffer += data
+
+    def read(self, size: int) -> bytes:
+        self._fill(size)
+        data = bytes(self._buffer[self._consumed : self._consumed + size])
+        self._consumed += size
+        return data
+
+    def unpack(self, fmt: str) -> tuple:
+        return struct.unpack(f'<{fmt}', self.read(struct.calcsize(f'<{fmt}')))
+
+    def optimized(self, wide: str) -> int:
+        (value,) = self.unpack('B')
+        return value if value != 0xFF else self.unpack(wide)[0]
+
+    def string(self) -> str:
+        return self.read(self.optimized('I')).decode(errors='replace')
+
+
+def _read_header(reader: _HeaderReader) -> tuple[str, tp.Optional[list[ModInfo]]]:
+    version = reader.unpack('4H')
+    try:
+        if version[:2] >= (0, 18):
+            reader.read(1)
+        for _ in range(3):  # campaign, level name, base mod
+            reader.string()
+        reader.read(3)  # difficulty, finished, player won
+        reader.string()  # next level
+        reader.read(4 if version[:2] >= (0, 17) else 3)
+        for _ in range(3):
+            reader.optimized('H')
+        reader.read(3)  # loaded from build, allowed commands
+        count = reader.optimized('I')
+        if count > _MAX_MODS:
+            return _format_version(version), None
+        mods = []
+        for _ in range(count):
+            name = reader.string()
+            mod_version = '.'.join(str(reader.optimized('H')) for _ in range(3))
+            (crc,) = reader.unpack('I')
+            if not _MOD_NAME.match(name):
+                return _format_version(version), None
+            mods.append(ModInfo(name=name, version=mod_version, crc=crc))
+    except (SaveFormatError, zlib.error):
+        return _format_version(version), None
+    # Every save depends on `base`: anything else means the layout differs for this version
+    return _format_version(version), mods if mods and mods[0].name == 'base' else None
+
+
+def _format_version(version: tuple[int, ...]) -> str:
+    return '.'.join(str(part) for part in version[:3])
+
+
+def inspect_save(path: Path) -> SaveInfo:
+    """Validate save structure and read its summary. Raises SaveFormatError if it is not a loadable save"""
+    try:
+        archive = zipfile.ZipFile(path)
+    except (zipfile.BadZipFile, OSError) as e:
+        raise SaveFormatError(f'{path.name} is not a zip archive: {e}') from None
+    with archive:
+        entries = [info for info in archive.infolist() if not info.is_dir()]
+        roots = {info.filename.split('/', 1)[0] for info in entries}
+        if len(roots) != 1 or any('/' not in info.filename for info in entries):
+            raise SaveFormatError(f'{path.name}: expected exactly one top-level directory, got {sorted(roots)}')
+        levels = {info.filename.split('/', 1)[1]: info for info in entries}
+        levels = {name: info for name, info in levels.items() if _LEVEL_FILE.match(name)}
+        # Since 1.0 header is in level-init.dat (and repeated in level.dat0), older saves have only level.dat
+        header_entry = next((levels[n] for n in ('level-init.dat', 'level.dat0', 'level.dat') if n in levels), None)
+        if header_entry is None:
+            raise SaveFormatError(f'{path.name}: no level data (level-init.dat / level.dat) in the archive')
+        try:
+            with archive.open(header_entry) as stream:
+                version, mods = _read_header(_HeaderReader(stream))
+        except (zipfile.BadZipFile, zlib.error, struct.error, EOFError) as e:
+            raise SaveFormatError(f'{path.name}: broken {header_entry.filename}: {e}') from None
+        return SaveInfo(
+            name=path.name,
+            version=version,
+            mods=mods,
+            entries=len(entries),
+            compressed_size=sum(info.compress_size for info in entries),
+            uncompressed_size=sum(info.file_size for info in entries),
+            level_size=sum(info.file_size for info in levels.values()),
+        )
+
+
+def write_minimal_save(path: Path, version: tuple[int, ...], note: str = ''):
+    """Smallest archive `inspect_save` accepts (no playable map): for simulation and benchmarks of the pipeline"""
+    header = struct.pack('<4HB', *version[:3], 0, 0)
+    # Empty campaign and level, `base` mod, flags, empty next level, more flags, "loaded from" version, commands
+    header += b'\x00\x00\x04base' + b'\x00' * 3 + b'\x00' + b'\x00' * 4 + b'\x00' * 3 + b'\x00' * 3
+    header += b'\x01\x04base' + bytes(version[:3]) + struct.pack('<I', 0)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(f'{path.stem}/level-init.dat', zlib.compress(header))
+        archive.writestr(f'{path.stem}/note.txt', note)
+
+
+def check_compatible(info: SaveInfo, server_version: tp.Optional[tuple[int, ...]]):
+    """Raises SaveFormatError if the server can't load the save. Unknown server version (e.g. `latest` tag) passes"""
+    if server_version is not None and info.version_tuple > server_version:
+        raise SaveFormatError(
+            f'{info.name} is saved by Factorio {info.version}, server runs {".".join(map(str, server_version))}'
+        )
+
+
+def image_tag_version(tag: str) -> tp.Optional[tuple[int, ...]]:
+    """Factorio version of a factoriotools/factorio image tag, e.g. `stable-2.0.13` -> (2, 0, 13)"""
+    match = re.search(r'(\d+)\.(\d+)\.(\d+)', tag)
+    return tuple(int(part) for part in match.groups()) if match else None
@@ -0,0 +1,85 @@
+"""Simulation mode: fake `yc`/`tofu` (see `fakes/`) and a local stand-in for the server host
+
+The fake cloud keeps its state in a cache volume, so a sequence of calls behaves like against the real cloud:
+`apply-tofu` creates the instance, `resolve-public-ip` finds it, `upload-save` reaches it over SSH.
+The host is an sshd service with the same user, sudo rules and data layout as the real VM, a fake `docker`,
+fake mounts and a fake Factorio RCON server.
+"""
+
+from pathlib import Path
+
+import dagger
+from dagger import dag
+
+from main.config import (
+    FACTORIO_DATA_DIR,
+    FACTORIO_IMAGE,
+    FACTORIO_IMAGE_TAG,
+    FACTORIO_SAVE_STAGING_DIR,
+    FACTORIO_SAVES_DIR,
+    HOST_USERNAME,
+)
+from main.utils import create_user, install_packages, withable
+
+FAKES_DIR = Path(__file__).parent / 'fakes'
+FAKE_CLOUD_STATE_DIR = '/var/lib/fake-cloud'
+# Address of the fake instance: the host service is bound under this alias in `ssh_container`
+SIMULATED_HOST = 'simulated-host'
+
+_SUDOERS = f'{HOST_USERNAME} ALL=(ALL) NOPASSWD:ALL\n'  # like cloud-init user-data in opentofu/vm.tf
+# Key pair the fake tofu outputs is authorized on start, as cloud-init does with the real one
+_ENTRYPOINT = f"""
+install -D -o {HOST_USERNAME} -m 600 {FAKE_CLOUD_STATE_DIR}/tofu/id_ed25519.pub \\
+    /home/{HOST_USERNAME}/.ssh/authorized_keys || true
+fake-rcon &
+# Fake mounts survive restarts of the host, processes don't: the flusher of save staging starts again as on boot
+if mountpoint -q {FACTORIO_SAVES_DIR}; then
+    bash {FACTORIO_SAVE_STAGING_DIR}/staging.sh enable || true
+fi
+exec /usr/sbin/sshd -D -e
+"""
+
+
+def _volume(name: str, seed: str) -> dagger.CacheVolume:
+    return dag.cache_volume(f'{name}-{seed}' if seed else name)
+
+
+@withable
+def with_fake_cloud(c: dagger.Container, seed: str = '') -> dagger.Container:
+    """Put fake yc and tofu first in PATH. Every `seed` gets its own empty fake cloud"""
+    for name in ('yc', 'tofu'):
+        c = c.with_new_file(f'/opt/fakes/bin/{name}', (FAKES_DIR / name).read_text(), permissions=0o755)
+    return (
+        c.with_mounted_cache(FAKE_CLOUD_STATE_DIR, _volume('fake-cloud', seed))
+        .with_env_variable('FAKE_CLOUD_STATE_DIR', FAKE_CLOUD_STATE_DIR)
+        .with_env_variable('FAKE_INSTANCE_ADDRESS', SIMULATED_HOST)
+        .with_env_variable('PATH', '/opt/fakes/bin:$PATH', expand=True)
+    )
+
+
+def _fake_mounts(c: dagger.Container) -> dagger.Container:
+    for name in ('mount', 'umount', 'mountpoint'):
+        c = c.with_new_file(f'/usr/local/bin/{name}', (FAKES_DIR / 'host' / 'mount').read_text(), permissions=0o755)
+    return c
+
+
+def simulated_host(base: dagger.Container, seed: str = '') -> dagger.Service:
+    """SSH server with `HOST_USERNAME` (passwordless sudo, fake tofu key authorized), data dir and fake docker"""
+    return (
+        base.with_(install_packages(['openssh-server', 'sudo']))
+        .with_(create_user(HOST_USERNAME))
+        .with_new_file(f'/etc/sudoers.d/{HOST_USERNAME}', _SUDOERS, permissions=0o440)
+        .with_new_file('/etc/ssh/sshd_config.d/simulated.conf', 'PasswordAuthentication no\nStrictModes no\n')
+        .with_new_file('/etc/fake-docker/image', f'{FACTORIO_IMAGE}:{FACTORIO_IMAGE_TAG}\n')
+        .with_new_file('/usr/local/bin/docker', (FAKES_DIR / 'host' / 'docker').read_text(), permissions=0o755)
+        .with_new_file('/usr/local/bin/fake-rcon', (FAKES_DIR / 'host' / 'rcon').read_text(), permissions=0o755)
+        .with_(_fake_mounts)
+        .with_exec(['bash', '-c', 'ssh-keygen -A && mkdir -p /run/sshd'])
+        .with_mounted_cache(FACTORIO_DATA_DIR, _volume('simulated-host-data', seed))
+        .with_mounted_cache('/var/lib/fake-docker', _volume('simulated-host-docker', seed))
+        .with_mounted_cache('/var/lib/fake-mounts', _volume('simulated-host-mounts', seed))
+        .with_mounted_cache(FAKE_CLOUD_STATE_DIR, _volume('fake-cloud', seed))
+        .with_exposed_port(22)
+        .with_exec(['bash', '-c', _ENTRYPOINT])
+        .as_service()
+    )
@@ -0,0 +1,293 @@
+"""Storage of the server host: save staging flusher and data disk benchmark
+
+Stdlib only: the file is copied to the server host and run there as root:
+
+    python3 storage.py flush --src /factorio-data/saves --dst /var/lib/factorio-saves-disk --state-dir DIR --interval 2
+    python3 storage.py bench --dir /factorio-data --saves-dir /factorio-data/saves --compare-dir /dev/shm
+
+`flush` copies complete saves from the tmpfs `--src` to the data disk `--dst`. Factorio writes a save to
+`<name>.tmp.zip` and renames it when done, so only other zips are copied, and only once they are unchanged for one
+`--interval` (a save restored or uploaded by `cp` is still being written otherwise). A copy goes to a hidden temporary
+file, is fsynced and renamed over the old save, then the directory is fsynced: after a crash the disk has either the
+old or the new save, never a part of one. Deleted saves are deleted on the disk too, but an empty `--src` never
+empties the disk. Only one flusher runs per `--state-dir`; on SIGTERM it flushes everything complete and exits.
+
+`bench` measures the filesystem of `--dir`: buffered sequential writes with one fsync, synchronous (O_DSYNC)
+sequential and random writes, and writing a file of the newest save size the way a crash-safe autosave would.
+"""
+
+import argparse
+import fcntl
+import json
+import math
+import os
+import random
+import shutil
+import signal
+import sys
+import time
+import typing as tp
+from pathlib import Path
+
+# Factorio writes saves here first
+TMP_SUFFIX = '.tmp.zip'
+FLUSHING_SUFFIX = '.flushing'
+# Warn when the staging tmpfs is fuller than this: a save that doesn't fit fails and the game keeps running unsaved
+TMPFS_HIGH = 0.8
+PERCENTILES = (50, 90, 99)
+
+_BLOCK = 1024 * 1024
+_RANDOM_BLOCK = 4096
+MB = 1024 * 1024
+
+Signature = tuple[int, int]  # size, mtime_ns
+
+
+def saves(directory: Path) -> dict[str, Signature]:
+    """Complete saves of `directory`"""
+    found = {}
+    for path in directory.glob('*.zip'):
+        if path.name.endswith(TMP_SUFFIX):
+            continue
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue  # Replaced or deleted by the game in the meantime
+        found[path.name] = (stat.st_size, stat.st_mtime_ns)
+    return found
+
+
+def _fsync_dir(directory: Path):
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def flush_file(src: Path, dst: Path, name: str) -> Signature:
+    """Crash-safe copy of `src/name` to `dst/name`, keeping owner and mtime. Returns the signature of the copy"""
+    tmp = dst / f'.{name}{FLUSHING_SUFFIX}'
+    with open(src / name, 'rb') as f, open(tmp, 'wb') as out:
+        # The game replaces saves by rename: the open file stays one consistent save
+        stat = os.fstat(f.fileno())
+        shutil.copyfileobj(f, out, _BLOCK)
+        out.flush()
+        os.fchown(out.fileno(), stat.st_uid, stat.st_gid)
+        os.utime(out.fileno(), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.fsync(out.fileno())
+    os.replace(tmp, dst / name)
+    _fsync_dir(dst)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class Flusher:
+    def __init__(self, src: Path, dst: Path):
+        if os.path.samefile(src, dst):
+            raise RuntimeError(f'{src} and {dst} are the same directory: saves are not staged')
+        self.src = src
+        self.dst = dst
+        for leftover in dst.glob(f'.*{FLUSHING_SUFFIX}'):
+            leftover.unlink()  # Interrupted copies
+        # Copies keep mtimes: what the disk already has is not copied again
+        self.flushed = saves(dst)
+        self.seen: dict[str, Signature] = {}
+        self.missing: set[str] = set()
+        self.tmpfs_high = False
+
+    def step(self, final: bool = False):
+        """One pass. `final` flushes changed saves without waiting for them to settle"""
+        current = saves(self.src)
+        # Newest first: it is the one the server loads after a crash
+        for name, signature in sorted(current.items(), key=lambda item: item[1][1], reverse=True):
+            if self.flushed.get(name) == signature or (not final and self.seen.get(name) != signature):
+                continue
+            started = time.monotonic()
+            try:
+                self.flushed[name] = flush_file(self.src, self.dst, name)
+            except FileNotFoundError:
+                continue  # Replaced or deleted by the game in the meantime: the next pass sees the new one
+            except OSError as e:
+                print(f'Failed to flush {name}, retrying on the next pass: {e}', file=sys.stderr, flush=True)
+                continue
+            print(f'Flushed {name}: {signature[0] / MB:.1f} MB in {time.monotonic() - started:.2f}s', flush=True)
+        gone = set(self.flushed) - set(current)
+        if current:
+            # Deleted for two passes in a row: not a save being replaced by `rm` and `cp`
+            for name in gone if final else gone & self.missing:
+                (self.dst / name).unlink(missing_ok=True)
+                del self.flushed[name]
+                print(f'Deleted {name}', flush=True)
+            if gone & self.missing or (final and gone):
+                _fsync_dir(self.dst)
+        self.missing = gone
+        self.seen = current
+        self._check_tmpfs()
+
+    def _check_tmpfs(self):
+        fs = os.statvfs(self.src)
+        used = 1 - fs.f_bavail / fs.f_blocks if fs.f_blocks else 0
+        if used > TMPFS_HIGH and not self.tmpfs_high:
+            print(f'WARNING: staging tmpfs is {used:.0%} full: saves that do not fit fail', file=sys.stderr, flush=True)
+        self.tmpfs_high = used > TMPFS_HIGH
+
+
+def flush(args: argparse.Namespace) -> int:
+    state_dir = Path(args.state_dir)
+    state_dir.mkdir(parents=True, exist_ok=True)
+    with open(state_dir / 'flusher.lock', 'w') as lock:
+        if args.once:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            Flusher(Path(args.src), Path(args.dst)).step(final=True)
+            return 0
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print('Flusher is already running', file=sys.stderr)
+            return 0
+        # Blocked and waited for between passes: a handler could interrupt a pass halfway
+        signals = {signal.SIGTERM, signal.SIGINT}
+        signal.pthread_sigmask(signal.SIG_BLOCK, signals)
+        flusher = Flusher(Path(args.src), Path(args.dst))
+        # Written once the flusher is ready to be stopped: `staging.sh` waits for it
+        (state_dir / 'flusher.pid').write_text(str(os.getpid()))
+        print(f'Flushing {args.src} to {args.dst} every {args.interval:g}s', flush=True)
+        while signal.sigtimedwait(signals, args.interval) is None:
+            flusher.step()
+        flusher.step(final=True)
+    return 0
+
+
+def _summary(values_ms: list[float]) -> dict[str, float]:
+    ordered = sorted(values_ms)
+    summary = {'mean': round(sum(ordered) / len(ordered), 3)}
+    for p in PERCENTILES:
+        summary[f'p{p}'] = round(ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))], 3)
+    summary['max'] = round(ordered[-1], 3)
+    return summary
+
+
+def _sequential(path: Path, size: int, sync: bool) -> dict[str, tp.Any]:
+    block = os.urandom(_BLOCK)  # Incompressible, like saves
+    latencies = []
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | (os.O_DSYNC if sync else 0), 0o600)
+    try:
+        started = time.perf_counter()
+        for _ in range(size // _BLOCK):
+            write_started = time.perf_counter()
+            os.write(fd, block)
+            latencies.append((time.perf_counter() - write_started) * 1000)
+        fsync_started = time.perf_counter()
+        os.fsync(fd)
+        finished = time.perf_counter()
+    finally:
+        os.close(fd)
+    result: dict[str, tp.Any] = {'size_mb': size // MB, 'mb_per_s': round(size / MB / (finished - started), 1)}
+    if sync:
+        result['block_kb'] = _BLOCK // 1024
+        result['latency_ms'] = _summary(latencies)
+    else:
+        result['fsync_ms'] = round((finished - fsync_started) * 1000, 3)
+    return result
+
+
+def _random(path: Path, size: int, count: int) -> dict[str, tp.Any]:
+    block = os.urandom(_RANDOM_BLOCK)
+    blocks = size // _RANDOM_BLOCK
+    latencies = []
+    # Overwrites the written file: allocation is not measured
+    fd = os.open(path, os.O_WRONLY | os.O_DSYNC)
+    try:
+        started = time.perf_counter()
+        for _ in range(count):
+            write_started = time.perf_counter()
+            os.pwrite(fd, block, random.randrange(blocks) * _RANDOM_BLOCK)
+            latencies.append((time.perf_counter() - write_started) * 1000)
+        elapsed = time.perf_counter() - started
+    finally:
+        os.close(fd)
+    return {
+        'block_kb': _RANDOM_BLOCK // 1024,
+        'writes': count,
+        'iops': round(count / elapsed),
+        'latency_ms': _summary(latencies),
+    }
+
+
+def _save_write(directory: Path, size: int, runs: int) -> dict[str, tp.Any]:
+    """Write, fsync, rename and directory fsync, like a crash-safe save (see `flush_file`)"""
+    if shutil.disk_usage(directory).free < 2 * size:
+        return {'skipped': f'less than {2 * size / MB:.0f} MB free'}
+    block = os.urandom(_BLOCK)
+    latencies = []
+    tmp, target = directory / 'save.tmp', directory / 'save.zip'
+    for _ in range(runs):
+        started = time.perf_counter()
+        with open(tmp, 'wb') as out:
+            for _ in range(size // _BLOCK):
+                out.write(block)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, target)
+        _fsync_dir(directory)
+        latencies.append((time.perf_counter() - started) * 1000)
+    target.unlink()
+    return {'runs': runs, 'latency_ms': _summary(latencies)}
+
+
+def bench(args: argparse.Namespace) -> dict[str, tp.Any]:
+    directory = Path(args.dir) / '.disk-bench'
+    size = args.size_mb * MB
+    if shutil.disk_usage(args.dir).free < 2 * size:
+        raise RuntimeError(f'Less than {2 * args.size_mb} MB free on {args.dir}')
+    newest = max(saves(Path(args.saves_dir)).values(), key=lambda s: s[1], default=None) if args.saves_dir else None
+    save_size = max(_BLOCK, newest[0] // _BLOCK * _BLOCK) if newest else args.size_mb * MB // 4
+    report: dict[str, tp.Any] = {'dir': args.dir, 'save_size_mb': round(save_size / MB, 1)}
+    shutil.rmtree(directory, ignore_errors=True)
+    directory.mkdir()
+    try:
+        data = directory / 'data'
+        report['sequential_write'] = _sequential(data, size, sync=False)
+        report['sequential_sync_write'] = _sequential(data, size, sync=True)
+        report['random_sync_write'] = _random(data, size, args.random_writes)
+        data.unlink()
+        report['save_write'] = _save_write(directory, save_size, args.runs)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    if args.compare_dir:
+        compare = Path(args.compare_dir) / '.disk-bench'
+        shutil.rmtree(compare, ignore_errors=True)
+        compare.mkdir()
+        try:
+            report['save_write_compare'] = {'dir': args.compare_dir} | _save_write(compare, save_size, args.runs)
+        finally:
+            shutil.rmtree(compare, ignore_errors=True)
+    return report
+
+
+def main(args: argparse.Namespace) -> int:
+    try:
+        if args.command == 'flush':
+            return flush(args)
+        print(json.dumps(bench(args)))
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['flush', 'bench'])
+    parser.add_argument('--src')
+    parser.add_argument('--dst')
+    parser.add_argument('--state-dir')
+    parser.add_argument('--interval', type=float, default=2)
+    parser.add_argument('--once', action='store_true', help='One pass flushing everything complete')
+    parser.add_argument('--dir')
+    parser.add_argument('--saves-dir')
+    parser.add_argument('--compare-dir')
+    parser.add_argument('--size-mb', type=int, default=256)
+    parser.add_argument('--random-writes', type=int, default=2000)
+    parser.add_argument('--runs', type=int, default=3)
+    sys.exit(main(parser.parse_args()))
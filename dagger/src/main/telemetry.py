@@ -0,0 +1,356 @@
+"""Game server telemetry: sample collector and percentile reports
+
+Stdlib only: the file is copied to the server host next to rcon.py and run there as root:
+
+    python3 telemetry.py collect --dir /factorio-data/telemetry --interval 10 --password-file rconpw --image IMAGE
+    python3 telemetry.py report --dir /factorio-data/telemetry --window-minutes 60
+
+`collect` samples UPS, tick time and RCON latency, online players, CPU/memory of the Factorio container
+(`docker stats`) and throughput, latency and utilization of the disk holding `--data-dir` (/proc/diskstats). Only one
+collector runs per `--dir`. Samples wait in a bounded ring buffer (a failing disk can't grow memory) and every
+`--flush-interval` the current hour is rewritten into `metrics/<hour>.ftm`, a columnar file:
+
+    b'FTM1', u32 header size, JSON header {"columns": [...], "count": N},
+    then per column: u32 size, zlib-compressed little endian float64 array (NaN: not measured)
+
+UPS is game ticks over the trailing `--ups-window` seconds. Ticks come from `/time` (second precision, keeps
+achievements) or, with `--lua-ticks`, from `game.tick` (exact, but Lua commands disable achievements of the save).
+Tick time is wall time per game tick over the same window: 16.7 ms while the server keeps up with 60 UPS, the actual
+update time of a tick once it lags.
+"""
+
+import argparse
+import array
+import asyncio
+import collections
+import fcntl
+import json
+import math
+import os
+import re
+import signal
+import struct
+import subprocess
+import sys
+import time
+import typing as tp
+import zlib
+from pathlib import Path
+
+COLUMNS = (
+    'ts',
+    'ups',
+    'tick_ms',
+    'rcon_ms',
+    'players',
+    'cpu_percent',
+    'memory_bytes',
+    'disk_read_bps',
+    'disk_write_bps',
+    'disk_latency_ms',
+    'disk_util_percent',
+)
+PERCENTILES = (1, 10, 50, 90, 99)
+# Metrics compared between lagging and normal samples: which of them moves with UPS drops points to the cause
+LAG_FACTORS = ('cpu_percent', 'memory_bytes', 'disk_latency_ms', 'disk_util_percent', 'players', 'rcon_ms')
+
+_MAGIC = b'FTM1'
+_SIZE = struct.Struct('<I')
+_HOUR = 3600
+_TIME_UNITS = {'day': 86400, 'hour': 3600, 'minute': 60, 'second': 1}
+_MEMORY_UNITS = {'b': 1, 'kb': 1e3, 'kib': 1024, 'mb': 1e6, 'mib': 1024**2, 'gb': 1e9, 'gib': 1024**3}
+_NAN = float('nan')
+
+Row = dict[str, float]
+
+
+def write_columns(path: Path, rows: tp.Sequence[Row]):
+    header = json.dumps({'columns': list(COLUMNS), 'count': len(rows)}).encode()
+    parts = [_MAGIC, _SIZE.pack(len(header)), header]
+    for column in COLUMNS:
+        values = array.array('d', (row[column] for row in rows))
+        if sys.byteorder != 'little':
+            values.byteswap()
+        data = zlib.compress(values.tobytes())
+        parts += [_SIZE.pack(len(data)), data]
+    tmp = path.with_suffix('.tmp')
+    tmp.write_bytes(b''.join(parts))
+    os.replace(tmp, path)
+
+
+def read_columns(path: Path) -> dict[str, list[float]]:
+    data = path.read_bytes()
+    if data[:4] != _MAGIC:
+        raise ValueError(f'{path} is not a telemetry file')
+    (size,) = _SIZE.unpack_from(data, 4)
+    offset = 8 + size
+    header = json.loads(data[8:offset])
+    columns = {}
+    for column in header['columns']:
+        (size,) = _SIZE.unpack_from(data, offset)
+        values = array.array('d', zlib.decompress(data[offset + 4 : offset + 4 + size]))
+        if sys.byteorder != 'little':
+            values.byteswap()
+        columns[column] = values.tolist()
+        offset += 4 + size
+    # Files written before a column was added have no values for it
+    return {column: columns.get(column, [_NAN] * header['count']) for column in COLUMNS}
+
+
+def _rows(columns: dict[str, list[float]]) -> list[Row]:
+    return [dict(zip(COLUMNS, values)) for values in zip(*(columns[c] for c in COLUMNS))]
+
+
+def _hour_file(metrics_dir: Path, ts: float) -> Path:
+    return metrics_dir / f'{int(ts // _HOUR * _HOUR)}.ftm'
+
+
+def parse_game_time(text: str) -> tp.Optional[int]:
+    """Ticks from `/time` output, e.g. "1 day, 2 hours, 3 minutes and 4 seconds" """
+    parts = re.findall(r'(\d+)\s+(day|hour|minute|second)s?', text)
+    return sum(int(n) * _TIME_UNITS[unit] for n, unit in parts) * 60 if parts else None
+
+
+def parse_memory(text: str) -> float:
+    """Bytes from `docker stats` MemUsage, e.g. "1.2GiB / 7.7GiB" """
+    match = re.match(r'\s*([\d.]+)\s*([a-zA-Z]+)', text)
+    return float(match.group(1)) * _MEMORY_UNITS[match.group(2).lower()] if match else _NAN
+
+
+class Sampler:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.client: tp.Any = None
+        self.container_id = ''
+        self.ticks: collections.deque[tuple[float, int]] = collections.deque()
+        stat = os.stat(args.data_dir)
+        self.device = f'{os.major(stat.st_dev)} {os.minor(stat.st_dev)}'
+        self.disk: tp.Optional[tuple[float, list[int]]] = None
+
+    async def sample(self) -> Row:
+        now = time.time()
+        row = dict.fromkeys(COLUMNS, _NAN)
+        row['ts'] = now
+        row.update(await self._game(now))
+        row.update(await asyncio.to_thread(self._container))
+        row.update(self._disk(now))
+        return row
+
+    async def _game(self, now: float) -> Row:
+        import rcon  # next to this file on the host
+
+        if self.client is None:
+            try:
+                password = Path(self.args.password_file).read_text().strip()
+            except OSError:
+                return {}  # Factorio hasn't started yet
+            self.client = rcon.RconClient('127.0.0.1', self.args.port, password, timeout=self.args.interval / 2)
+        command = '/silent-command rcon.print(game.tick)' if self.args.lua_ticks else '/time'
+        started = time.monotonic()
+        try:
+            ticks_text, players_text = await self.client.batch([command, '/players online count'])
+        except rcon.RconError:
+            await self.client.close()
+            self.client = None
+            self.ticks.clear()
+            return {}
+        row = {'rcon_ms': (time.monotonic() - started) * 1000}
+        players = re.search(r'\((\d+)\)', players_text)
+        if players:
+            row['players'] = float(players.group(1))
+        ticks = int(ticks_text) if self.args.lua_ticks and ticks_text.strip().isdigit() else parse_game_time(ticks_text)
+        if row.get('players') == 0:
+            # Headless server pauses without players (auto_pause in server-settings.json): not a lag
+            ticks = None
+        if ticks is None or (self.ticks and ticks < self.ticks[-1][1]):
+            # Paused, unknown or another save was loaded: UPS window starts over
+            self.ticks.clear()
+        if ticks is not None:
+            self.ticks.append((now, ticks))
+            while len(self.ticks) > 2 and now - self.ticks[1][0] >= self.args.ups_window:
+                self.ticks.popleft()
+            (first_time, first_ticks), (last_time, last_ticks) = self.ticks[0], self.ticks[-1]
+            # `/time` has second precision: shorter windows would be too noisy
+            if last_time - first_time >= (self.args.interval if self.args.lua_ticks else self.args.ups_window):
+                row['ups'] = (last_ticks - first_ticks) / (last_time - first_time)
+                if last_ticks > first_ticks:
+                    row['tick_ms'] = (last_time - first_time) * 1000 / (last_ticks - first_ticks)
+        return row
+
+    def _docker(self, *args: str) -> str:
+        return subprocess.run(['docker', *args], capture_output=True, text=True, check=True, timeout=30).stdout
+
+    def _container(self) -> Row:
+        try:
+            if not self.container_id:
+                for line in self._docker('ps', '--format', '{{.ID}} {{.Image}}').splitlines():
+                    container_id, image = line.split()
+                    if image.startswith(f'{self.args.image}:'):
+                        self.container_id = container_id
+            if not self.container_id:
+                return {}
+            stats = self._docker('stats', '--no-stream', '--format', '{{.CPUPerc}}\t{{.MemUsage}}', self.container_id)
+        except (subprocess.SubprocessError, OSError):
+            self.container_id = ''  # could have been recreated
+            return {}
+        cpu, _, memory = stats.strip().partition('\t')
+        try:
+            return {'cpu_percent': float(cpu.rstrip('%')), 'memory_bytes': parse_memory(memory)}
+        except ValueError:
+            return {}
+
+    def _disk(self, now: float) -> Row:
+        with open('/proc/diskstats') as f:
+            fields = next((line.split() for line in f if ' '.join(line.split()[:2]) == self.device), None)
+        if fields is None:
+            return {}  # e.g. overlay or network filesystem
+        counters = [int(v) for v in fields[3:14]]
+        previous, self.disk = self.disk, (now, counters)
+        if previous is None or now <= previous[0]:
+            return {}
+        elapsed = now - previous[0]
+        delta = [current - before for current, before in zip(counters, previous[1])]
+        ios = delta[0] + delta[4]
+        return {
+            'disk_read_bps': delta[2] * 512 / elapsed,
+            'disk_write_bps': delta[6] * 512 / elapsed,
+            'disk_latency_ms': (delta[3] + delta[7]) / ios if ios else 0.0,
+            'disk_util_percent': min(100.0, delta[9] / (elapsed * 10)),
+        }
+
+
+class Collector:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.metrics_dir = Path(args.dir) / 'metrics'
+        self.metrics_dir.mkdir(parents=True, exist_ok=True)
+        # Two hours of samples: the current one plus the previous, if its file couldn't be written yet
+        self.buffer: collections.deque[Row] = collections.deque(maxlen=int(2 * _HOUR / args.interval) + 1)
+        current = _hour_file(self.metrics_dir, time.time())
+        if current.exists():
+            # Restarted within the hour: the file is rewritten with all its samples on flush
+            self.buffer.extend(_rows(read_columns(current)))
+
+    def flush(self):
+        now = time.time()
+        hours: dict[Path, list[Row]] = collections.defaultdict(list)
+        for row in self.buffer:
+            hours[_hour_file(self.metrics_dir, row['ts'])].append(row)
+        current = _hour_file(self.metrics_dir, now)
+        try:
+            for path, rows in hours.items():
+                write_columns(path, rows)
+        except OSError as e:
+            print(f'Failed to write samples, keeping them in memory: {e}', file=sys.stderr)
+            return
+        kept = [row for row in self.buffer if _hour_file(self.metrics_dir, row['ts']) == current]
+        self.buffer = collections.deque(kept, maxlen=self.buffer.maxlen)
+        expired = (now - self.args.retention_days * 86400) // _HOUR * _HOUR
+        for path in self.metrics_dir.glob('*.ftm'):
+            if path.stem.isdigit() and int(path.stem) < expired:
+                path.unlink(missing_ok=True)
+
+    async def run(self):
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+        sampler = Sampler(self.args)
+        started = time.monotonic()
+        last_flush = started
+        step = 0
+        while not stop.is_set():
+            self.buffer.append(await sampler.sample())
+            if time.monotonic() - last_flush >= self.args.flush_interval:
+                await asyncio.to_thread(self.flush)
+                last_flush = time.monotonic()
+            # Fixed schedule: a slow sample skips slots instead of shifting all following ones
+            step = max(step + 1, math.ceil((time.monotonic() - started) / self.args.interval))
+            try:
+                await asyncio.wait_for(stop.wait(), started + step * self.args.interval - time.monotonic())
+            except asyncio.TimeoutError:
+                pass
+        self.flush()
+
+
+def _percentile(values: list[float], p: float) -> float:
+    return values[min(len(values) - 1, max(0, math.ceil(p / 100 * len(values)) - 1))]
+
+
+def summarize(values: tp.Iterable[float]) -> tp.Optional[dict[str, float]]:
+    measured = sorted(v for v in values if not math.isnan(v))
+    if not measured:
+        return None
+    summary = {'count': len(measured), 'mean': sum(measured) / len(measured), 'min': measured[0]}
+    summary.update({f'p{p}': _percentile(measured, p) for p in PERCENTILES})
+    summary['max'] = measured[-1]
+    return summary
+
+
+def coverage(rows: tp.Sequence[Row], column: str) -> tp.Optional[dict[str, float]]:
+    """First and last measured sample of a column and the longest gap between measured samples"""
+    times = [row['ts'] for row in rows if not math.isnan(row[column])]
+    if not times:
+        return None
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    return {'first': times[0], 'last': times[-1], 'max_gap': max(gaps, default=0.0)}
+
+
+def report(directory: Path, window_minutes: float, lag_ups: float) -> dict[str, tp.Any]:
+    since = time.time() - window_minutes * 60
+    rows: list[Row] = []
+    for path in sorted((directory / 'metrics').glob('*.ftm')):
+        if path.stem.isdigit() and int(path.stem) + _HOUR > since:
+            rows += [row for row in _rows(read_columns(path)) if row['ts'] >= since]
+    lagging = [row for row in rows if row['ups'] < lag_ups]
+    normal = [row for row in rows if row['ups'] >= lag_ups]
+    return {
+        'window_minutes': window_minutes,
+        'samples': len(rows),
+        'first_sample': rows[0]['ts'] if rows else None,
+        'last_sample': rows[-1]['ts'] if rows else None,
+        'cores': os.cpu_count(),
+        'metrics': {column: summarize(row[column] for row in rows) for column in COLUMNS[1:]},
+        'coverage': {column: coverage(rows, column) for column in COLUMNS[1:]},
+        'lag': {
+            'ups_below': lag_ups,
+            'fraction': len(lagging) / (len(lagging) + len(normal)) if lagging or normal else None,
+            'lagging': {f: summarize(row[f] for row in lagging) for f in LAG_FACTORS},
+            'normal': {f: summarize(row[f] for row in normal) for f in LAG_FACTORS},
+        },
+    }
+
+
+def main(args: argparse.Namespace) -> int:
+    directory = Path(args.dir)
+    if args.command == 'report':
+        print(json.dumps(report(directory, args.window_minutes, args.lag_ups)))
+        return 0
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / 'collector.lock', 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print('Collector is already running', file=sys.stderr)
+            return 0
+        (directory / 'collector.pid').write_text(str(os.getpid()))
+        asyncio.run(Collector(args).run())
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['collect', 'report'])
+    parser.add_argument('--dir', required=True)
+    parser.add_argument('--data-dir', default='/factorio-data')
+    parser.add_argument('--image', default='factoriotools/factorio')
+    parser.add_argument('--port', type=int, default=27015)
+    parser.add_argument('--password-file', default='/factorio-data/config/rconpw')
+    parser.add_argument('--interval', type=float, default=10)
+    parser.add_argument('--flush-interval', type=float, default=60)
+    parser.add_argument('--ups-window', type=float, default=60)
+    parser.add_argument('--lua-ticks', action='store_true')
+    parser.add_argument('--retention-days', type=float, default=14)
+    parser.add_argument('--window-minutes', type=float, default=60)
+    parser.add_argument('--lag-ups', type=float, default=57)
+    sys.exit(main(parser.parse_args()))
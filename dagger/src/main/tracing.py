@@ -0,0 +1,149 @@
+"""Lightweight tracing of pipeline steps: execs, bash scripts, cloud lookups
+
+Dagger builds containers lazily, so time is spent only when a result is awaited (`stdout`, `sync`, ...):
+spans measure those awaits. Building an exec only records a zero-length `declare` span.
+Spans can be dumped as JSON lines or as OTLP/JSON (`resourceSpans`) for any OpenTelemetry collector.
+"""
+
+import contextvars
+import functools
+import json
+import os
+import sys
+import time
+import typing as tp
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+
+T = tp.TypeVar('T')
+
+_current_span: contextvars.ContextVar[tp.Optional['Span']] = contextvars.ContextVar('current_span', default=None)
+
+
+def _new_id(n_bytes: int) -> str:
+    return os.urandom(n_bytes).hex()
+
+
+@dataclass
+class Span:
+    name: str
+    kind: str
+    trace_id: str
+    span_id: str = field(default_factory=lambda: _new_id(8))
+    parent_id: tp.Optional[str] = None
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: tp.Optional[int] = None
+    attributes: dict[str, tp.Any] = field(default_factory=dict)
+    error: tp.Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or self.start_ns) - self.start_ns) / 1e6
+
+
+class Tracer:
+    def __init__(self):
+        self.trace_id = _new_id(16)
+        self.spans: list[Span] = []
+
+    def reset(self):
+        self.trace_id = _new_id(16)
+        self.spans = []
+
+    @contextmanager
+    def span(self, name: str, kind: str = 'internal', **attributes: tp.Any) -> tp.Iterator[Span]:
+        parent = _current_span.get()
+        s = Span(
+            name=name,
+            kind=kind,
+            trace_id=self.trace_id,
+            parent_id=parent.span_id if parent else None,
+            attributes=attributes,
+        )
+        self.spans.append(s)
+        token = _current_span.set(s)
+        try:
+            yield s
+        except BaseException as e:
+            s.error = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            s.end_ns = time.time_ns()
+            _current_span.reset(token)
+
+    def event(self, name: str, kind: str, **attributes: tp.Any):
+        with self.span(name, kind, **attributes):
+            pass
+
+    def to_json_lines(self) -> str:
+        return '\n'.join(json.dumps(asdict(s) | {'duration_ms': s.duration_ms}) for s in self.spans)
+
+    def to_otlp_json(self, service_name: str = 'factorio-server') -> str:
+        def attribute(k: str, v: tp.Any) -> dict:
+            if isinstance(v, bool):
+                return {'key': k, 'value': {'boolValue': v}}
+            if isinstance(v, int):
+                return {'key': k, 'value': {'intValue': str(v)}}
+            if isinstance(v, float):
+                return {'key': k, 'value': {'doubleValue': v}}
+            return {'key': k, 'value': {'stringValue': str(v)}}
+
+        spans = [
+            {
+                'traceId': s.trace_id,
+                'spanId': s.span_id,
+                **({'parentSpanId': s.parent_id} if s.parent_id else {}),
+                'name': s.name,
+                'kind': 1,  # SPAN_KIND_INTERNAL
+                'startTimeUnixNano': str(s.start_ns),
+                'endTimeUnixNano': str(s.end_ns or s.start_ns),
+                'attributes': [attribute('factorio.kind', s.kind)] + [attribute(k, v) for k, v in s.attributes.items()],
+                'status': {'code': 2, 'message': s.error} if s.error else {'code': 1},
+            }
+            for s in self.spans
+        ]
+        return json.dumps(
+            {
+                'resourceSpans': [
+                    {
+                        'resource': {'attributes': [attribute('service.name', service_name)]},
+                        'scopeSpans': [{'scope': {'name': __name__}, 'spans': spans}],
+                    }
+                ]
+            }
+        )
+
+    def dump(self, fmt: str) -> str:
+        if fmt == 'json':
+            return self.to_json_lines()
+        if fmt == 'otlp':
+            return self.to_otlp_json()
+        raise ValueError(f'Unknown trace format: {fmt}')
+
+
+tracer = Tracer()
+
+
+async def traced(awaitable: tp.Awaitable[T], name: str, kind: str = 'exec', **attributes: tp.Any) -> T:
+    """Await `awaitable` inside a span: use it where a lazy Dagger pipeline is evaluated"""
+    with tracer.span(name, kind, **attributes):
+        return await awaitable
+
+
+def instrumented(func: tp.Callable[..., tp.Awaitable[T]]) -> tp.Callable[..., tp.Awaitable[T]]:
+    """Wrap Dagger function into a span; the outermost one dumps all spans to stderr if the object
+    has `trace_format` set (Dagger shows stderr of module functions in its logs/TUI)
+    """
+
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs) -> T:
+        outermost = _current_span.get() is None
+        try:
+            with tracer.span(func.__name__, 'function'):
+                return await func(self, *args, **kwargs)
+        finally:
+            trace_format = getattr(self, 'trace_format', '')
+            if outermost and trace_format:
+                print(tracer.dump(trace_format), file=sys.stderr)
+
+    return wrapper
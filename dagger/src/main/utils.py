@@ -1,8 +1,67 @@
+import tempfile
 import typing as tp
 from pathlib import Path
 from textwrap import dedent
 
 import dagger
+from dagger import dag
+
+from main.tracing import tracer
+
+APT_CACHE_VOLUMES = {
+    '/var/cache/apt': 'apt-archives',
+    '/var/lib/apt/lists': 'apt-lists',
+}
+DOWNLOAD_CACHE_DIR = '/var/cache/toolchain-downloads'
+
+# Bash helpers for reproducible downloads. Everything is kept in DOWNLOAD_CACHE_DIR (cache volume),
+# so warm builds never touch the network.
+FETCH_VERIFIED_SH = f"""
+    DOWNLOAD_CACHE_DIR='{DOWNLOAD_CACHE_DIR}'
+
+    # Usage: path="$(fetch_cached URL)". Only for immutable (versioned) URLs
+    fetch_cached () {{
+        local cached="${{DOWNLOAD_CACHE_DIR}}/url-$(echo -n "$1" | sha256sum | cut -c1-64)"
+        if [ ! -f "$cached" ]; then
+            curl -fsSL --retry 3 -o "${{cached}}.part" "$1"
+            mv "${{cached}}.part" "$cached"
+        fi
+        echo "$cached"
+    }}
+
+    # Usage: sum="$(published_checksum CHECKSUMS_URL FILE_NAME)"
+    published_checksum () {{
+        local list sum
+        list="$(fetch_cached "$1")"
+        sum="$(awk -v f="$2" '$2 == f || $2 == "*"f {{ print $1 }}' "$list")"
+        if [ -z "$sum" ]; then
+            echo "No checksum for $2 in $1" >&2
+            return 1
+        fi
+        echo "$sum"
+    }}
+
+    # Usage: fetch_verified URL SHA256 DEST. Without SHA256 the checksum of the first download is recorded in the
+    # cache and later downloads must match it (trust on first use): pin the printed value
+    fetch_verified () {{
+        local path sum="$2"
+        path="$(fetch_cached "$1")"
+        if [ -z "$sum" ]; then
+            local recorded="${{DOWNLOAD_CACHE_DIR}}/sha256-$(echo -n "$1" | sha256sum | cut -c1-64)"
+            if [ ! -f "$recorded" ]; then
+                sha256sum "$path" | cut -c1-64 > "$recorded"
+            fi
+            sum="$(cat "$recorded")"
+            echo "WARNING: no pinned checksum for $1, verified against the first download: $sum" >&2
+        fi
+        if ! echo "$sum  $path" | sha256sum -c --quiet -; then
+            rm -f "$path"
+            echo "Checksum mismatch for $1" >&2
+            return 1
+        fi
+        cp "$path" "$3"
+    }}
+"""
 
 
 class classproperty:
@@ -25,13 +84,22 @@ def withable(func: tp.Callable) -> tp.Callable:
 
 @withable
 def install_packages(
-    c: dagger.Container, packages: list[str], update: bool = True, upgrade: bool = True
+    c: dagger.Container, packages: list[str], update: bool = True, upgrade: bool = False
 ) -> dagger.Container:
+    """Install packages in a single layer. Package index and archives live in shared cache volumes"""
+    apt = 'apt-get -yqqo Dpkg::Use-Pty=0'
+    commands = ['rm -f /etc/apt/apt.conf.d/docker-clean']  # it wipes downloaded archives after install
     if update:
-        c = c.with_exec(['apt-get', '-yqqo', 'Dpkg::Use-Pty=0', 'update'])
+        commands.append(f'{apt} update')
     if upgrade:
-        c = c.with_exec(['apt-get', '-yqqo', 'Dpkg::Use-Pty=0', 'upgrade'])
-    return c.with_exec(['apt-get', '-yqqo', 'Dpkg::Use-Pty=0', 'install'] + packages)
+        commands.append(f'{apt} upgrade')
+    commands.append(f'{apt} install --no-install-recommends ' + ' '.join(packages))
+    for path, volume in APT_CACHE_VOLUMES.items():
+        c = c.with_mounted_cache(path, dag.cache_volume(volume), sharing=dagger.CacheSharingMode.LOCKED)
+    c = c.with_exec(['/bin/bash', '-c', ' && '.join(commands)])
+    for path in APT_CACHE_VOLUMES:
+        c = c.without_mount(path)
+    return c
 
 
 @withable
@@ -56,10 +124,32 @@ def create_user(c: dagger.Container, user_name: str, uid: int = 65533, gid: int
     )
 
 
+def _command_name(args: list[str]) -> str:
+    return ' '.join([a for a in args if not a.startswith('-')][:4])
+
+
+def _script_name(script: str) -> str:
+    lines = [line.strip() for line in script.splitlines()]
+    return next((line[:80] for line in lines if line and not line.startswith('#')), 'bash')
+
+
+async def exec_stdout(c: dagger.Container, args: list[str], **kwargs) -> str:
+    """`c.with_exec(args).stdout()` recorded as a span"""
+    with tracer.span(_command_name(args), 'exec', command=' '.join(args)):
+        return await c.with_exec(args, **kwargs).stdout()
+
+
+async def exec_sync(c: dagger.Container, args: list[str], **kwargs) -> dagger.Container:
+    """`c.with_exec(args).sync()` recorded as a span"""
+    with tracer.span(_command_name(args), 'exec', command=' '.join(args)):
+        return await c.with_exec(args, **kwargs).sync()
+
+
 @withable
 def exec_bash(
     c: dagger.Container, script: str, expand: bool = False, insecure_root_capabilities: bool = False
 ) -> dagger.Container:
+    tracer.event(_script_name(script), 'bash', lines=script.count('\n'))
     n = str(Path('/tmp/script.sh'))
     script = dedent("""
         set -xeuo pipefail
@@ -71,6 +161,7 @@ def exec_bash(
 
 @withable
 def exec_bash_and_save_exit_code(c: dagger.Container, script: str, exit_code_file: str):
+    tracer.event(_script_name(script), 'bash', lines=script.count('\n'))
     n = str(Path('/tmp/script.sh'))
     script = dedent("""
         set -xeuo pipefail
@@ -78,3 +169,23 @@ def exec_bash_and_save_exit_code(c: dagger.Container, script: str, exit_code_fil
     return c.with_new_file(n, script, permissions=0o750).with_exec(
         ['/bin/bash', '-c', f'{n}; echo -n $? > {exit_code_file}']
     )
+
+
+# Module code runs in a runtime container: `export` writes into it and `workdir_file` reads back from its workdir
+
+
+def runtime_tempdir() -> Path:
+    """New temporary directory inside the module workdir"""
+    return Path(tempfile.mkdtemp(dir=Path.cwd()))
+
+
+async def export_to_runtime(entry: tp.Union[dagger.File, dagger.Directory], name: str) -> Path:
+    """Materialize file/directory in a new temporary directory of the module runtime, returns its path"""
+    path = runtime_tempdir() / name
+    await entry.export(str(path))
+    return path
+
+
+def file_from_runtime(path: Path) -> dagger.File:
+    """Load file created by module code. It must be inside the module workdir (see `export_to_runtime`)"""
+    return dag.current_module().workdir_file(str(path.resolve().relative_to(Path.cwd().resolve())))
@@ -0,0 +1,82 @@
+"""Fake server host for bash snippets of `main.remote`: `ssh`, `scp` and `sudo` run commands on this machine,
+the data disk is a temporary directory
+"""
+
+import getpass
+import os
+import subprocess
+import typing as tp
+from pathlib import Path
+
+import pytest
+
+from main.config import FACTORIO_DATA_DIR, HOST_USERNAME
+from main.remote import SSH_HOST
+
+_FAKES = {
+    # Control commands of the shared connection (`-O forward`, `-O exit`) have nothing to do
+    'ssh': """
+        [ "$1" != -O ] || exit 0
+        echo "$*" >> "$FAKE_HOST_LOG"
+        shift
+        exec bash -c "$*"
+    """,
+    'scp': f"""
+        echo "scp $*" >> "$FAKE_HOST_LOG"
+        args=()
+        for arg in "$@"; do args+=("${{arg#{SSH_HOST}:}}"); done
+        exec cp "${{args[@]}}"
+    """,
+    # Unprivileged test runs can't chown to the Factorio user
+    'sudo': """
+        if [ "$1" = chown ] && [ "$(id -u)" != 0 ]; then exit 0; fi
+        exec "$@"
+    """,
+    # No Factorio container on the host
+    'docker': """
+        [ "$1" = ps ] || { echo "fake docker: unsupported: $*" >&2; exit 1; }
+    """,
+}
+
+
+class FakeHost:
+    def __init__(self, root: Path):
+        self.root = root
+        self.data_dir = root / FACTORIO_DATA_DIR.lstrip('/')
+        self.data_dir.mkdir(parents=True)
+        self.bin_dir = root / 'bin'
+        self.bin_dir.mkdir()
+        self.log = root / 'commands.log'
+        self.log.touch()
+        for name, script in _FAKES.items():
+            self.install(name, script)
+
+    def install(self, name: str, script: str):
+        """Add or replace a fake command"""
+        path = self.bin_dir / name
+        lines = [line.strip() for line in script.strip().splitlines()]
+        path.write_text('#!/usr/bin/env bash\nset -euo pipefail\n' + '\n'.join(lines) + '\n')
+        path.chmod(0o755)
+
+    def path(self, host_path: str) -> Path:
+        """Local path of an absolute path of the host"""
+        return self.root / host_path.lstrip('/')
+
+    def run(self, script: str, check: bool = True, options: str = 'set -xeuo pipefail') -> subprocess.CompletedProcess:
+        """Run a script of the tool container (as `exec_bash` does, or with other shell `options`) against this host"""
+        script = script.replace(FACTORIO_DATA_DIR, str(self.data_dir)).replace(HOST_USERNAME, getpass.getuser())
+        env = dict(os.environ, PATH=f'{self.bin_dir}:{os.environ["PATH"]}', FAKE_HOST_LOG=str(self.log))
+        result = subprocess.run(
+            ['bash', '-c', f'{options}\n{script}'], env=env, capture_output=True, text=True, timeout=60
+        )
+        if check and result.returncode:
+            raise AssertionError(f'Script failed ({result.returncode}):\n{result.stderr}')
+        return result
+
+    def commands(self) -> list[str]:
+        return self.log.read_text().splitlines()
+
+
+@pytest.fixture
+def host(tmp_path: Path) -> tp.Iterator[FakeHost]:
+    yield FakeHost(tmp_path / 'host')
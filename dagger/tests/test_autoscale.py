@@ -0,0 +1,81 @@
+import math
+import typing as tp
+
+import pytest
+
+from main.autoscale import GB, AutoscaleDecision, VmSize, decide_size, decide_stop
+from main.telemetry import COLUMNS, report, write_columns
+
+NOW = 100_000.0
+WINDOW = 30
+NAN = math.nan
+SIZES = [(2, 4), (4, 8), (8, 16)]
+
+
+def _report(tmp_path, monkeypatch, sample: tp.Callable[[float], dict[str, float]], since: float = WINDOW * 60):
+    """Telemetry report of samples every 10 seconds over the last `since` seconds, `sample(age)` sets the metrics"""
+    rows = []
+    for ts in range(int(NOW - since), int(NOW) + 1, 10):
+        row = dict.fromkeys(COLUMNS, NAN) | {'ts': float(ts), 'ups': 60.0, 'players': 0.0}
+        rows.append(row | sample(NOW - ts))
+    (tmp_path / 'metrics').mkdir()
+    write_columns(tmp_path / 'metrics' / f'{int(NOW // 3600 * 3600)}.ftm', rows)  # The window fits in this hour
+    monkeypatch.setattr('time.time', lambda: NOW)
+    return report(tmp_path, WINDOW, lag_ups=57)
+
+
+def _decision(size: tp.Optional[VmSize] = None) -> AutoscaleDecision:
+    return AutoscaleDecision(instance_status='RUNNING', current_size=size)
+
+
+@pytest.mark.parametrize(
+    'sample, since, stop',
+    [
+        (lambda age: {}, WINDOW * 60, True),
+        (lambda age: {'players': 1.0 if age == 600 else 0.0}, WINDOW * 60, False),
+        (lambda age: {'players': NAN}, WINDOW * 60, False),  # RCON is down: players unknown
+        (lambda age: {'players': NAN if 300 < age < 1200 else 0.0}, WINDOW * 60, False),
+        (lambda age: {}, 10 * 60, False),  # Collector started 10 minutes ago
+        (lambda age: {'players': NAN, 'ups': NAN} if age < 600 else {}, WINDOW * 60, False),
+    ],
+)
+def test_decide_stop(tmp_path, monkeypatch, sample, since, stop):
+    decision = _decision()
+
+    decide_stop(decision, _report(tmp_path, monkeypatch, sample, since), WINDOW, NOW)
+
+    assert decision.stop is stop
+
+
+def test_stale_telemetry_does_not_stop(tmp_path, monkeypatch):
+    idle = _report(tmp_path, monkeypatch, lambda age: {})
+    decision = _decision()
+
+    decide_stop(decision, idle, WINDOW, NOW + 600)
+
+    assert not decision.stop
+
+
+@pytest.mark.parametrize(
+    'sample, recommended',
+    [
+        # Lagging: more cores
+        (lambda age: {'players': 3.0, 'ups': 40.0 if age % 60 == 0 else 60.0, 'memory_bytes': GB}, (8, 16)),
+        # Memory runs short without lag
+        (lambda age: {'players': 3.0, 'memory_bytes': 7.5 * GB, 'cpu_percent': 100.0}, (8, 16)),
+        # Fits the smaller size with margin
+        (lambda age: {'players': 1.0, 'memory_bytes': GB, 'cpu_percent': 50.0}, (2, 4)),
+        # Busy enough to keep the size
+        (lambda age: {'players': 1.0, 'memory_bytes': 3 * GB, 'cpu_percent': 150.0}, None),
+        # Nobody plays or players are unknown: nothing to learn about the load
+        (lambda age: {'ups': 30.0, 'memory_bytes': 7.5 * GB}, None),
+        (lambda age: {'players': NAN, 'ups': 30.0, 'memory_bytes': 7.5 * GB}, None),
+    ],
+)
+def test_decide_size(tmp_path, monkeypatch, sample, recommended):
+    decision = _decision(VmSize(cores=4, memory_gb=8))
+
+    decide_size(decision, _report(tmp_path, monkeypatch, sample), SIZES, 57, NOW)
+
+    size = decision.recommended_size
+    assert (size.cores, size.memory_gb) == recommended if size else recommended is None
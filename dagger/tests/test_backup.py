@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import os
+import random
+import typing as tp
+from pathlib import Path
+
+import pytest
+
+from main.backup import backup_files, load_index, restore_file
+from main.chunking import MAX_CHUNK_SIZE
+from main.s3 import S3Error
+
+
+class MemoryBucket:
+    """`S3Bucket` in memory"""
+
+    def __init__(self):
+        self.objects: dict[str, bytes] = {}
+        self.puts: list[str] = []
+
+    def put(self, key: str, data: bytes, sha256: tp.Optional[str] = None):
+        self.objects[key] = data
+        self.puts.append(key)
+
+    def get(self, key: str) -> bytes:
+        if key not in self.objects:
+            raise S3Error(404, key)
+        return self.objects[key]
+
+    def delete(self, key: str):
+        self.objects.pop(key, None)
+
+    def exists(self, key: str) -> bool:
+        return key in self.objects
+
+    def list_keys(self, prefix: str = '') -> tp.Iterator[str]:
+        return iter(sorted(k for k in self.objects if k.startswith(prefix)))
+
+    def chunks(self) -> set[str]:
+        return {k for k in self.objects if k.startswith('chunks/')}
+
+
+def _save(path: Path, data: bytes, age: int) -> Path:
+    path.write_bytes(data)
+    os.utime(path, (1_700_000_000 - age, 1_700_000_000 - age))
+    return path
+
+
+def _data(size: int, seed: int = 0) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+
+def test_backup_and_restore(tmp_path):
+    bucket = MemoryBucket()
+    data = _data(5 * 1024 * 1024)
+    save = _save(tmp_path / 'save.zip', data, age=0)
+
+    report = asyncio.run(backup_files(bucket, [save], keep=10))
+    index = asyncio.run(load_index(bucket))
+    asyncio.run(restore_file(bucket, index.find(name='save.zip'), tmp_path / 'restored.zip'))
+
+    assert report.saves == 1 and report.uploaded_chunks == report.chunks > 1
+    assert (tmp_path / 'restored.zip').read_bytes() == data
+    assert index.saves[0].sha256 == hashlib.sha256(data).hexdigest()
+
+
+def test_backup_uploads_only_new_chunks(tmp_path):
+    bucket = MemoryBucket()
+    data = bytearray(_data(16 * 1024 * 1024))
+    asyncio.run(backup_files(bucket, [_save(tmp_path / 'a.zip', bytes(data), age=60)], keep=10))
+    data[8 * 1024 * 1024 : 8 * 1024 * 1024 + 10] = b'autosave 2'
+
+    report = asyncio.run(backup_files(bucket, [_save(tmp_path / 'b.zip', bytes(data), age=0)], keep=10))
+
+    assert report.uploaded_chunks <= 2 < report.chunks
+    assert report.bytes_uploaded <= 2 * MAX_CHUNK_SIZE < len(data)
+
+
+def test_known_save_is_skipped(tmp_path):
+    bucket = MemoryBucket()
+    save = _save(tmp_path / 'save.zip', _data(1024 * 1024), age=0)
+    asyncio.run(backup_files(bucket, [save], keep=10))
+    bucket.puts.clear()
+
+    report = asyncio.run(backup_files(bucket, [save], keep=10))
+
+    assert report.skipped_saves == 1
+    assert bucket.puts == ['index.json']
+
+
+def test_old_backups_are_pruned(tmp_path):
+    bucket = MemoryBucket()
+    saves = [_save(tmp_path / f'{i}.zip', _data(2 * 1024 * 1024, seed=i), age=100 - i) for i in range(3)]
+    asyncio.run(backup_files(bucket, saves[:1], keep=2))
+    first_chunks = bucket.chunks()
+
+    report = asyncio.run(backup_files(bucket, saves[1:], keep=2))
+    index = asyncio.run(load_index(bucket))
+
+    assert report.pruned_saves == 1 and report.deleted_chunks == len(first_chunks)
+    assert [e.name for e in index.saves] == ['1.zip', '2.zip']
+    assert not first_chunks & bucket.chunks()
+    assert {k for k in bucket.objects if k.startswith('manifests/')} == {
+        f'manifests/{e.sha256}.json' for e in index.saves
+    }
+    asyncio.run(restore_file(bucket, index.find(name='1.zip'), tmp_path / 'restored.zip'))
+    assert (tmp_path / 'restored.zip').read_bytes() == saves[1].read_bytes()
+
+
+def test_corrupted_chunk_is_not_restored(tmp_path):
+    bucket = MemoryBucket()
+    asyncio.run(backup_files(bucket, [_save(tmp_path / 'save.zip', _data(3 * 1024 * 1024), age=0)], keep=10))
+    bucket.objects[min(bucket.chunks())] = b'corrupted'
+    entry = asyncio.run(load_index(bucket)).find()
+
+    with pytest.raises(ValueError, match='Corrupted chunk'):
+        asyncio.run(restore_file(bucket, entry, tmp_path / 'restored.zip'))
+
+    assert not (tmp_path / 'restored.zip').exists()
+
+
+def test_current_save_outlives_keep_window(tmp_path):
+    bucket = MemoryBucket()
+    current = _save(tmp_path / 'current.zip', _data(1024 * 1024), age=1000)  # Unchanged since
+    for i in range(3):
+        autosave = _save(tmp_path / f'_autosave{i}.zip', _data(1024 * 1024, seed=i + 1), age=100 - i)
+        asyncio.run(backup_files(bucket, [current, autosave], keep=2))
+        autosave.unlink()
+    bucket.puts.clear()
+
+    report = asyncio.run(backup_files(bucket, [current], keep=2))
+    index = asyncio.run(load_index(bucket))
+
+    assert report.skipped_saves == 1 and report.uploaded_chunks == 0
+    assert bucket.puts == ['index.json']
+    assert [e.name for e in index.saves] == ['_autosave2.zip', 'current.zip']
+    assert index.find().name == 'current.zip' and index.saves[-1].seen_at is not None
@@ -0,0 +1,65 @@
+import pytest
+
+from main.benchmarks import (
+    SaveBenchmarkReport,
+    compare_ups,
+    parse_factorio_benchmark,
+    summarize_save_benchmark,
+)
+
+# `factorio --benchmark save.zip --benchmark-ticks 3 --benchmark-runs 2 --benchmark-verbose all`, trimmed columns
+OUTPUT = """\
+   0.000 2024-10-21 12:00:00; Factorio 2.0.15 (build 79796, linux64, headless)
+   0.412 Loading map /opt/factorio/benchmark/save.zip: 1843211 bytes.
+   0.530 Checksum for script __level__/control.lua: 3912854761
+Performed 3 updates in 31.250 ms
+tick,timestamp,wholeUpdate,latencyUpdate,gameUpdate,circuitNetworkUpdate,transportLinesUpdate,fluidsUpdate,
+t0,1000000,10000000,,6000000,1000000,2000000,1000000,
+t1,2000000,12000000,,7000000,1000000,3000000,1000000,
+t2,3000000,8000000,,4000000,,2000000,2000000,
+   1.200 Loading map /opt/factorio/benchmark/save.zip: 1843211 bytes.
+tick,timestamp,wholeUpdate,latencyUpdate,gameUpdate,circuitNetworkUpdate,transportLinesUpdate,fluidsUpdate,
+t0,5000000,20000000,,10000000,2000000,6000000,2000000,
+t1,6000000,20000000,,10000000,2000000,6000000,2000000,
+t2,7000000,20000000,,10000000,2000000,6000000,2000000,
+   2.100 Goodbye
+"""
+
+
+def test_parse_keeps_columns_of_empty_fields():
+    runs, components = parse_factorio_benchmark(OUTPUT)
+
+    assert runs == [[10.0, 12.0, 8.0], [20.0, 20.0, 20.0]]
+    # circuitNetworkUpdate is empty at t2 of the first run: its neighbours keep their own columns
+    assert components == {
+        'gameUpdate': 7.833,
+        'transportLinesUpdate': 4.167,
+        'fluidsUpdate': 1.667,
+        'circuitNetworkUpdate': 1.333,
+    }
+
+
+def test_no_timings():
+    with pytest.raises(ValueError, match='No per-tick timings'):
+        parse_factorio_benchmark('   0.000 Error: save is corrupted\n')
+
+
+def test_relative_ups():
+    fast = summarize_save_benchmark('save.zip', 'stable', OUTPUT)
+    slow = summarize_save_benchmark('save.zip', 'latest', OUTPUT.replace('20000000,,', '40000000,,'))
+    report = SaveBenchmarkReport(benchmarks=[fast, slow])
+
+    compare_ups(report)
+
+    assert fast.total.max_ups == 66.7 and fast.total.ups == 60
+    assert [b.relative_ups for b in report.benchmarks] == [1.0, 0.6]
+
+
+def test_relative_ups_of_unmeasurable_baseline():
+    too_slow = summarize_save_benchmark('save.zip', 'stable', OUTPUT.replace('0000000,,', '00000000000,,'))
+    report = SaveBenchmarkReport(benchmarks=[too_slow, summarize_save_benchmark('save.zip', 'latest', OUTPUT)])
+
+    compare_ups(report)
+
+    assert too_slow.total.max_ups == 0.0
+    assert [b.relative_ups for b in report.benchmarks] == [None, None]
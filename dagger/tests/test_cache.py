@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from main.cache import LookupCache
+
+
+class Resolver:
+    def __init__(self, fail: bool = False):
+        self.calls = 0
+        self.fail = fail
+
+    async def __call__(self) -> int:
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError('lookup failed')
+        return self.calls
+
+
+def test_concurrent_callers_share_one_lookup():
+    cache, resolve = LookupCache(), Resolver()
+
+    async def scenario():
+        results = await asyncio.gather(*(cache.get_or_resolve(('folder', 'a'), resolve) for _ in range(5)))
+        return results + [await cache.get_or_resolve(('folder', 'a'), resolve)]
+
+    assert asyncio.run(scenario()) == [1] * 6
+    assert resolve.calls == 1
+
+
+def test_expired_entries_are_resolved_again():
+    cache, resolve = LookupCache(ttl=0), Resolver()
+
+    async def scenario():
+        return [await cache.get_or_resolve(('folder',), resolve) for _ in range(2)]
+
+    assert asyncio.run(scenario()) == [1, 2]
+
+
+def test_failures_are_not_cached():
+    cache, resolve = LookupCache(), Resolver(fail=True)
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await cache.get_or_resolve(('folder',), resolve)
+        resolve.fail = False
+        return await cache.get_or_resolve(('folder',), resolve)
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_invalidate_by_prefix():
+    cache, resolve = LookupCache(), Resolver()
+
+    async def scenario():
+        for key in (('bucket', 'a'), ('bucket', 'b'), ('folder', 'a')):
+            await cache.get_or_resolve(key, resolve)
+        cache.invalidate('bucket')
+        return [await cache.get_or_resolve(key, resolve) for key in (('bucket', 'a'), ('folder', 'a'))]
+
+    assert asyncio.run(scenario()) == [4, 3]
+
+
+def test_cancelled_waiter_keeps_shared_lookup():
+    cache, resolve = LookupCache(), Resolver()
+
+    async def scenario():
+        first = asyncio.ensure_future(cache.get_or_resolve(('folder',), resolve))
+        second = asyncio.ensure_future(cache.get_or_resolve(('folder',), resolve))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == 1
+    assert resolve.calls == 1
@@ -0,0 +1,57 @@
+import io
+import random
+
+import pytest
+
+from main.chunking import iter_chunks
+
+SIZES = {'min_size': 16 * 1024, 'avg_size': 64 * 1024, 'max_size': 256 * 1024}
+
+
+def _data(size: int, seed: int = 0) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+
+def _chunks(data: bytes) -> list[bytes]:
+    return list(iter_chunks(io.BytesIO(data), **SIZES))
+
+
+def test_chunks_join_into_the_stream():
+    data = _data(4 * 1024 * 1024)
+
+    chunks = _chunks(data)
+
+    assert b''.join(chunks) == data
+    assert all(SIZES['min_size'] <= len(c) <= SIZES['max_size'] for c in chunks[:-1])
+
+
+def test_chunks_are_reused_after_insertion():
+    data = _data(4 * 1024 * 1024)
+    middle = len(data) // 2
+    old = _chunks(data)
+
+    new = _chunks(data[:middle] + b'inserted' + data[middle:])
+
+    assert len(set(new) - set(old)) <= 2
+    assert len(set(old) & set(new)) >= len(old) - 2
+
+
+def test_chunks_are_reused_after_modification():
+    data = bytearray(_data(4 * 1024 * 1024))
+    old = _chunks(bytes(data))
+    data[len(data) // 3 : len(data) // 3 + 100] = _data(100, seed=1)
+
+    new = _chunks(bytes(data))
+
+    assert len(set(new) - set(old)) <= 2
+
+
+def test_chunks_of_uniform_data_are_cut_at_max_size():
+    chunks = _chunks(b'\x00' * (SIZES['max_size'] * 3 + 1))
+
+    assert [len(c) for c in chunks] == [SIZES['max_size']] * 3 + [1]
+
+
+def test_invalid_sizes():
+    with pytest.raises(ValueError):
+        list(iter_chunks(io.BytesIO(b'data'), min_size=2, avg_size=1, max_size=4))
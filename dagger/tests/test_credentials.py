@@ -0,0 +1,82 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+MAIN_DIR = Path(__file__).parents[1] / 'src' / 'main'
+
+
+class Cloud:
+    """Fake `yc` of simulation mode with a service account, and credentials.py running against it"""
+
+    def __init__(self, root: Path):
+        bin_dir = root / 'bin'
+        bin_dir.mkdir()
+        (bin_dir / 'yc').symlink_to(MAIN_DIR / 'fakes' / 'yc')
+        self.state_dir = root / 'credentials'
+        self.env = dict(
+            os.environ,
+            PATH=f'{bin_dir}:{os.environ["PATH"]}',
+            HOME=str(root),
+            FAKE_CLOUD_STATE_DIR=str(root / 'cloud'),
+        )
+        folder = self.yc('resource-manager', 'folder', 'create', '--name', 'factorio')
+        self.account_id = self.yc('iam', 'service-account', 'create', '--name', 'sa', '--folder-id', folder['id'])['id']
+
+    def yc(self, *args: str):
+        result = subprocess.run(['yc', *args], env=self.env, capture_output=True, text=True, check=True)
+        return json.loads(result.stdout) if result.stdout.strip() else None
+
+    def keys(self, kind: str = 'key') -> set[str]:
+        return {k['id'] for k in self.yc('iam', kind, 'list', '--service-account-id', self.account_id)}
+
+    def credentials(self, command: str, *args: str) -> dict:
+        output = self.state_dir.parent / 'output.json'
+        subprocess.run(
+            [sys.executable, MAIN_DIR / 'credentials.py', command, f'--state-dir={self.state_dir}']
+            + [f'--service-account-id={self.account_id}', f'--output={output}', *args],
+            env=self.env,
+            capture_output=True,
+            check=True,
+        )
+        return json.loads(output.read_text()) if command == 'ensure' else {}
+
+
+@pytest.fixture
+def cloud(tmp_path) -> Cloud:
+    return Cloud(tmp_path)
+
+
+def test_credentials_are_reused(cloud, tmp_path):
+    first = cloud.credentials('ensure')
+    second = cloud.credentials('ensure')
+
+    assert first == second
+    assert cloud.keys() == {first['iam_key']['id']}
+    assert (tmp_path / 'output.json').stat().st_mode & 0o077 == 0
+    assert (cloud.state_dir / 'credentials.json').stat().st_mode & 0o077 == 0
+
+
+def test_replaced_keys_are_deleted_after_grace(cloud):
+    old = cloud.credentials('ensure')
+
+    new = cloud.credentials('ensure', '--rotate-after-days=0')
+    kept = cloud.keys('access-key')
+    cloud.credentials('ensure', '--grace-hours=0')
+
+    assert new['iam_key']['id'] != old['iam_key']['id']
+    assert old['access_key']['id'] in kept
+    assert cloud.keys() == {new['iam_key']['id']}
+    assert cloud.keys('access-key') == {new['access_key']['id']}
+
+
+def test_revoke_deletes_untracked_keys(cloud):
+    current = cloud.credentials('ensure')
+    cloud.yc('iam', 'key', 'create', '--service-account-id', cloud.account_id)
+
+    cloud.credentials('prune', '--rotate-after-days=0', '--grace-hours=0')
+
+    assert cloud.keys() == {current['iam_key']['id']}
@@ -0,0 +1,34 @@
+import hashlib
+import subprocess
+
+from main.utils import DOWNLOAD_CACHE_DIR, FETCH_VERIFIED_SH
+
+
+def _fetch(tmp_path, sha256: str = '') -> subprocess.CompletedProcess:
+    """`fetch_verified` of a local file, with a cold download cache (as if the URL were fetched again)"""
+    cache = tmp_path / 'cache'
+    cache.mkdir(exist_ok=True)
+    for cached in cache.glob('url-*'):
+        cached.unlink()
+    script = FETCH_VERIFIED_SH.replace(DOWNLOAD_CACHE_DIR, str(cache))
+    script += f'\nfetch_verified file://{tmp_path}/yc "{sha256}" {tmp_path}/installed'
+    return subprocess.run(['bash', '-c', f'set -euo pipefail\n{script}'], capture_output=True, text=True)
+
+
+def test_pinned_checksum(tmp_path):
+    (tmp_path / 'yc').write_bytes(b'yc')
+
+    assert _fetch(tmp_path, hashlib.sha256(b'yc').hexdigest()).returncode == 0
+    assert _fetch(tmp_path, hashlib.sha256(b'other').hexdigest()).returncode != 0
+    assert (tmp_path / 'installed').read_bytes() == b'yc'
+
+
+def test_unpinned_checksum_is_trusted_on_first_use(tmp_path):
+    (tmp_path / 'yc').write_bytes(b'yc')
+
+    first = _fetch(tmp_path)
+    (tmp_path / 'yc').write_bytes(b'replaced')
+    second = _fetch(tmp_path)
+
+    assert first.returncode == 0 and hashlib.sha256(b'yc').hexdigest() in first.stderr
+    assert second.returncode != 0 and 'Checksum mismatch' in second.stderr
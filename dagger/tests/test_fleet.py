@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+import pytest
+
+from main.autoscale import VmSize
+from main.fleet import FleetError, ServerSpec, parse_fleet, run_on_hosts, tf_servers
+
+
+def test_parse_fleet_defaults():
+    specs = parse_fleet('[{"name": "vanilla"}, {"name": "k2", "zone": "ru-central1-b", "cores": 4}]')
+
+    assert specs == [
+        ServerSpec(name='vanilla'),
+        ServerSpec(name='k2', zone='ru-central1-b', cores=4),
+    ]
+    assert specs[0].zone is None and specs[0].memory_gb is None and specs[0].preemptible is None
+
+
+@pytest.mark.parametrize(
+    'text, error',
+    [
+        ('[{"name": "k2"}, {"name": "vanilla"}, {"name": "k2"}]', 'Duplicated server names: k2'),
+        ('[{"name": "k2", "zone": "ru-central1-x"}]', 'Unknown zones: ru-central1-x'),
+        ('[{"name": "K2_server"}]', 'Invalid server names .*: K2_server'),
+        ('[{"name": "k2", "cores": "many"}]', 'Invalid fleet'),
+        ('{"name": "k2"}', 'Invalid fleet'),
+    ],
+)
+def test_parse_fleet_errors(text, error):
+    with pytest.raises(FleetError, match=error):
+        parse_fleet(text)
+
+
+def test_tf_servers_keeps_existing_sizes():
+    specs = [
+        ServerSpec(name='vanilla'),
+        ServerSpec(name='k2', memory_gb=16),
+        ServerSpec(name='new', zone='ru-central1-b'),
+    ]
+    sizes = {'vanilla': VmSize(cores=2, memory_gb=8), 'k2': VmSize(cores=4, memory_gb=8, preemptible=True)}
+
+    servers = json.loads(tf_servers(specs, sizes))
+
+    assert servers == {
+        'vanilla': {'cores': 2, 'memory': 8, 'preemptible': False},
+        'k2': {'cores': 4, 'memory': 16, 'preemptible': True},
+        'new': {'zone': 'ru-central1-b'},  # The defaults of variables.tf
+    }
+
+
+def test_run_on_hosts_failure_and_concurrency():
+    running, peak = 0, 0
+
+    async def action(host: str) -> int:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if host == 'k2':
+            raise RuntimeError('ssh: connection refused')
+        return len(host)
+
+    results = asyncio.run(run_on_hosts(['vanilla', 'k2', 'se', 'pyanodon'], 2, action))
+
+    assert [(r.host, r.ok, r.result, r.error) for r in results] == [
+        ('vanilla', True, '7', None),
+        ('k2', False, None, 'ssh: connection refused'),
+        ('se', True, '2', None),
+        ('pyanodon', True, '8', None),
+    ]
+    assert peak == 2
@@ -0,0 +1,67 @@
+import asyncio
+import time
+import typing as tp
+
+import pytest
+
+from main.graph import TaskGraph
+
+
+def _step(result, delay: float = 0.05, log: tp.Optional[list] = None):
+    async def run(**deps):
+        if log is not None:
+            log.append(result)
+        await asyncio.sleep(delay)
+        return (result, deps)
+
+    return run
+
+
+def test_independent_steps_run_concurrently():
+    graph = TaskGraph().add('a', _step('a')).add('b', _step('b')).add('c', _step('c'), deps=['a', 'b'])
+
+    started = time.monotonic()
+    results = asyncio.run(graph.run())
+
+    assert time.monotonic() - started < 0.14  # a and b overlap
+    assert results['c'] == ('c', {'a': ('a', {}), 'b': ('b', {})})
+
+
+def test_failure_cancels_other_steps():
+    log: list[str] = []
+
+    async def fail():
+        raise RuntimeError('step failed')
+
+    graph = (
+        TaskGraph()
+        .add('slow', _step('slow', delay=1))
+        .add('fail', fail)
+        .add('after', _step('after', log=log), ['slow'])
+    )
+
+    with pytest.raises(RuntimeError, match='step failed'):
+        asyncio.run(graph.run())
+    assert log == []
+
+
+def test_steps_are_added_in_dependency_order():
+    graph = TaskGraph().add('a', _step('a'))
+
+    with pytest.raises(ValueError, match='unknown steps'):
+        graph.add('b', _step('b'), deps=['c'])
+    with pytest.raises(ValueError, match='Duplicated'):
+        graph.add('a', _step('a'))
+
+
+def test_critical_path():
+    graph = (
+        TaskGraph()
+        .add('login', _step(0), estimate=2)
+        .add('folder', _step(0), ['login'], estimate=1)
+        .add('image', _step(0), estimate=10)
+        .add('bucket', _step(0), ['folder'], estimate=3)
+    )
+
+    assert graph.critical_path() == (['image'], 10)
+    assert 'Critical path (~10.0s, serial ~16.0s): image' in graph.describe()
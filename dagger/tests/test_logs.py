@@ -0,0 +1,57 @@
+import pytest
+
+from main.remote import tail_logs_sh
+
+
+@pytest.fixture
+def logs(host):
+    """Factorio container `abc123` on the host, its log with docker timestamps"""
+    path = host.root / 'container.log'
+    path.touch()
+    host.install(
+        'docker',
+        f"""
+        case "$1" in
+            ps) echo "abc123 factoriotools/factorio:stable" ;;
+            logs) cat {path} ;;
+            *) exit 1 ;;
+        esac
+        """,
+    )
+    return path
+
+
+def _append(path, *lines: str):
+    with path.open('a') as f:
+        for line in lines:
+            f.write(f'2024-10-21T12:00:{len(path.read_text().splitlines()):02d}.000000000Z {line}\n')
+
+
+def _tail(host, offset_file, check: bool = True, **kwargs):
+    # As `tail_logs` runs it: plain `bash -c`, without the options of `exec_bash`
+    return host.run(tail_logs_sh(str(offset_file), **kwargs), check=check, options='')
+
+
+def test_only_new_lines(host, logs, tmp_path):
+    _append(logs, 'Loading map', 'Player joined')
+
+    first = _tail(host, tmp_path / 'offset').stdout
+    _append(logs, 'Player left')
+    second = _tail(host, tmp_path / 'offset').stdout
+    third = _tail(host, tmp_path / 'offset', pattern='joined', since='1h').stdout
+
+    assert first == 'Loading map\nPlayer joined\n'
+    assert second == 'Player left\n'
+    assert third == 'Player joined\n'
+
+
+def test_failure_keeps_offset(host, logs, tmp_path):
+    _append(logs, 'Loading map')
+    _tail(host, tmp_path / 'offset')
+    offset = (tmp_path / 'offset').read_text()
+    host.install('docker', 'exit 0')  # Container is gone
+
+    result = _tail(host, tmp_path / 'offset', check=False)
+
+    assert result.returncode != 0 and 'Factorio container not found' in result.stderr
+    assert (tmp_path / 'offset').read_text() == offset
@@ -0,0 +1,115 @@
+import argparse
+import hashlib
+import json
+import typing as tp
+
+import pytest
+
+from main import mods
+from main.config import FACTORIO_BUILTIN_MODS
+from main.mods import MANIFEST_NAME, diff, manifest, mod_name, stage
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _stage_args(tmp_path, **kwargs) -> argparse.Namespace:
+    """Arguments of `mods.py stage` as `sync-mods` passes them"""
+    args = dict(
+        cache=tmp_path / 'cache',
+        input=None,
+        mod_list=None,
+        factorio_version='2.0',
+        builtin_mods=FACTORIO_BUILTIN_MODS,
+        username=None,
+        token_file=None,
+    )
+    return argparse.Namespace(**args | kwargs)
+
+
+def _mod_list(tmp_path, enabled: list[str], disabled: tp.Sequence[str] = ()) -> str:
+    path = tmp_path / 'mod-list.json'
+    entries = [{'name': name, 'enabled': True} for name in enabled]
+    entries += [{'name': name, 'enabled': False} for name in disabled]
+    path.write_text(json.dumps({'mods': entries}))
+    return str(path)
+
+
+def test_mod_name():
+    assert mod_name('Krastorio2_1.3.24.zip') == 'Krastorio2'
+    assert mod_name('even-distribution_2.0.2.zip') == 'even-distribution'
+
+
+def test_manifest_rehashes_only_changed_files(tmp_path, monkeypatch):
+    (tmp_path / 'a_1.0.0.zip').write_bytes(b'a')
+    (tmp_path / 'b_1.0.0.zip').write_bytes(b'b')
+    first = manifest(tmp_path)
+    hashed = []
+    monkeypatch.setattr(mods, 'file_hash', lambda path: hashed.append(path.name) or _sha256(path.read_bytes()))
+
+    (tmp_path / 'b_1.0.0.zip').write_bytes(b'b, changed')
+    (tmp_path / 'a_1.0.0.zip').unlink()
+    (tmp_path / 'c_1.0.0.zip').write_bytes(b'c')
+    second = manifest(tmp_path)
+
+    assert first == {'a_1.0.0.zip': _sha256(b'a'), 'b_1.0.0.zip': _sha256(b'b')}
+    assert second == {'b_1.0.0.zip': _sha256(b'b, changed'), 'c_1.0.0.zip': _sha256(b'c')}
+    assert sorted(hashed) == ['b_1.0.0.zip', 'c_1.0.0.zip']
+    assert set(json.loads((tmp_path / MANIFEST_NAME).read_text())) == set(second)
+
+
+def test_diff_added_removed_and_changed():
+    desired = {'same_1.0.0.zip': 'h1', 'changed_1.0.0.zip': 'h2', 'added_1.0.0.zip': 'h3'}
+    current = {'same_1.0.0.zip': 'h1', 'changed_1.0.0.zip': 'old', 'removed_1.0.0.zip': 'h4'}
+
+    upload, delete = diff(desired, current)
+
+    assert upload == ['added_1.0.0.zip', 'changed_1.0.0.zip']
+    assert delete == ['removed_1.0.0.zip']
+
+
+def test_stage_local_mods(tmp_path):
+    (tmp_path / 'input').mkdir()
+    (tmp_path / 'input' / 'Krastorio2_1.3.24.zip').write_bytes(b'k2')
+
+    desired = stage(_stage_args(tmp_path, input=tmp_path / 'input'))
+
+    assert desired == {'Krastorio2_1.3.24.zip': _sha256(b'k2')}
+    assert (tmp_path / 'cache' / 'sha256' / f'{_sha256(b"k2")}.zip').read_bytes() == b'k2'
+
+
+def test_stage_ignores_builtin_mods(tmp_path, monkeypatch):
+    monkeypatch.setattr(mods, '_download', lambda *args: pytest.fail('Nothing to download'))
+    (tmp_path / 'input').mkdir()
+    (tmp_path / 'input' / 'Krastorio2_1.3.24.zip').write_bytes(b'k2')
+    mod_list = _mod_list(tmp_path, [*FACTORIO_BUILTIN_MODS, 'Krastorio2'], disabled=['flib'])
+
+    desired = stage(_stage_args(tmp_path, input=tmp_path / 'input', mod_list=mod_list))
+
+    assert list(desired) == ['Krastorio2_1.3.24.zip']
+
+
+def test_stage_downloads_missing_mods(tmp_path, monkeypatch):
+    downloaded = []
+
+    def download(cache, name, args, auth):
+        downloaded.append((name, auth))
+        return f'{name}_1.0.0.zip', _sha256(name.encode())
+
+    monkeypatch.setattr(mods, '_download', download)
+    (tmp_path / 'token').write_text('secret\n')
+    mod_list = _mod_list(tmp_path, ['base', 'space-age', 'flib'])
+    args = _stage_args(tmp_path, mod_list=mod_list, username='player', token_file=tmp_path / 'token')
+
+    desired = stage(args)
+
+    assert downloaded == [('flib', 'username=player&token=secret')]
+    assert desired == {'flib_1.0.0.zip': _sha256(b'flib')}
+
+
+def test_stage_needs_credentials_for_missing_mods(tmp_path):
+    mod_list = _mod_list(tmp_path, ['base', 'quality', 'flib', 'Krastorio2'])
+
+    with pytest.raises(RuntimeError, match='credentials are required to download: flib, Krastorio2$'):
+        stage(_stage_args(tmp_path, mod_list=mod_list))
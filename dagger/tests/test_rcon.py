@@ -0,0 +1,148 @@
+import asyncio
+import json
+import socket
+import subprocess
+import sys
+import time
+import typing as tp
+from pathlib import Path
+
+import pytest
+
+from main.rcon import (
+    TYPE_AUTH,
+    TYPE_AUTH_RESPONSE,
+    TYPE_COMMAND,
+    TYPE_RESPONSE,
+    RconClient,
+    RconError,
+    encode_packet,
+    read_packet,
+)
+
+MAIN_DIR = Path(__file__).parents[1] / 'src' / 'main'
+PASSWORD = 'secret'
+
+
+class FakeRcon:
+    """Factorio-like RCON server: answers `echo <text>`, splits `long <n>` answers into two packets"""
+
+    def __init__(self, drop_after: int = 0):
+        self.drop_after = drop_after  # Close the connection after this many commands (0: never)
+        self.commands: list[str] = []
+        self.connections = 0
+        self.port = 0
+        self._server: tp.Optional[asyncio.Server] = None
+
+    async def __aenter__(self) -> 'FakeRcon':
+        self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        assert self._server is not None
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                request_id, packet_type, body = await read_packet(reader)
+                if packet_type == TYPE_AUTH:
+                    ok = body == PASSWORD
+                    writer.write(encode_packet(request_id, TYPE_RESPONSE, ''))
+                    writer.write(encode_packet(request_id if ok else -1, TYPE_AUTH_RESPONSE, ''))
+                elif packet_type == TYPE_COMMAND:
+                    self.commands.append(body)
+                    if self.drop_after and len(self.commands) % self.drop_after == 0:
+                        break
+                    name, _, arg = body.partition(' ')
+                    if name == 'long':
+                        text = 'x' * int(arg)
+                        writer.write(encode_packet(request_id, TYPE_RESPONSE, text[: len(text) // 2]))
+                        writer.write(encode_packet(request_id, TYPE_RESPONSE, text[len(text) // 2 :]))
+                    else:
+                        writer.write(encode_packet(request_id, TYPE_RESPONSE, arg))
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+
+def test_batch_returns_responses_in_order():
+    async def scenario():
+        async with FakeRcon() as server, RconClient('127.0.0.1', server.port, PASSWORD) as client:
+            responses = await client.batch(['echo a', 'echo b', 'echo c'])
+            single = await client.execute('echo d')
+        return server, responses, single
+
+    server, responses, single = asyncio.run(scenario())
+
+    assert responses == ['a', 'b', 'c'] and single == 'd'
+    assert server.connections == 1
+
+
+def test_wrong_password():
+    async def scenario():
+        async with FakeRcon() as server, RconClient('127.0.0.1', server.port, 'wrong') as client:
+            await client.execute('echo a')
+
+    with pytest.raises(RconError, match='Authentication failed'):
+        asyncio.run(scenario())
+
+
+def test_split_response_is_joined():
+    async def scenario():
+        async with FakeRcon() as server, RconClient('127.0.0.1', server.port, PASSWORD) as client:
+            return await client.batch(['long 10000', 'echo b'])
+
+    assert asyncio.run(scenario()) == ['x' * 10000, 'b']
+
+
+def test_dropped_connection_is_reopened():
+    async def scenario():
+        async with FakeRcon(drop_after=2) as server, RconClient('127.0.0.1', server.port, PASSWORD) as client:
+            first = await client.execute('echo a')
+            second = await client.execute('echo b')  # Dropped: retried on a new connection
+        return server, first, second
+
+    server, first, second = asyncio.run(scenario())
+
+    assert (first, second) == ('a', 'b')
+    assert server.commands == ['echo a', 'echo b', 'echo b'] and server.connections == 2
+
+
+def test_fresh_connection_is_not_retried():
+    async def scenario():
+        async with FakeRcon(drop_after=1) as server, RconClient('127.0.0.1', server.port, PASSWORD) as client:
+            with pytest.raises(RconError, match='connection'):
+                await client.execute('/quit')
+        return server
+
+    assert asyncio.run(scenario()).commands == ['/quit']
+
+
+def test_cli_against_simulated_host(tmp_path):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    password_file = tmp_path / 'rconpw'
+    password_file.write_text(PASSWORD)
+    env = {'RCON_PASSWORD_FILE': str(password_file), 'RCON_PORT': str(port)}
+    server = subprocess.Popen([sys.executable, MAIN_DIR / 'fakes' / 'host' / 'rcon'], env=env)
+    try:
+        for _ in range(100):
+            with socket.socket() as s:
+                if s.connect_ex(('127.0.0.1', port)) == 0:
+                    break
+            time.sleep(0.05)
+        command = [sys.executable, MAIN_DIR / 'rcon.py', '--port', str(port), '--password-file', password_file]
+        result = subprocess.run([*command, '/version', '/server-save'], capture_output=True, text=True, check=True)
+    finally:
+        server.terminate()
+        server.wait()
+
+    assert json.loads(result.stdout)[0] == '2.0.13'
+    assert 'Saving finished' in json.loads(result.stdout)[1]
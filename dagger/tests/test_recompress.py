@@ -0,0 +1,65 @@
+import asyncio
+import os
+import typing as tp
+import zipfile
+
+import pytest
+
+from main.recompress import RecompressError, recompress_save
+
+MEMBERS = {
+    'save/level-init.dat': b'header' * 1000,
+    'save/level.dat0': os.urandom(100_000) + b'\x00' * 500_000,
+    'save/random.dat': os.urandom(200_000),
+    'save/ünicode.txt': b'text',
+    'save/empty': b'',
+}
+
+
+def _archive(path, compression: int, level: tp.Optional[int] = None):
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name, data in MEMBERS.items():
+            info = zipfile.ZipInfo(name, date_time=(2024, 10, 21, 12, 30, 10))
+            info.compress_type = compression
+            archive.writestr(info, data, compresslevel=level)
+    return path
+
+
+def _contents(path) -> dict[str, bytes]:
+    with zipfile.ZipFile(path) as archive:
+        assert archive.testzip() is None
+        return {info.filename: archive.read(info) for info in archive.infolist()}
+
+
+def test_round_trip(tmp_path):
+    src = _archive(tmp_path / 'src.zip', zipfile.ZIP_STORED)
+
+    report = asyncio.run(recompress_save(src, tmp_path / 'dst.zip', workers=2))
+
+    assert _contents(tmp_path / 'dst.zip') == MEMBERS
+    with zipfile.ZipFile(tmp_path / 'dst.zip') as archive:
+        assert archive.getinfo('save/level.dat0').date_time == (2024, 10, 21, 12, 30, 10)
+    assert report.members == len(MEMBERS)
+    assert report.size == (tmp_path / 'dst.zip').stat().st_size < report.original_size
+    assert report.saved_bytes > 500_000
+
+
+def test_never_larger(tmp_path):
+    src = _archive(tmp_path / 'src.zip', zipfile.ZIP_DEFLATED, level=9)
+
+    report = asyncio.run(recompress_save(src, tmp_path / 'dst.zip', level='fast', workers=1))
+
+    assert _contents(tmp_path / 'dst.zip') == MEMBERS
+    assert report.recompressed_members == 0
+    assert report.size <= report.original_size
+
+
+def test_encrypted_archive(tmp_path):
+    src = _archive(tmp_path / 'src.zip', zipfile.ZIP_STORED)
+    data = bytearray(src.read_bytes())
+    central = data.index(b'PK\x01\x02')
+    data[central + 8] |= 0x1  # Encryption flag of the first member
+    src.write_bytes(data)
+
+    with pytest.raises(RecompressError, match='encrypted'):
+        asyncio.run(recompress_save(src, tmp_path / 'dst.zip'))
@@ -0,0 +1,82 @@
+"""Against a local MinIO, skipped without one:
+
+docker run -d -p 9000:9000 minio/minio server /data
+S3_TEST_ENDPOINT=http://localhost:9000 python -m pytest tests/test_s3.py
+"""
+
+import asyncio
+import dataclasses
+import os
+import uuid
+
+import pytest
+
+from main.backup import backup_files, load_index, restore_file
+from main.s3 import S3Bucket, S3Error
+
+ENDPOINT = os.environ.get('S3_TEST_ENDPOINT', '')
+
+pytestmark = pytest.mark.skipif(not ENDPOINT, reason='S3_TEST_ENDPOINT is not set')
+
+
+@pytest.fixture
+def bucket() -> S3Bucket:
+    bucket = S3Bucket(
+        endpoint=ENDPOINT,
+        bucket=f'test-{uuid.uuid4().hex[:12]}',
+        access_key=os.environ.get('S3_TEST_ACCESS_KEY', 'minioadmin'),
+        secret_key=os.environ.get('S3_TEST_SECRET_KEY', 'minioadmin'),
+        region=os.environ.get('S3_TEST_REGION', 'us-east-1'),
+    )
+    with bucket._request('PUT'):  # Create the bucket
+        pass
+    return bucket
+
+
+def test_put_get(bucket):
+    bucket.put('dir/key with spaces', b'data')
+
+    assert bucket.get('dir/key with spaces') == b'data'
+    assert bucket.exists('dir/key with spaces')
+    assert not bucket.exists('dir/missing')
+
+
+def test_missing_key(bucket):
+    with pytest.raises(S3Error) as e:
+        bucket.get('missing')
+
+    assert e.value.status == 404
+
+
+def test_delete(bucket):
+    bucket.put('key', b'data')
+
+    bucket.delete('key')
+    bucket.delete('key')
+
+    assert not bucket.exists('key')
+
+
+def test_list_keys(bucket):
+    for key in ('chunks/a', 'chunks/b', 'manifests/a.json'):
+        bucket.put(key, b'')
+
+    assert sorted(bucket.list_keys('chunks/')) == ['chunks/a', 'chunks/b']
+
+
+def test_wrong_secret(bucket):
+    with pytest.raises(S3Error) as e:
+        dataclasses.replace(bucket, secret_key='wrong').put('key', b'data')
+
+    assert e.value.status == 403
+
+
+def test_backup_and_restore(bucket, tmp_path):
+    data = os.urandom(3 * 1024 * 1024)
+    (tmp_path / 'save.zip').write_bytes(data)
+
+    asyncio.run(backup_files(bucket, [tmp_path / 'save.zip'], keep=1))
+    entry = asyncio.run(load_index(bucket)).find()
+    asyncio.run(restore_file(bucket, entry, tmp_path / 'restored.zip'))
+
+    assert (tmp_path / 'restored.zip').read_bytes() == data
@@ -0,0 +1,102 @@
+import struct
+import zipfile
+import zlib
+
+import pytest
+
+from main.saves import (
+    ModInfo,
+    SaveFormatError,
+    check_compatible,
+    image_tag_version,
+    inspect_save,
+    write_minimal_save,
+)
+
+
+def _header(version: tuple[int, int, int], mods: list[tuple[str, tuple[int, int, int]]]) -> bytes:
+    """Level header of a 2.0 save (see the layout in main.saves)"""
+    header = struct.pack('<4HB', *version, 0, 0)
+    header += b'\x00\x00\x04base' + b'\x00' * 3 + b'\x00' + b'\x00' * 4 + b'\x00' * 3 + b'\x00' * 3
+    header += bytes([len(mods)])
+    for name, mod_version in mods:
+        header += bytes([len(name)]) + name.encode() + bytes(mod_version) + struct.pack('<I', 42)
+    return header
+
+
+def _save(path, files: dict[str, bytes]):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return path
+
+
+def test_minimal_save(tmp_path):
+    write_minimal_save(tmp_path / 'minimal.zip', (2, 0, 13), note='seed')
+
+    info = inspect_save(tmp_path / 'minimal.zip')
+
+    assert info.version == '2.0.13' and info.version_tuple == (2, 0, 13)
+    assert info.mods == [ModInfo(name='base', version='2.0.13', crc=0)]
+    assert info.entries == 2
+
+
+def test_mods_and_sizes(tmp_path):
+    header = _header((2, 0, 28), [('base', (2, 0, 28)), ('space-age', (2, 0, 28)), ('Krastorio2', (1, 3, 24))])
+    level = zlib.compress(header + b'\x00' * 10000)
+    path = _save(tmp_path / 'k2.zip', {'k2/level-init.dat': level, 'k2/level.dat0': level, 'k2/script.lua': b'-- lua'})
+
+    info = inspect_save(path)
+
+    assert info.version == '2.0.28'
+    assert [(m.name, m.version) for m in info.mods or []] == [
+        ('base', '2.0.28'),
+        ('space-age', '2.0.28'),
+        ('Krastorio2', '1.3.24'),
+    ]
+    assert info.level_size == 2 * len(level)
+    assert info.uncompressed_size == 2 * len(level) + len(b'-- lua')
+
+
+def test_uncompressed_header(tmp_path):
+    path = _save(tmp_path / 'old.zip', {'old/level.dat': _header((1, 1, 110), [('base', (1, 1, 110))])})
+
+    assert inspect_save(path).version == '1.1.110'
+
+
+def test_unknown_layout_keeps_version(tmp_path):
+    path = _save(tmp_path / 'odd.zip', {'odd/level-init.dat': zlib.compress(struct.pack('<4H', 3, 0, 1, 0) + b'\xff')})
+
+    info = inspect_save(path)
+
+    assert info.version == '3.0.1' and info.mods is None
+
+
+@pytest.mark.parametrize(
+    'files, error',
+    [
+        ({'a/level-init.dat': b'', 'b/level-init.dat': b''}, 'one top-level directory'),
+        ({'save/script.lua': b''}, 'no level data'),
+        ({'save/level-init.dat': b'\x78\x9c broken zlib'}, 'broken'),
+    ],
+)
+def test_broken_saves(tmp_path, files, error):
+    with pytest.raises(SaveFormatError, match=error):
+        inspect_save(_save(tmp_path / 'save.zip', files))
+
+
+def test_not_a_zip(tmp_path):
+    (tmp_path / 'save.zip').write_text('not a save')
+
+    with pytest.raises(SaveFormatError, match='not a zip'):
+        inspect_save(tmp_path / 'save.zip')
+
+
+def test_compatibility(tmp_path):
+    write_minimal_save(tmp_path / 'save.zip', (2, 0, 13))
+    info = inspect_save(tmp_path / 'save.zip')
+
+    check_compatible(info, (2, 0, 13))
+    check_compatible(info, image_tag_version('latest'))
+    with pytest.raises(SaveFormatError, match='server runs 2.0.12'):
+        check_compatible(info, image_tag_version('stable-2.0.12'))
@@ -0,0 +1,168 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from main import storage
+from main.storage import FLUSHING_SUFFIX, Flusher, flush_file
+
+MAIN_DIR = Path(__file__).parents[1] / 'src' / 'main'
+
+
+@pytest.fixture
+def dirs(tmp_path) -> tuple[Path, Path]:
+    src, dst = tmp_path / 'tmpfs', tmp_path / 'disk'
+    src.mkdir()
+    dst.mkdir()
+    return src, dst
+
+
+def _save(directory: Path, name: str, data: bytes, mtime: int = 1_700_000_000):
+    (directory / name).write_bytes(data)
+    os.utime(directory / name, (mtime, mtime))
+
+
+def test_flush_file(dirs):
+    src, dst = dirs
+    _save(src, 'save.zip', b'new')
+    _save(dst, 'save.zip', b'old')
+
+    assert flush_file(src, dst, 'save.zip') == (3, 1_700_000_000 * 10**9)
+    assert (dst / 'save.zip').read_bytes() == b'new'
+    assert (dst / 'save.zip').stat().st_mtime == 1_700_000_000
+    assert os.listdir(dst) == ['save.zip']
+
+
+def test_interrupted_copy_keeps_old_save(dirs, monkeypatch):
+    src, dst = dirs
+    _save(src, 'save.zip', b'new' * 1000)
+    _save(dst, 'save.zip', b'old')
+
+    def fail(f, out, length):
+        out.write(f.read(100))
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(storage.shutil, 'copyfileobj', fail)
+    with pytest.raises(OSError):
+        flush_file(src, dst, 'save.zip')
+
+    assert (dst / 'save.zip').read_bytes() == b'old'
+    monkeypatch.undo()
+    Flusher(src, dst)  # Removes what the interrupted copy left
+    assert not list(dst.glob(f'*{FLUSHING_SUFFIX}'))
+
+
+def test_saves_are_flushed_once_settled(dirs):
+    src, dst = dirs
+    flusher = Flusher(src, dst)
+    _save(src, 'save.zip', b'save')
+    _save(src, 'save.tmp.zip', b'being written')
+
+    flusher.step()
+    first = sorted(os.listdir(dst))
+    flusher.step()
+
+    assert first == []
+    assert sorted(os.listdir(dst)) == ['save.zip']
+
+
+def test_changed_save_waits_for_next_pass(dirs):
+    src, dst = dirs
+    flusher = Flusher(src, dst)
+    _save(src, 'save.zip', b'v1')
+    flusher.step()
+    flusher.step()
+    _save(src, 'save.zip', b'v2', mtime=1_700_000_100)
+
+    flusher.step()
+    pending = (dst / 'save.zip').read_bytes()
+    flusher.step(final=True)
+
+    assert pending == b'v1'
+    assert (dst / 'save.zip').read_bytes() == b'v2'
+
+
+def test_final_step_flushes_right_away(dirs):
+    src, dst = dirs
+    flusher = Flusher(src, dst)
+    _save(src, 'save.zip', b'save')
+
+    flusher.step(final=True)
+
+    assert (dst / 'save.zip').read_bytes() == b'save'
+
+
+def test_deleted_save_is_deleted_after_two_passes(dirs):
+    src, dst = dirs
+    _save(src, 'old.zip', b'old')
+    _save(src, 'keep.zip', b'keep')
+    flusher = Flusher(src, dst)
+    flusher.step(final=True)
+
+    (src / 'old.zip').unlink()
+    flusher.step()
+    after_one = sorted(os.listdir(dst))
+    flusher.step()
+
+    assert after_one == ['keep.zip', 'old.zip']
+    assert sorted(os.listdir(dst)) == ['keep.zip']
+
+
+def test_replaced_save_is_not_deleted(dirs):
+    src, dst = dirs
+    _save(src, 'save.zip', b'v1')
+    _save(src, 'other.zip', b'other')
+    flusher = Flusher(src, dst)
+    flusher.step(final=True)
+
+    (src / 'save.zip').unlink()  # `rm` and `cp` of an upload
+    flusher.step()
+    _save(src, 'save.zip', b'v2', mtime=1_700_000_100)
+    flusher.step()
+    flusher.step()
+
+    assert (dst / 'save.zip').read_bytes() == b'v2'
+
+
+def test_empty_src_never_empties_disk(dirs):
+    src, dst = dirs
+    _save(src, 'save.zip', b'save')
+    flusher = Flusher(src, dst)
+    flusher.step(final=True)
+
+    (src / 'save.zip').unlink()  # e.g. tmpfs lost its contents
+    for _ in range(3):
+        flusher.step()
+    flusher.step(final=True)
+
+    assert os.listdir(dst) == ['save.zip']
+
+
+def test_same_directory(dirs):
+    src, _ = dirs
+
+    with pytest.raises(RuntimeError, match='same directory'):
+        Flusher(src, src)
+
+
+def test_sigterm_flushes_everything(dirs, tmp_path):
+    src, dst = dirs
+    state = tmp_path / 'state'
+    command = [sys.executable, MAIN_DIR / 'storage.py', 'flush', '--src', src, '--dst', dst, '--state-dir', state]
+    process = subprocess.Popen([*command, '--interval', '60'], stdout=subprocess.PIPE, text=True)
+    try:
+        for _ in range(100):
+            if (state / 'flusher.pid').exists():
+                break
+            time.sleep(0.05)
+        _save(src, 'save.zip', b'save')  # Not settled yet: only the final pass flushes it
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=10) == 0
+    finally:
+        process.kill()
+
+    assert (dst / 'save.zip').read_bytes() == b'save'
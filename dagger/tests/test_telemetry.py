@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import math
+from pathlib import Path
+
+import pytest
+
+from main.telemetry import COLUMNS, Sampler, read_columns, report, summarize, write_columns
+
+MAIN_DIR = Path(__file__).parents[1] / 'src' / 'main'
+
+
+class Game:
+    """RCON client stand-in: `game.tick` advances by `ups` per second of the given clock"""
+
+    def __init__(self, ups: float, players: int = 1):
+        self.ups = ups
+        self.players = players
+        self.now = 0.0
+
+    async def batch(self, commands: list[str]) -> list[str]:
+        return [str(int(self.now * self.ups)), f'Online players ({self.players}):']
+
+
+@pytest.fixture
+def sampler(tmp_path, monkeypatch) -> Sampler:
+    monkeypatch.syspath_prepend(str(MAIN_DIR))  # `rcon` is imported as on the host
+    args = argparse.Namespace(data_dir=tmp_path, interval=10, ups_window=60, lua_ticks=True, port=0, password_file='')
+    return Sampler(args)
+
+
+def _samples(sampler: Sampler, game: Game, count: int) -> list[dict]:
+    sampler.client = game
+    rows = []
+    for step in range(count):
+        game.now = 1000.0 + step * 10
+        rows.append(asyncio.run(sampler._game(game.now)))
+    return rows
+
+
+def test_ups_and_tick_time(sampler):
+    rows = _samples(sampler, Game(ups=30), 3)
+
+    assert 'ups' not in rows[0]
+    assert rows[2]['ups'] == pytest.approx(30) and rows[2]['tick_ms'] == pytest.approx(1000 / 30)
+    assert rows[2]['players'] == 1
+
+
+def test_paused_server_has_no_tick_time(sampler):
+    rows = _samples(sampler, Game(ups=60, players=0), 3)
+
+    assert all('ups' not in row and 'tick_ms' not in row for row in rows)
+    assert rows[2]['players'] == 0
+
+
+def test_columns_round_trip(tmp_path):
+    rows = [dict.fromkeys(COLUMNS, float(i)) | {'ts': 1000.0 + i, 'tick_ms': math.nan} for i in range(5)]
+
+    write_columns(tmp_path / 'hour.ftm', rows)
+    columns = read_columns(tmp_path / 'hour.ftm')
+
+    assert columns['ts'] == [1000.0 + i for i in range(5)]
+    assert columns['players'] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert summarize(columns['tick_ms']) is None
+
+
+def test_report_window(tmp_path, monkeypatch):
+    monkeypatch.setattr('time.time', lambda: 7200.0 + 600)
+    (tmp_path / 'metrics').mkdir()
+    rows = [dict.fromkeys(COLUMNS, 60.0) | {'ts': 7200.0 + ts, 'ups': 60.0 - ts / 60} for ts in range(0, 600, 10)]
+    write_columns(tmp_path / 'metrics' / '7200.ftm', rows)
+
+    result = report(tmp_path, window_minutes=5, lag_ups=57)
+
+    assert result['samples'] == 30 and result['first_sample'] == 7500.0
+    assert result['metrics']['ups']['max'] == 55.0
+    assert result['lag']['fraction'] == 1.0
@@ -0,0 +1,67 @@
+import hashlib
+import shlex
+from pathlib import Path
+
+from main.config import FACTORIO_SAVE_STORE_DIR, FACTORIO_SAVE_STORE_KEEP, FACTORIO_SAVES_DIR, FACTORIO_UPLOAD_DIR
+from main.remote import install_save_sh, on_host, upload_save_sh
+
+
+def _save(path: Path, content: bytes) -> str:
+    path.write_bytes(content)
+    return hashlib.sha256(content).hexdigest()
+
+
+def test_upload_stores_save_by_sha256(host, tmp_path):
+    sha256 = _save(tmp_path / 'save.zip', b'save' * 1000)
+
+    host.run(upload_save_sh(str(tmp_path / 'save.zip')))
+
+    assert host.path(f'{FACTORIO_SAVE_STORE_DIR}/{sha256}.zip').read_bytes() == b'save' * 1000
+    assert not list(host.path(FACTORIO_UPLOAD_DIR).iterdir())
+
+
+def test_upload_skips_transfer_of_known_save(host, tmp_path):
+    _save(tmp_path / 'save.zip', b'save')
+    host.run(upload_save_sh(str(tmp_path / 'save.zip')))
+    transfers = [c for c in host.commands() if c.startswith('scp')]
+
+    result = host.run(upload_save_sh(str(tmp_path / 'save.zip')))
+
+    assert 'skipping transfer' in result.stdout
+    assert [c for c in host.commands() if c.startswith('scp')] == transfers
+
+
+def test_corrupted_transfer_is_not_stored(host, tmp_path):
+    sha256 = _save(tmp_path / 'save.zip', b'save')
+    host.install('scp', 'echo broken > "${2#*:}"')
+
+    result = host.run(upload_save_sh(str(tmp_path / 'save.zip')), check=False)
+
+    assert result.returncode != 0
+    assert not host.path(f'{FACTORIO_SAVE_STORE_DIR}/{sha256}.zip').exists()
+
+
+def test_install_replaces_saves_and_prunes_store(host, tmp_path):
+    saves = host.path(FACTORIO_SAVES_DIR)
+    saves.mkdir()
+    (saves / 'old.zip').write_bytes(b'old')
+    for i in range(FACTORIO_SAVE_STORE_KEEP + 2):
+        sha256 = _save(tmp_path / 'save.zip', f'save {i}'.encode())
+        host.run(upload_save_sh(str(tmp_path / 'save.zip')))
+
+    result = host.run(on_host(install_save_sh(), sha256, 'new.zip'))
+
+    assert [p.name for p in saves.iterdir()] == ['new.zip']
+    assert (saves / 'new.zip').read_bytes() == f'save {FACTORIO_SAVE_STORE_KEEP + 1}'.encode()
+    assert len(list(host.path(FACTORIO_SAVE_STORE_DIR).iterdir())) == FACTORIO_SAVE_STORE_KEEP
+    assert 'container not found' in result.stderr
+
+
+def test_install_keeps_name_with_spaces(host, tmp_path):
+    sha256 = _save(tmp_path / 'save.zip', b'save')
+    host.run(upload_save_sh(str(tmp_path / 'save.zip')))
+
+    # As upload_save passes it: a quoted word of the calling script
+    host.run(on_host(install_save_sh(), sha256, shlex.quote("My base's save.zip")))
+
+    assert [p.name for p in host.path(FACTORIO_SAVES_DIR).iterdir()] == ["My base's save.zip"]
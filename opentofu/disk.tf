@@ -1,9 +1,25 @@
 # TODO: add remove lock
 resource "yandex_compute_disk" "factorio_data" {
-  name          = "factorio-data"
+  for_each      = local.servers
+  # The first server keeps the name it had before the fleet
+  name          = each.key == var.host_instance_name ? "factorio-data" : "${each.key}-data"
   description   = "Persistent disk with Factorio data: saves, configs, etc"
   type          = "network-ssd"
   size          = 10
+  zone          = each.value.zone
+
+  # Holds the saves. Removing a server from the fleet (or a state address that doesn't match the config, see
+  # `moved` below) fails the plan instead of deleting them: `tofu state rm` the disk to let it go
+  lifecycle {
+    prevent_destroy = true
+  }
+}
+
+# Addresses of `moved` can't use variables: only the default host_instance_name is moved automatically, others need
+# `tofu state mv 'yandex_compute_disk.factorio_data' 'yandex_compute_disk.factorio_data["NAME"]'` (same for the VM)
+moved {
+  from = yandex_compute_disk.factorio_data
+  to   = yandex_compute_disk.factorio_data["factorio-server"]
 }
 
 # TODO: we need initialize disk and mount somehow 
@@ -8,6 +8,24 @@ resource "yandex_vpc_subnet" "default" {
   network_id     = "${yandex_vpc_network.default.id}"
 }
 
+# Subnet number of each zone in 10.130.0.0/16, fixed: adding a zone must not renumber (and recreate) the subnets of
+# others. A new zone takes the next free number, and goes to YC_ZONES of dagger/src/main/config.py too
+locals {
+  zone_netnums = {
+    "ru-central1-b" = 0
+    "ru-central1-d" = 1
+    "ru-central1-a" = 2
+    "ru-central1-c" = 3
+  }
+}
+
+resource "yandex_vpc_subnet" "extra" {
+  for_each       = toset(local.extra_zones)
+  v4_cidr_blocks = [cidrsubnet("10.130.0.0/16", 8, local.zone_netnums[each.key])]
+  zone           = each.key
+  network_id     = yandex_vpc_network.default.id
+}
+
 resource "yandex_vpc_default_security_group" "group_default" {
   description = "Access to Factorio server."
   network_id  = yandex_vpc_network.default.id
@@ -24,4 +24,50 @@ variable "username" {
 variable "zone" {
     type = string
     nullable = false
-}
\ No newline at end of file
+}
+
+variable "cores" {
+    type = number
+    default = 2
+    nullable = false
+}
+
+variable "memory" {
+    description = "GB"
+    type = number
+    default = 8
+    nullable = false
+}
+
+variable "preemptible" {
+    type = bool
+    default = false
+    nullable = false
+}
+
+variable "servers" {
+    description = "Fleet: server name => spec, unset fields default to the variables above. Empty: one server host_instance_name"
+    type = map(object({
+        zone        = optional(string)
+        image_tag   = optional(string)
+        cores       = optional(number)
+        memory      = optional(number)
+        preemptible = optional(bool)
+    }))
+    default = {}
+    nullable = false
+}
+
+locals {
+    servers = {
+        for name, server in (length(var.servers) > 0 ? var.servers : { (var.host_instance_name) = {} }) : name => {
+            zone        = server.zone != null ? server.zone : var.zone
+            image_tag   = server.image_tag != null ? server.image_tag : var.factorio_image_tag
+            cores       = server.cores != null ? server.cores : var.cores
+            memory      = server.memory != null ? server.memory : var.memory
+            preemptible = server.preemptible != null ? server.preemptible : var.preemptible
+        }
+    }
+    # Zones of the fleet besides var.zone: each needs a subnet
+    extra_zones = sort(setsubtract(distinct([for server in local.servers : server.zone]), [var.zone]))
+}
@@ -7,13 +7,14 @@ data "yandex_compute_image" "container-optimized-image" {
 }
 
 resource "yandex_compute_instance" "server" {
+  for_each                  = local.servers
   hostname                  = "factorio"
   allow_stopping_for_update = true
   metadata = {
     "docker-container-declaration" = <<-EOT
             spec:
                 containers:
-                - image: factoriotools/factorio:${var.factorio_image_tag}
+                - image: factoriotools/factorio:${each.value.image_tag}
                   securityContext:
                     privileged: false
                   stdin: false
@@ -40,10 +41,10 @@ resource "yandex_compute_instance" "server" {
               - ${local.ssh_public_key}
         EOT
   }
-  name               = var.host_instance_name
+  name               = each.key
   platform_id        = "standard-v1"  # https://yandex.cloud/en/docs/compute/concepts/vm-platforms
   service_account_id = yandex_iam_service_account.monitor.id
-  zone               = var.zone
+  zone               = each.value.zone
 
   boot_disk {
     initialize_params {
@@ -52,7 +53,7 @@ resource "yandex_compute_instance" "server" {
   }
 
   secondary_disk {
-    disk_id = yandex_compute_disk.factorio_data.id
+    disk_id = yandex_compute_disk.factorio_data[each.key].id
     auto_delete = false
     device_name = "factorio-data"
     mode = "READ_WRITE"
@@ -60,17 +61,17 @@ resource "yandex_compute_instance" "server" {
 
   network_interface {
     nat            = true
-    subnet_id      = yandex_vpc_subnet.default.id
+    subnet_id      = each.value.zone == var.zone ? yandex_vpc_subnet.default.id : yandex_vpc_subnet.extra[each.value.zone].id
   }
 
   resources {
-    cores         = 2
+    cores         = each.value.cores
     gpus          = 0
-    memory        = 8
+    memory        = each.value.memory
   }
 
   scheduling_policy {
-    preemptible = false
+    preemptible = each.value.preemptible
   }
 
   lifecycle {
@@ -79,4 +80,11 @@ resource "yandex_compute_instance" "server" {
     ]
   }
 
-}
\ No newline at end of file
+}
+
+# Before the fleet the only server had no key: host_instance_name is "factorio-server" by default (see disk.tf for
+# other names)
+moved {
+  from = yandex_compute_instance.server
+  to   = yandex_compute_instance.server["factorio-server"]
+}